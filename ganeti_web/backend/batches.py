@@ -0,0 +1,274 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Jobs submitted in batches.
+
+A batch acts on many virtual machines from a single request, such as
+powering a selection of them or creating several from a template. The RAPI
+calls are grouped by cluster; clusters are called in parallel, and each
+cluster gets at most ``BATCH_CONCURRENCY`` calls at a time. The resulting
+Jobs are inserted with one query and tracked together through a
+``JobBatch``.
+"""
+
+from collections import defaultdict
+import cPickle
+
+from django.conf import settings
+from django.utils.translation import ugettext as _
+
+from object_log.models import LogItem
+
+from ganeti_web.backend import quotas
+from ganeti_web.backend.tasks import parallel
+from ganeti_web.backend.templates import build_instance, create_instance_args
+from ganeti_web.backend.versions import (JOBS, bump_cluster_versions,
+                                         bump_versions)
+from ganeti_web.models import (Job, JobBatch, QuotaUsage, VirtualMachine,
+                               no_refresh)
+
+log_action = LogItem.objects.log_action
+
+# op -> (RAPI method, log action)
+POWER_OPS = {
+    "startup": ("StartupInstance", "VM_START"),
+    "shutdown": ("ShutdownInstance", "VM_STOP"),
+    "reboot": ("RebootInstance", "VM_REBOOT"),
+}
+
+
+def check_startup_quota(vms):
+    """
+    Find the virtual machines which can't be started without their owner
+    going over quota. The resources of the machines started before them in
+    the batch are counted as used.
+
+    @param vms  VirtualMachines, loaded with their clusters and owners
+    @return dict mapping refused VirtualMachines to the reason
+    """
+    errors = {}
+    used = {}
+    for vm in vms:
+        if not vm.owner_id:
+            continue
+
+        key = vm.owner_id, vm.cluster_id
+        if key not in used:
+            quota = vm.cluster.get_quota(vm.owner)
+            if any(quota.values()):
+                used[key] = quota, quotas.used_resources(vm.owner,
+                                                         vm.cluster)
+            else:
+                used[key] = None
+        if used[key] is None:
+            continue
+
+        quota, resources = used[key]
+        if quota['ram'] is not None \
+                and resources['ram'] + vm.ram > quota['ram']:
+            errors[vm] = _('Owner does not have enough RAM remaining on '
+                           'this cluster to start the virtual machine.')
+        elif quota['virtual_cpus'] and \
+                resources['virtual_cpus'] + vm.virtual_cpus \
+                > quota['virtual_cpus']:
+            errors[vm] = _('Owner does not have enough Virtual CPUs '
+                           'remaining on this cluster to start the virtual '
+                           'machine.')
+        else:
+            resources['ram'] += vm.ram
+            resources['virtual_cpus'] += vm.virtual_cpus
+    return errors
+
+
+def check_provision_quota(template, owner, count):
+    """
+    Check that ``count`` virtual machines created from a template fit, all
+    together, in what remains of the owner's quota.
+
+    @return the reason they don't, or None
+    """
+    cluster = template.cluster
+    quota = cluster.get_quota(owner)
+    if not any(quota.values()):
+        return None
+
+    used = quotas.used_resources(owner, cluster)
+    disk = template.disk_space * count
+    if quota['disk'] and used['disk'] + disk > quota['disk']:
+        return _('Owner does not have enough disk space remaining on this '
+                 'cluster for %d virtual machines.') % count
+
+    # memory and CPUs are only used by running machines
+    if not template.start:
+        return None
+    if quota['ram'] is not None \
+            and used['ram'] + template.memory * count > quota['ram']:
+        return _('Owner does not have enough RAM remaining on this cluster '
+                 'for %d virtual machines.') % count
+    if quota['virtual_cpus'] and used['virtual_cpus'] \
+            + template.vcpus * count > quota['virtual_cpus']:
+        return _('Owner does not have enough Virtual CPUs remaining on this '
+                 'cluster for %d virtual machines.') % count
+    return None
+
+
+def submit(items, call, cluster_of=lambda vm: vm.cluster_id):
+    """
+    Call ``call(item)`` for each item, in parallel across clusters and with
+    at most ``BATCH_CONCURRENCY`` calls per cluster at once.
+
+    @param cluster_of  function returning the id of the cluster of an item
+    @return (dict mapping items to the result of the call,
+             dict mapping items to the exception raised)
+    """
+    by_cluster = defaultdict(list)
+    for item in items:
+        by_cluster[cluster_of(item)].append(item)
+    groups = by_cluster.values()
+
+    def submit_cluster(group):
+        return parallel(call, group, settings.BATCH_CONCURRENCY)
+
+    results = {}
+    errors = {}
+    for group, (outcomes, e) in zip(groups, parallel(submit_cluster, groups,
+                                                     len(groups))):
+        for item, (result, error) in zip(group, outcomes):
+            if error is None:
+                results[item] = result
+            else:
+                errors[item] = error
+    return results, errors
+
+
+def record_jobs(batch, user, action, job_ids):
+    """
+    Store the jobs submitted for a batch, make them the last job of their
+    virtual machines and log them.
+
+    @param job_ids  dict mapping VirtualMachines to the id of their job
+    """
+    Job.objects.bulk_create([
+        Job(job_id=job_id, obj=vm, cluster_id=vm.cluster_id,
+            cluster_hash=vm.cluster.hash, ignore_cache=True, batch=batch)
+        for vm, job_id in job_ids.items()])
+
+    with no_refresh():
+        jobs = dict((job.object_id, job) for job in batch.jobs.all())
+    for vm in job_ids:
+        job = jobs[vm.pk]
+        vm.last_job = job
+        VirtualMachine.objects.filter(pk=vm.pk) \
+            .update(last_job=job, ignore_cache=True)
+        log_action(action, user, vm, job)
+    bump_versions(VirtualMachine, [vm.pk for vm in job_ids], JOBS)
+
+
+def power_vms(user, op, vms):
+    """
+    Start up, shut down or reboot virtual machines as one batch.
+
+    Quotas are checked for startups, unless the user is a superuser, and the
+    resources of the machines started are reserved.
+
+    @param op  one of POWER_OPS
+    @param vms  VirtualMachines, loaded with their clusters and owners
+    @return (JobBatch, dict mapping the VirtualMachines for which no job was
+             submitted to the reason)
+    """
+    method, action = POWER_OPS[op]
+    vms = list(vms)
+
+    errors = {}
+    if op == "startup" and not user.is_superuser:
+        errors.update(check_startup_quota(vms))
+
+    # clients are looked up here; the threads only talk to Ganeti
+    clients = dict((vm.cluster_id, vm.cluster.rapi) for vm in vms)
+
+    def power(vm):
+        return getattr(clients[vm.cluster_id], method)(vm.hostname)
+
+    job_ids, failures = submit([vm for vm in vms if vm not in errors], power)
+    errors.update((vm, str(e)) for vm, e in failures.items())
+
+    batch = JobBatch.objects.create(user=user, op=op, total=len(vms),
+                                    failed=len(errors))
+    record_jobs(batch, user, action, job_ids)
+    if op == "startup":
+        quotas.reserve(quotas.reservation(vm, ram=vm.ram,
+                                          virtual_cpus=vm.virtual_cpus)
+                       for vm in job_ids if not vm.is_running)
+    return batch, errors
+
+
+def provision_vms(user, template, hostnames, owner):
+    """
+    Create virtual machines from a template as one batch.
+
+    Quotas are not checked here, see ``check_provision_quota()``, but the
+    resources of the new machines are reserved. The owner is made an admin
+    of each new machine.
+
+    @return (JobBatch, dict mapping the hostnames for which no job was
+             submitted to the reason)
+    """
+    cluster = template.cluster
+    rapi = cluster.rapi
+    args, kwargs = create_instance_args(template, owner)
+
+    def create(hostname):
+        return rapi.CreateInstance('create', hostname, *args, **kwargs)
+
+    job_ids, failures = submit(hostnames, create, lambda hostname: cluster.pk)
+    errors = dict((hostname, str(e)) for hostname, e in failures.items())
+
+    batch = JobBatch.objects.create(user=user, op='create',
+                                    total=len(hostnames), failed=len(errors))
+    if not job_ids:
+        return batch, errors
+
+    vms = []
+    for hostname in job_ids:
+        vm = build_instance(template, hostname, owner)
+        vm.cluster_hash = cluster.hash
+        vm.serialized_info = cPickle.dumps(None)
+        vms.append(vm)
+    VirtualMachine.objects.bulk_create(vms)
+    # bulk_create() sends no post_save signals
+    QuotaUsage.reconcile([(owner.pk, cluster.pk)])
+    bump_cluster_versions([cluster.pk])
+
+    with no_refresh():
+        vms = list(VirtualMachine.objects.filter(
+            cluster=cluster, hostname__in=job_ids.keys()))
+    created = {}
+    for vm in vms:
+        vm.cluster = cluster
+        owner.permissable.grant('admin', vm)
+        created[vm] = job_ids[vm.hostname]
+    record_jobs(batch, user, 'CREATE', created)
+
+    # the new machines only count their first disk until created; the rest
+    # of the template is reserved
+    ram, vcpus = (template.memory, template.vcpus) if template.start \
+        else (0, 0)
+    quotas.reserve(quotas.reservation(vm, ram=ram,
+                                      disk=template.disk_space - vm.disk_size,
+                                      virtual_cpus=vcpus) for vm in created)
+    return batch, errors
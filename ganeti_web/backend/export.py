@@ -0,0 +1,143 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Inventory export.
+
+The virtual machines, nodes and clusters a user can see are read in chunks
+of rows ordered by primary key, with ``values_list()``. No model is ever
+instantiated, so nothing is refreshed from Ganeti, and memory use stays the
+same however large the inventory is.
+"""
+
+import csv
+from cStringIO import StringIO
+
+from django.utils import simplejson as json
+
+from ganeti_web.backend.queries import cluster_qs_for_user, vm_qs_for_users
+from ganeti_web.models import Cluster, Node
+
+# (column, lookup) pairs of each kind of inventory
+FIELDS = {
+    "virtual_machines": (
+        ("hostname", "hostname"),
+        ("cluster", "cluster__hostname"),
+        ("owner", "owner__name"),
+        ("node", "primary_node__hostname"),
+        ("ram", "ram"),
+        ("disk", "disk_size"),
+        ("vcpus", "virtual_cpus"),
+        ("status", "status"),
+        ("os", "operating_system"),
+    ),
+    "nodes": (
+        ("hostname", "hostname"),
+        ("cluster", "cluster__hostname"),
+        ("role", "role"),
+        ("offline", "offline"),
+        ("ram_total", "ram_total"),
+        ("ram_free", "ram_free"),
+        ("disk_total", "disk_total"),
+        ("disk_free", "disk_free"),
+        ("cpus", "cpus"),
+    ),
+    "clusters": (
+        ("hostname", "hostname"),
+        ("slug", "slug"),
+        ("description", "description"),
+        ("port", "port"),
+    ),
+}
+
+
+def inventory_qs(user, kind):
+    """
+    Queryset of the objects of ``kind`` which ``user`` can see.
+
+    Nodes are only visible to admins of their cluster, as in the node views.
+    """
+    if kind == "virtual_machines":
+        return vm_qs_for_users(user)
+    elif kind == "clusters":
+        return cluster_qs_for_user(user)
+    elif kind == "nodes":
+        if user.is_superuser:
+            return Node.objects.all()
+        clusters = user.get_objects_any_perms(Cluster, ["admin"])
+        return Node.objects.filter(cluster__in=clusters)
+    raise ValueError("Unknown inventory: %s" % kind)
+
+
+def inventory_chunks(user, kind, chunk_size):
+    """
+    Read the inventory of ``kind`` which ``user`` can see.
+
+    @return (column names, generator of lists of row tuples)
+    """
+    fields = FIELDS[kind]
+    qs = inventory_qs(user, kind).order_by("pk")
+    lookups = [lookup for name, lookup in fields]
+
+    def chunks():
+        last = 0
+        while True:
+            rows = list(qs.filter(pk__gt=last)
+                        .values_list("pk", *lookups)[:chunk_size])
+            if not rows:
+                break
+            yield [row[1:] for row in rows]
+            last = rows[-1][0]
+
+    return [name for name, lookup in fields], chunks()
+
+
+def encode(value):
+    if value is None:
+        return ""
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    return str(value)
+
+
+def csv_lines(names, chunks):
+    """
+    Render chunks of rows as CSV, with a header line first.
+
+    @return generator of strings, one per chunk
+    """
+    buf = StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(names)
+    yield buf.getvalue()
+
+    for rows in chunks:
+        buf = StringIO()
+        writer = csv.writer(buf)
+        writer.writerows([encode(v) for v in row] for row in rows)
+        yield buf.getvalue()
+
+
+def json_lines(names, chunks):
+    """
+    Render chunks of rows as JSON objects, one per line.
+
+    @return generator of strings, one per chunk
+    """
+    for rows in chunks:
+        yield "".join(json.dumps(dict(zip(names, row))) + "\n"
+                      for row in rows)
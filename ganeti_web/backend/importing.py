@@ -0,0 +1,113 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Bulk import of VirtualMachines from a Ganeti cluster.
+
+Creating VirtualMachines one at a time costs a RAPI call and several queries
+per VM. The importer here fetches every instance of a cluster with a single
+bulk RAPI call, builds the VirtualMachines in memory, and inserts them in
+chunks.
+"""
+
+import cPickle
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+
+from ganeti_web.backend.versions import bump_cluster_versions
+from ganeti_web.models import QuotaUsage, VirtualMachine, diff_owner_tags
+
+
+def build_virtual_machine(cluster, info, owner=None, nodes=None, now=None):
+    """
+    Build an unsaved VirtualMachine from bulk instance info.
+
+    The VirtualMachine is fully populated, so it will not be refreshed from
+    Ganeti when it is next loaded.
+
+    @param nodes  dict mapping lowercase node hostnames to Node ids
+    @param now  time to record as the cache time
+    """
+
+    vm = VirtualMachine(cluster=cluster, hostname=info['name'].lower(),
+                        owner=owner, cluster_hash=cluster.hash)
+    data = VirtualMachine.parse_persistent_info(info, nodes=nodes or {})
+    for k, v in data.items():
+        setattr(vm, k, v)
+    vm.serialized_info = cPickle.dumps(info)
+    vm.cached = now or datetime.now()
+    remove, add = diff_owner_tags(info['tags'], vm.owner_id)
+    vm.owner_tag_dirty = bool(remove or add)
+    return vm
+
+
+def import_virtual_machines(cluster, hostnames=None, owner=None,
+                            instances=None, chunk_size=None, progress=None):
+    """
+    Create VirtualMachines for instances of ``cluster`` which are not yet in
+    the database.
+
+    VMs are inserted with ``bulk_create()``. VMs whose owner tag needs
+    updating are flagged for ``ganeti_web.backend.tags``, as if they had
+    been saved.
+
+    @param hostnames  only import these instances; default is all of them
+    @param owner  ClusterUser to set as owner of the imported VMs
+    @param instances  bulk instance info, if it has already been fetched.
+                      Otherwise it is fetched with a single RAPI call.
+    @param chunk_size  number of VMs inserted per query
+    @param progress  optional callable, called as ``progress(done, total)``
+                     after each chunk is inserted
+    @return number of VirtualMachines created
+    """
+
+    if instances is None:
+        instances = cluster.rapi.GetInstances(bulk=True)
+    if chunk_size is None:
+        chunk_size = settings.IMPORT_CHUNK_SIZE
+    if hostnames is not None:
+        hostnames = set(h.lower() for h in hostnames)
+
+    existing = set(cluster.virtual_machines
+                   .values_list('hostname', flat=True))
+    nodes = dict(cluster.nodes.values_list('hostname', 'id'))
+    now = datetime.now()
+
+    vms = []
+    for info in instances:
+        hostname = info['name'].lower()
+        if hostname in existing:
+            continue
+        if hostnames is not None and hostname not in hostnames:
+            continue
+        existing.add(hostname)
+        vms.append(build_virtual_machine(cluster, info, owner, nodes, now))
+
+    total = len(vms)
+    for start in xrange(0, total, chunk_size):
+        with transaction.commit_on_success():
+            VirtualMachine.objects.bulk_create(vms[start:start + chunk_size])
+        if progress is not None:
+            progress(min(start + chunk_size, total), total)
+    if total:
+        bump_cluster_versions([cluster.pk])
+        if owner is not None:
+            QuotaUsage.reconcile([(owner.pk, cluster.pk)])
+
+    return total
@@ -0,0 +1,48 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+RAPI statistics of the current process.
+"""
+
+import os
+
+from ganeti_web.models import RAPI_BREAKERS, RAPI_LIMITERS
+from ganeti_web.util.metrics import LATENCY_BUCKETS, rapi_metrics
+
+
+def process_stats():
+    """
+    Gather the RAPI metrics, circuit breaker states and limiter queues of
+    this process into one JSON-serializable dict.
+
+    Clusters are identified by id in ``breakers`` and ``limiters``, and by
+    hostname in ``calls`` and ``hosts``.
+    """
+
+    return {
+        "pid": os.getpid(),
+        "latency_buckets": LATENCY_BUCKETS,
+        "calls": rapi_metrics.snapshot(),
+        "hosts": rapi_metrics.totals("host"),
+        "views": rapi_metrics.totals("view"),
+        "breakers": dict((cluster_id, {"state": breaker.state,
+                                       "failures": breaker.failures})
+                         for cluster_id, breaker in RAPI_BREAKERS.items()),
+        "limiters": dict((cluster_id, limiter.stats())
+                         for cluster_id, limiter in RAPI_LIMITERS.items()),
+    }
@@ -14,12 +14,14 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
 # USA.
+from collections import defaultdict
 
+from django.contrib.contenttypes.models import ContentType
 from django.db.models import Q
 
 from object_permissions import get_users_any, get_groups_any
 
-from ganeti_web.models import Cluster, ClusterUser, VirtualMachine
+from ganeti_web.models import Cluster, ClusterUser, VirtualMachine, no_refresh
 
 
 def cluster_qs_for_user(user, groups=True, readonly=True, **kwargs):
@@ -139,6 +141,24 @@ def vm_qs_for_admins(user):
     return qs
 
 
+def vm_qs_for_power(user):
+    """
+    Retrieve a queryset of all of the virtual machines which this user may
+    start up, shut down and reboot.
+    """
+
+    if user.is_superuser:
+        qs = VirtualMachine.objects.all()
+    elif user.is_anonymous():
+        qs = VirtualMachine.objects.none()
+    else:
+        qs = user.get_objects_any_perms(VirtualMachine, groups=True,
+                                        perms=["admin", "power"])
+        qs |= cluster_vm_qs(user, ['admin'])
+
+    return qs.distinct()
+
+
 def vm_qs_for_users(user, clusters=True):
     """
     Retrieves a queryset of all the virtual machines for which the user has
@@ -177,3 +197,54 @@ def cluster_vm_qs(user, perms=[], groups=True):
     ).distinct()
 
     return vms
+
+
+def prefetch_objects(records, name='obj'):
+    """
+    Resolve a generic foreign key, such as ``Job.obj`` or
+    ``GanetiError.obj``, for a list of records with one query per content
+    type instead of one per record.
+
+    The objects are loaded without refreshing them from Ganeti, see
+    ``no_refresh()``. The clusters of the records and of the objects are
+    attached too, with at most one more query.
+
+    @return list of the records
+    """
+    records = list(records)
+    if not records:
+        return records
+
+    gfk = [f for f in records[0]._meta.virtual_fields if f.name == name][0]
+    ct_attr = records[0]._meta.get_field(gfk.ct_field).attname
+
+    wanted = defaultdict(set)
+    for record in records:
+        wanted[getattr(record, ct_attr)].add(getattr(record, gfk.fk_field))
+
+    objs = {}
+    with no_refresh():
+        for ct_id, ids in wanted.items():
+            model = ContentType.objects.get_for_id(ct_id).model_class()
+            for obj in model.objects.filter(pk__in=ids):
+                objs[ct_id, obj.pk] = obj
+
+        clusters = dict((obj.pk, obj) for obj in objs.values()
+                        if isinstance(obj, Cluster))
+        related = records + [obj for obj in objs.values()
+                             if not isinstance(obj, Cluster)]
+        missing = set(getattr(r, 'cluster_id', None) for r in related) \
+            - set(clusters) - set([None])
+        if missing:
+            for cluster in Cluster.objects.filter(pk__in=missing):
+                clusters[cluster.pk] = cluster
+
+    for record in related:
+        cluster_id = getattr(record, 'cluster_id', None)
+        if cluster_id in clusters:
+            record.cluster = clusters[cluster_id]
+    for record in records:
+        key = getattr(record, ct_attr), getattr(record, gfk.fk_field)
+        setattr(record, gfk.cache_attr, objs.get(key))
+
+    return records
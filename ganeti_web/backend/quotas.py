@@ -0,0 +1,81 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Quota usage.
+
+What an owner's virtual machines use on a cluster is kept in a
+``QuotaUsage`` row, so checking a quota reads that row instead of summing
+over all of the owner's VMs. Jobs which will use more, such as startups,
+add a ``QuotaReservation`` once submitted, which counts until the VM has no
+pending job left.
+
+Checks lock the usage row with ``SELECT ... FOR UPDATE`` until the end of
+the transaction, i.e. of the request. Two requests for the same owner and
+cluster are then checked one after the other, and the second one sees the
+reservations of the first. SQLite does not support the lock.
+"""
+
+from django.db.models import Sum
+
+from ganeti_web.models import QuotaReservation, QuotaUsage
+
+FIELDS = ('ram', 'disk', 'virtual_cpus')
+
+
+def used_resources(owner, cluster, lock=True):
+    """
+    Resources used by an owner on a cluster, including those reserved for
+    pending jobs.
+
+    @param lock  lock the usage row until the end of the transaction
+    @return dict with ram, disk and virtual_cpus, like
+            ``ClusterUser.used_resources()``
+    """
+    query = QuotaUsage.objects.filter(owner=owner, cluster=cluster)
+    if lock:
+        query = query.select_for_update()
+    rows = list(query.values_list(*FIELDS))
+    if not rows:
+        QuotaUsage.reconcile([(owner.pk, cluster.pk)], create=True)
+        rows = list(query.values_list(*FIELDS))
+    used = dict(zip(FIELDS, rows[0]))
+
+    reserved = QuotaReservation.objects.filter(owner=owner, cluster=cluster) \
+        .aggregate(*[Sum(field) for field in FIELDS])
+    for field in FIELDS:
+        used[field] += reserved['%s__sum' % field] or 0
+    return used
+
+
+def reservation(vm, ram=0, disk=0, virtual_cpus=0):
+    """
+    @return a new, unsaved, QuotaReservation for a job of ``vm``
+    """
+    return QuotaReservation(virtual_machine=vm, owner_id=vm.owner_id,
+                            cluster_id=vm.cluster_id, ram=ram, disk=disk,
+                            virtual_cpus=virtual_cpus)
+
+
+def reserve(reservations):
+    """
+    Store reservations with a single query. Those of VMs without an owner,
+    or which reserve nothing, are left out.
+    """
+    QuotaReservation.objects.bulk_create([
+        r for r in reservations
+        if r.owner_id and (r.ram > 0 or r.disk > 0 or r.virtual_cpus > 0)])
@@ -0,0 +1,139 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Retention policies for the GanetiError and Job tables.
+
+Neither table is ever pruned by normal operation: cleared errors stay around
+forever, and finished jobs keep their full serialized info, including op
+logs, long after anybody will look at them. The functions in this module
+trim both tables in bounded batches so that they can be run periodically
+without locking up the database.
+"""
+
+import cPickle
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.utils import simplejson as json
+
+from ganeti_web.models import GanetiError, Job, FINISHED_JOBS
+
+
+def prune_errors(days, batch_size, archive=None):
+    """
+    Delete cleared errors which are older than the given number of days.
+
+    Errors are removed in batches of ``batch_size`` rows, each batch in its
+    own transaction.
+
+    @param days  age, in days, after which cleared errors are removed
+    @param batch_size  maximum number of rows removed per query
+    @param archive  optional file-like object; each removed error is written
+                    to it as a line of JSON before it is deleted
+    @return number of errors removed
+    """
+
+    cutoff = datetime.now() - timedelta(days=days)
+    qs = GanetiError.objects.filter(cleared=True, timestamp__lt=cutoff) \
+        .order_by("pk")
+
+    removed = 0
+    while True:
+        errors = list(qs.values("pk", "cluster_id", "msg", "code",
+                                "timestamp", "obj_type_id", "obj_id")
+                      [:batch_size])
+        if not errors:
+            break
+
+        if archive is not None:
+            for error in errors:
+                error["timestamp"] = error["timestamp"].isoformat()
+                archive.write(json.dumps(error) + "\n")
+
+        with transaction.commit_on_success():
+            GanetiError.objects.filter(pk__in=[e["pk"] for e in errors]) \
+                .delete()
+        removed += len(errors)
+
+    return removed
+
+
+def compact_job_info(info):
+    """
+    Strip the bulky parts of a finished job's info.
+
+    Op logs are emptied, and op results are discarded for successful jobs.
+    Results of failed ops are kept since they carry the error message. The
+    shape of the info is preserved so that templates indexing into it keep
+    working.
+
+    @return True if ``info`` was changed
+    """
+
+    changed = False
+
+    oplog = info.get("oplog")
+    if oplog and any(oplog):
+        info["oplog"] = [[] for log in oplog]
+        changed = True
+
+    if info.get("status") == "success":
+        opresult = info.get("opresult")
+        if opresult and any(r is not None for r in opresult):
+            info["opresult"] = [None for result in opresult]
+            changed = True
+
+    return changed
+
+
+def compact_jobs(days, batch_size):
+    """
+    Compact the serialized info of jobs which finished more than the given
+    number of days ago.
+
+    Jobs are read ``batch_size`` rows at a time, without instantiating the
+    model, so no jobs are refreshed from Ganeti while compacting.
+
+    @param days  age, in days, after which finished jobs are compacted
+    @param batch_size  maximum number of rows read per query
+    @return number of jobs compacted
+    """
+
+    cutoff = datetime.now() - timedelta(days=days)
+    qs = Job.objects.filter(status__in=FINISHED_JOBS, finished__lt=cutoff) \
+        .exclude(serialized_info="").order_by("pk")
+
+    compacted = 0
+    last = 0
+    while True:
+        jobs = list(qs.filter(pk__gt=last)
+                    .values_list("pk", "serialized_info")[:batch_size])
+        if not jobs:
+            break
+
+        with transaction.commit_on_success():
+            for pk, serialized in jobs:
+                info = cPickle.loads(str(serialized))
+                if info and compact_job_info(info):
+                    Job.objects.filter(pk=pk) \
+                        .update(serialized_info=cPickle.dumps(info))
+                    compacted += 1
+
+        last = jobs[-1][0]
+
+    return compacted
@@ -0,0 +1,146 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Ownership changes and the owner tags which mirror them in Ganeti.
+
+The owner of a VirtualMachine is stored in the database and mirrored in
+Ganeti as a ``gwm:owner:<id>`` instance tag. Saving a VirtualMachine never
+talks to Ganeti; instead, VMs whose cached tags don't match their owner are
+flagged with ``owner_tag_dirty``. ``reconcile_owner_tags()`` works through
+the flagged VMs of a cluster and pushes only the tags which differ, either
+in the background after an ownership change or periodically from the
+``reconcile_tags`` management command.
+"""
+
+import cPickle
+import logging
+
+from django.conf import settings
+
+from ganeti_web.backend.tasks import defer
+from ganeti_web.backend.versions import bump_cluster_versions, bump_versions
+from ganeti_web.models import (Cluster, QuotaUsage, VirtualMachine,
+                               diff_owner_tags)
+from ganeti_web.util.client import GanetiApiError
+
+logger = logging.getLogger(__name__)
+
+
+def reconcile_owner_tags(cluster, batch_size=None):
+    """
+    Push owner tags to Ganeti for all flagged VirtualMachines of a cluster.
+
+    Flagged VMs are read ``batch_size`` rows at a time, without
+    instantiating the model. For each VM the cached tags are compared with
+    the tag for its owner and only the differences are sent to Ganeti. VMs
+    whose tags could not be updated are logged and stay flagged.
+
+    Clusters without credentials can't have their tags written; their VMs
+    are only unflagged, so that they aren't selected again.
+
+    @return number of VMs whose tags were changed
+    """
+
+    if not cluster.username:
+        VirtualMachine.objects.filter(cluster=cluster, owner_tag_dirty=True) \
+            .update(owner_tag_dirty=False)
+        return 0
+
+    if batch_size is None:
+        batch_size = settings.TAG_BATCH_SIZE
+
+    rapi = cluster.rapi
+    qs = VirtualMachine.objects.filter(cluster=cluster, owner_tag_dirty=True) \
+        .order_by('pk')
+
+    changed = 0
+    last = 0
+    while True:
+        vms = list(qs.filter(pk__gt=last).values_list(
+            'pk', 'hostname', 'owner_id', 'serialized_info')[:batch_size])
+        if not vms:
+            break
+
+        for pk, hostname, owner_id, serialized in vms:
+            info = cPickle.loads(str(serialized)) if serialized else None
+            remove, add = diff_owner_tags(info['tags'] if info else [],
+                                          owner_id)
+            updates = dict(owner_tag_dirty=False)
+
+            if info and (remove or add):
+                try:
+                    if remove:
+                        rapi.DeleteInstanceTags(hostname, remove)
+                    if add:
+                        rapi.AddInstanceTags(hostname, add)
+                except GanetiApiError, e:
+                    logger.warning("Could not update owner tags of %s: %s"
+                                   % (hostname, e))
+                    continue
+
+                info['tags'] = [t for t in info['tags']
+                                if t not in remove] + add
+                updates['serialized_info'] = cPickle.dumps(info)
+                changed += 1
+
+            # Only clear the flag if the owner didn't change meanwhile.
+            VirtualMachine.objects.filter(pk=pk, owner=owner_id) \
+                .update(**updates)
+
+        last = vms[-1][0]
+
+    return changed
+
+
+def schedule_reconcile(clusters):
+    """
+    Reconcile owner tags of the given clusters in the background, one task
+    per cluster.
+    """
+    for cluster in clusters:
+        if cluster.username:
+            defer(reconcile_owner_tags, cluster)
+
+
+def set_owner(queryset, owner):
+    """
+    Assign ``owner`` to all VirtualMachines in ``queryset``.
+
+    The owner is updated with a single UPDATE. Owner tags are then pushed to
+    Ganeti in the background, with one task per cluster.
+
+    @param owner  ClusterUser, or None to orphan the VMs
+    @return number of VirtualMachines updated
+    """
+
+    vms = list(queryset.values_list('pk', 'cluster_id', 'owner_id'))
+    if not vms:
+        return 0
+
+    updated = VirtualMachine.objects.filter(pk__in=[vm[0] for vm in vms]) \
+        .update(owner=owner, owner_tag_dirty=True)
+
+    cluster_ids = set(vm[1] for vm in vms)
+    owner_id = owner.pk if owner is not None else None
+    QuotaUsage.reconcile([(vm[2], vm[1]) for vm in vms] +
+                         [(owner_id, c) for c in cluster_ids])
+    bump_versions(VirtualMachine, [vm[0] for vm in vms])
+    bump_cluster_versions(cluster_ids)
+    schedule_reconcile(Cluster.objects.filter(pk__in=cluster_ids))
+
+    return updated
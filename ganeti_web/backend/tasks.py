@@ -0,0 +1,155 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Minimal support for running work outside of the request/response cycle.
+
+GWM has no task queue; deferred work runs in a daemon thread with its own
+database connection. During a request, ``DeferredTasksMiddleware`` holds
+deferred work until the request's transaction has been committed, so that
+the threads see what the request wrote. When ``TESTING`` is set, deferred
+work runs immediately in the calling thread so that tests can observe its
+effects.
+"""
+
+import logging
+from Queue import Empty, Queue
+import threading
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def _run(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception("Deferred task %s failed" % func.__name__)
+    finally:
+        # Each thread opens its own connection; don't leak it.
+        connection.close()
+
+
+def _start(func, args, kwargs):
+    thread = threading.Thread(target=_run, args=(func, args, kwargs),
+                              name="gwm-%s" % func.__name__)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def defer(func, *args, **kwargs):
+    """
+    Run ``func(*args, **kwargs)`` in the background.
+
+    Between ``hold()`` and ``release()``, the task is only queued and is
+    started by ``release()``.
+
+    Exceptions raised by ``func`` are logged and otherwise ignored.
+
+    @return the started thread, or None if ``func`` was run immediately or
+            is being held
+    """
+
+    if settings.TESTING:
+        func(*args, **kwargs)
+        return None
+
+    held = getattr(_local, 'held', None)
+    if held is not None:
+        held.append((func, args, kwargs))
+        return None
+
+    return _start(func, args, kwargs)
+
+
+def hold():
+    """
+    Hold tasks deferred by this thread until ``release()`` or ``discard()``.
+    """
+    _local.held = []
+
+
+def release():
+    """
+    Start the tasks held since ``hold()``, and stop holding.
+
+    @return list of the started threads
+    """
+    held = getattr(_local, 'held', None)
+    _local.held = None
+    return [_start(*task) for task in held or ()]
+
+
+def discard():
+    """
+    Drop the tasks held since ``hold()``, and stop holding.
+    """
+    _local.held = None
+
+
+def parallel(func, items, concurrency):
+    """
+    Call ``func(item)`` for each item, in up to ``concurrency`` threads at
+    once, and wait for all of them.
+
+    Threads get their own database connections, outside of the caller's
+    transaction, so ``func`` should stick to RAPI calls and leave the
+    database to the caller.
+
+    @return list of (result, exception) pairs in the order of ``items``;
+            one of each pair is None
+    """
+    items = list(items)
+    results = [None] * len(items)
+
+    def call(i):
+        try:
+            results[i] = func(items[i]), None
+        except Exception, e:
+            results[i] = None, e
+
+    concurrency = min(concurrency, len(items))
+    if concurrency <= 1:
+        for i in xrange(len(items)):
+            call(i)
+        return results
+
+    queue = Queue()
+    for i in xrange(len(items)):
+        queue.put(i)
+
+    def work():
+        while True:
+            try:
+                i = queue.get_nowait()
+            except Empty:
+                return
+            call(i)
+
+    threads = [threading.Thread(target=work, name="gwm-%s" % func.__name__)
+               for n in xrange(concurrency)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
@@ -26,7 +26,8 @@ machinery.
 from object_log.models import LogItem
 
 from ganeti_web.caps import has_balloonmem
-from ganeti_web.models import Job, VirtualMachine, VirtualMachineTemplate
+from ganeti_web.models import (Job, VirtualMachine, VirtualMachineTemplate,
+                               owner_tag)
 
 log_action = LogItem.objects.log_action
 
@@ -74,9 +75,15 @@ def instance_to_template(vm, name):
     return template
 
 
-def template_to_instance(template, hostname, owner):
+def create_instance_args(template, owner=None):
     """
-    Instantiate a VM template with a given hostname and owner.
+    Build the arguments of the ``CreateInstance`` RAPI call for a template,
+    for any hostname.
+
+    Instances created for an ``owner`` get its owner tag right away, since
+    new VMs are not flagged for ``reconcile_owner_tags()``.
+
+    @return (args, kwargs), with args starting after the hostname
     """
 
     cluster = template.cluster
@@ -85,7 +92,10 @@ def template_to_instance(template, hostname, owner):
     }
 
     hvparams = {}
-    hv = template.hypervisor
+    # only templates coming from the wizard know their hypervisor; saved
+    # templates are created with the default one of their cluster
+    hv = getattr(template, "hypervisor", None) \
+        or cluster.info["default_hypervisor"]
     kvm = hv == 'kvm'
     pvm = hv == 'xen-pvm'
     hvm = hv == 'xen-hvm'
@@ -106,15 +116,11 @@ def template_to_instance(template, hostname, owner):
 
     memory = template.memory
     if has_balloonmem(cluster):
-        minram = template.minmem
-        beparams['minmem'] = minram
+        beparams['minmem'] = template.minmem
         beparams['maxmem'] = memory
     else:
         beparams['memory'] = memory
 
-    vcpus = template.vcpus
-    disk_size = template.disks[0]["size"]
-
     kwargs = {
         "os": template.os,
         "hypervisor": hv,
@@ -122,10 +128,13 @@ def template_to_instance(template, hostname, owner):
         "name_check": template.name_check,
         "beparams": beparams,
         "no_install": template.no_install,
-        "start": not template.no_start,
+        "start": template.start,
         "hvparams": hvparams,
     }
 
+    if owner is not None:
+        kwargs.update(tags=[owner_tag(owner.pk)])
+
     # Using auto allocator
     if template.iallocator:
         default_iallocator = cluster.info['default_iallocator']
@@ -142,22 +151,40 @@ def template_to_instance(template, hostname, owner):
             msg = 'Disk template set to drdb, but no secondary node set'
             raise RuntimeError(msg)
 
-    job_id = cluster.rapi.CreateInstance('create', hostname,
-                                         template.disk_template,
-                                         template.disks, template.nics,
-                                         **kwargs)
+    args = (template.disk_template, template.disks, template.nics)
+    return args, kwargs
+
+
+def build_instance(template, hostname, owner):
+    """
+    Build, without saving, the VM which a template creates.
+    """
+
+    cluster = template.cluster
     vm = VirtualMachine()
 
     vm.cluster = cluster
     vm.hostname = hostname
-    vm.ram = memory
+    vm.ram = template.memory
     if has_balloonmem(cluster):
-        vm.minram = minram
-    vm.virtual_cpus = vcpus
-    vm.disk_size = disk_size
+        vm.minram = template.minmem
+    vm.virtual_cpus = template.vcpus
+    vm.disk_size = template.disks[0]["size"]
 
     vm.owner = owner
     vm.ignore_cache = True
+    return vm
+
+
+def template_to_instance(template, hostname, owner):
+    """
+    Instantiate a VM template with a given hostname and owner.
+    """
+
+    cluster = template.cluster
+    args, kwargs = create_instance_args(template, owner)
+    job_id = cluster.rapi.CreateInstance('create', hostname, *args, **kwargs)
+    vm = build_instance(template, hostname, owner)
 
     # Do a dance to get the VM and the job referencing each other.
     vm.save()
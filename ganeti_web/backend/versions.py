@@ -0,0 +1,123 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Version counters for cached template fragments and update notifications.
+
+Every Cluster, Node and VirtualMachine has a version number, kept in the
+cache. It is bumped whenever the object is saved or its cached Ganeti info
+changes, and a cluster's version is also bumped whenever one of its nodes or
+virtual machines changes, since cluster pages show rollups of them. Template
+fragments keyed on versions are therefore never stale; old entries simply
+stop being used.
+
+Objects also have a separate version for their jobs, bumped whenever a job
+of the object is saved. Pages waiting for job updates, see
+``ganeti_web.views.jobs.wait_for_updates()``, compare versions instead of
+querying the database.
+
+This module doesn't import any models, so that ``ganeti_web.models`` can use
+it.
+"""
+
+import time
+
+from django.core.cache import cache
+
+PREFIX = "gwm:version"
+
+# Version of the jobs of an object, rather than of the object itself
+JOBS = "jobs"
+
+# Versions are kept as long as the cache allows, 30 days being the longest
+# relative timeout memcached accepts. A version which is evicted anyway
+# comes back as a new counter.
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def version_key(model, pk, kind=None):
+    table = model._meta.db_table
+    if kind is not None:
+        table = "%s:%s" % (table, kind)
+    return "%s:%s:%s" % (PREFIX, table, pk)
+
+
+def initial_version():
+    # Versions start at the current time, so that a counter evicted from the
+    # cache comes back higher than it was and old fragments aren't reused.
+    return int(time.time() * 1000)
+
+
+def get_versions(objs):
+    """
+    Versions of model instances, in the same order, with one cache lookup.
+    """
+    return _get([version_key(obj.__class__, obj.pk) for obj in objs])
+
+
+def get_version(model, pk, kind=None, default=None):
+    """
+    Version of one object, without loading it.
+
+    @param default  version to start the counter at if it is not in the
+                    cache, such as the last version a client has seen, so
+                    that an evicted counter doesn't look like a change.
+                    Defaults to ``initial_version()``.
+    """
+    return _get([version_key(model, pk, kind)], default)[0]
+
+
+def _get(keys, default=None):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, default if default is not None
+                      else initial_version(), VERSION_TIMEOUT)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(model, pks, kind=None):
+    """
+    Invalidate the fragments of the given objects, and notify pages waiting
+    for their updates.
+    """
+    for pk in pks:
+        key = version_key(model, pk, kind)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # not in the cache; start a new counter
+            cache.set(key, initial_version(), VERSION_TIMEOUT)
+
+
+def bump_cluster_versions(cluster_ids):
+    # imported here to avoid a circular import with the models
+    from ganeti_web.models import Cluster
+    bump_versions(Cluster, cluster_ids)
+
+
+def bump_object(obj):
+    """
+    Invalidate the fragments of a model instance, and of its cluster if it
+    belongs to one.
+    """
+    bump_versions(obj.__class__, [obj.pk])
+    # read the raw foreign key, not a property of the same name
+    cluster_id = obj.__dict__.get('cluster_id')
+    if cluster_id is not None:
+        bump_cluster_versions([cluster_id])
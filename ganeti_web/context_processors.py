@@ -25,6 +25,7 @@ def site(request):
     """
 
     return {
+        'JOB_UPDATES_TIMEOUT': settings.JOB_UPDATES_TIMEOUT,
         'SITE_DOMAIN': settings.SITE_DOMAIN,
         'SITE_NAME': settings.SITE_NAME,
     }
@@ -32,6 +32,7 @@ from django.utils.translation import ugettext_lazy as _
 from object_log.models import LogItem
 log_action = LogItem.objects.log_action
 
+from ganeti_web.backend import quotas
 from ganeti_web.backend.queries import cluster_qs_for_user, owner_qs
 from ganeti_web.backend.templates import template_to_instance
 from ganeti_web.caps import has_cdrom2, has_balloonmem, has_sharedfile
@@ -185,7 +186,7 @@ def check_quota_modify(form):
         start = data['start']
         quota = cluster.get_quota(owner)
         if quota.values():
-            used = owner.used_resources(cluster, only_running=True)
+            used = quotas.used_resources(owner, cluster)
 
             if (start and quota['ram'] is not None and
                (used['ram'] + data['memory']-vm.ram) > quota['ram']):
@@ -1295,7 +1296,7 @@ class VMWizardView(LoginRequiredMixin, PermissionRequiredMixin,
         template.iallocator = forms[2].cleaned_data["iallocator"]
         template.ip_check = forms[3].cleaned_data["ip_check"]
         template.name_check = forms[3].cleaned_data["name_check"]
-        template.no_start = forms[3].cleaned_data["no_start"]
+        template.start = not forms[3].cleaned_data["no_start"]
 
         if not template.iallocator:
             template.pnode = forms[3].cleaned_data["pnode"].hostname
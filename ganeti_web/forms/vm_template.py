@@ -15,10 +15,12 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
 # USA.
 
-from django.forms import Form, CharField, ModelChoiceField, ValidationError
+from django.forms import (Form, CharField, IntegerField, ModelChoiceField,
+                          Textarea, ValidationError)
 from django.utils.translation import ugettext_lazy as _
 
-from ganeti_web.models import ClusterUser
+from ganeti_web.backend.batches import check_provision_quota
+from ganeti_web.models import ClusterUser, VirtualMachine
 
 
 class VirtualMachineTemplateCopyForm(Form):
@@ -46,6 +48,69 @@ class VMInstanceFromTemplate(Form):
         return hostname
 
 
+class VMInstancesFromTemplate(Form):
+    """
+    Create several instances from a template, named from a list or from a
+    pattern such as ``web{n}.example.org``.
+    """
+    owner = ModelChoiceField(label=_('Owner'),
+                             queryset=ClusterUser.objects.all(),
+                             empty_label=None)
+    hostnames = CharField(label=_('Instance Names'), required=False,
+                          widget=Textarea, help_text=_('One per line'))
+    pattern = CharField(label=_('Name Pattern'), required=False,
+                        max_length=255,
+                        help_text=_('{n} is replaced by 1, 2, 3...'))
+    count = IntegerField(label=_('Count'), required=False, min_value=1)
+
+    def __init__(self, template, user, *args, **kwargs):
+        self.template = template
+        self.user = user
+        super(VMInstancesFromTemplate, self).__init__(*args, **kwargs)
+
+    def clean(self):
+        data = self.cleaned_data
+        hostnames = data.get('hostnames')
+        pattern = data.get('pattern')
+        count = data.get('count')
+
+        if hostnames and not pattern:
+            names = [name.strip().lower() for name in hostnames.splitlines()
+                     if name.strip()]
+        elif pattern and count and not hostnames:
+            if '{n' not in pattern:
+                raise ValidationError(_('The pattern must contain {n}.'))
+            try:
+                names = [pattern.format(n=n).lower()
+                         for n in xrange(1, count + 1)]
+            except (KeyError, IndexError, ValueError):
+                raise ValidationError(_('Invalid name pattern.'))
+        else:
+            raise ValidationError(_('Give either a list of names, or a '
+                                    'pattern and a count.'))
+
+        if any(' ' in name for name in names):
+            raise ValidationError(_('Hostnames cannot contain spaces.'))
+        if len(set(names)) != len(names):
+            raise ValidationError(_('Hostnames must be unique.'))
+
+        existing = VirtualMachine.objects \
+            .filter(cluster=self.template.cluster_id, hostname__in=names) \
+            .values_list('hostname', flat=True)
+        if existing:
+            raise ValidationError(_('Virtual machines already exist: %s')
+                                  % ', '.join(sorted(existing)))
+
+        owner = data.get('owner')
+        if owner and not self.user.is_superuser:
+            error = check_provision_quota(self.template, owner, len(names))
+            if error:
+                raise ValidationError(error)
+
+        data['names'] = names
+        return data
+
+
 class TemplateFromVMInstance(Form):
     template_name = CharField(label=_("Template Name"), max_length=255)
 
@@ -0,0 +1,72 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ganeti_web.backend.retention import prune_errors, compact_jobs
+
+
+class Command(BaseCommand):
+    """
+    Apply the retention policy to the GanetiError and Job tables.
+    """
+
+    help = ("Delete old cleared errors and strip op logs and results from "
+            "old finished jobs.")
+
+    option_list = BaseCommand.option_list + (
+        make_option("--error-days", type="int", dest="error_days",
+                    default=settings.ERROR_RETENTION_DAYS,
+                    help="Remove cleared errors older than this many days."),
+        make_option("--job-days", type="int", dest="job_days",
+                    default=settings.JOB_RETENTION_DAYS,
+                    help="Compact finished jobs older than this many days."),
+        make_option("--batch-size", type="int", dest="batch_size",
+                    default=settings.RETENTION_BATCH_SIZE,
+                    help="Number of rows to process per query."),
+        make_option("--archive", dest="archive", default=None,
+                    help="Append removed errors to this file as JSON lines."),
+        make_option("--skip-errors", action="store_true", dest="skip_errors",
+                    default=False, help="Do not remove any errors."),
+        make_option("--skip-jobs", action="store_true", dest="skip_jobs",
+                    default=False, help="Do not compact any jobs."),
+    )
+
+    def handle(self, **options):
+        batch_size = options["batch_size"]
+        verbosity = int(options.get("verbosity", 1))
+
+        if not options["skip_errors"]:
+            archive = None
+            if options["archive"]:
+                archive = open(options["archive"], "a")
+            try:
+                removed = prune_errors(options["error_days"], batch_size,
+                                       archive)
+            finally:
+                if archive is not None:
+                    archive.close()
+            if verbosity:
+                self.stdout.write("Removed %d cleared errors.\n" % removed)
+
+        if not options["skip_jobs"]:
+            compacted = compact_jobs(options["job_days"], batch_size)
+            if verbosity:
+                self.stdout.write("Compacted %d finished jobs.\n" % compacted)
@@ -0,0 +1,75 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ganeti_web.backend.importing import import_virtual_machines
+from ganeti_web.models import Cluster, ClusterUser
+
+
+class Command(BaseCommand):
+    """
+    Import VirtualMachines which are missing from the database.
+    """
+
+    args = "[cluster-slug ...]"
+    help = ("Import all instances missing from the database. Imports from "
+            "every cluster unless cluster slugs are given.")
+
+    option_list = BaseCommand.option_list + (
+        make_option("--owner", dest="owner", default=None,
+                    help="Name of the user or group owning imported VMs."),
+        make_option("--chunk-size", type="int", dest="chunk_size",
+                    default=settings.IMPORT_CHUNK_SIZE,
+                    help="Number of VMs inserted per query."),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get("verbosity", 1))
+
+        clusters = Cluster.objects.all()
+        if args:
+            clusters = clusters.filter(slug__in=args)
+            missing = set(args) - set(c.slug for c in clusters)
+            if missing:
+                raise CommandError("Unknown clusters: %s"
+                                   % ", ".join(sorted(missing)))
+
+        owner = None
+        if options["owner"]:
+            try:
+                owner = ClusterUser.objects.get(name=options["owner"])
+            except ClusterUser.DoesNotExist:
+                raise CommandError("Unknown owner: %s" % options["owner"])
+            except ClusterUser.MultipleObjectsReturned:
+                raise CommandError("Ambiguous owner: %s" % options["owner"])
+
+        for cluster in clusters:
+            def progress(done, total):
+                if verbosity > 1:
+                    self.stdout.write("%s: %d/%d\n"
+                                      % (cluster.slug, done, total))
+
+            created = import_virtual_machines(
+                cluster, owner=owner, chunk_size=options["chunk_size"],
+                progress=progress)
+            if verbosity:
+                self.stdout.write("Imported %d VMs from %s.\n"
+                                  % (created, cluster.slug))
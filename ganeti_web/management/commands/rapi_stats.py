@@ -0,0 +1,71 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+from optparse import make_option
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.utils import simplejson as json
+
+from ganeti_web.backend.metrics import process_stats
+
+
+class Command(BaseCommand):
+    """
+    Dump the RAPI statistics of this process.
+    """
+
+    args = "[command [args ...]]"
+    help = ("Print the RAPI statistics of this process. If a command is "
+            "given, it is run first, so that its RAPI usage is reported.")
+
+    option_list = BaseCommand.option_list + (
+        make_option("--json", action="store_true", dest="json",
+                    default=False, help="Print the statistics as JSON."),
+    )
+
+    def handle(self, *args, **options):
+        if args:
+            call_command(args[0], *args[1:])
+
+        stats = process_stats()
+        if options["json"]:
+            self.stdout.write(json.dumps(stats, indent=2))
+            self.stdout.write("\n")
+            return
+
+        self.stdout.write("%-40s %-6s %-32s %6s %6s %9s %10s\n" % (
+            "host", "method", "path", "calls", "errors", "time", "bytes"))
+        for row in stats["calls"]:
+            self.stdout.write("%-40s %-6s %-32s %6d %6d %9.3f %10d\n" % (
+                row["host"], row["method"], row["path"], row["count"],
+                row["errors"], row["time"], row["bytes"]))
+
+        if stats["views"]:
+            self.stdout.write("\n%-64s %6s %9s\n" % ("view", "calls", "time"))
+            views = sorted(stats["views"].items(),
+                           key=lambda item: item[1]["time"], reverse=True)
+            for view, total in views:
+                self.stdout.write("%-64s %6d %9.3f\n" % (
+                    view, total["count"], total["time"]))
+
+        for cluster_id, limiter in sorted(stats["limiters"].items()):
+            self.stdout.write("\ncluster %s: %d requests, %d queued for "
+                              "%.3fs (max %.3fs)\n" % (
+                                  cluster_id, limiter["requests"],
+                                  limiter["queued"], limiter["queue_time"],
+                                  limiter["max_queue_time"]))
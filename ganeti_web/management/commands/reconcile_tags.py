@@ -0,0 +1,54 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ganeti_web.backend.tags import reconcile_owner_tags
+from ganeti_web.models import Cluster
+
+
+class Command(BaseCommand):
+    """
+    Push pending owner tag changes to Ganeti.
+    """
+
+    args = "[cluster-slug ...]"
+    help = ("Update the owner tags of all VMs whose tags don't match their "
+            "owner. Works on every cluster unless cluster slugs are given.")
+
+    option_list = BaseCommand.option_list + (
+        make_option("--batch-size", type="int", dest="batch_size",
+                    default=settings.TAG_BATCH_SIZE,
+                    help="Number of VMs read per query."),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get("verbosity", 1))
+
+        clusters = Cluster.objects.filter(
+            virtual_machines__owner_tag_dirty=True).distinct()
+        if args:
+            clusters = clusters.filter(slug__in=args)
+
+        for cluster in clusters:
+            changed = reconcile_owner_tags(cluster, options["batch_size"])
+            if verbosity:
+                self.stdout.write("Updated owner tags of %d VMs on %s.\n"
+                                  % (changed, cluster.slug))
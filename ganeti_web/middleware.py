@@ -3,9 +3,24 @@
 
 # This module provides middleware which Django is too wimpy to provide itself.
 
+import logging
+import random
+import time
+
+from django.conf import settings
 from django.core.exceptions import PermissionDenied
+from django.db import connections
 from django.http import HttpResponseForbidden
 from django.template import RequestContext, loader
+from django.template.base import Template
+from django.utils import simplejson as json
+
+from ganeti_web.backend import tasks
+from ganeti_web.util import perf
+from ganeti_web.util.metrics import set_view
+
+perf_logger = logging.getLogger("ganeti_web.perf")
+
 
 def render_403(request, message):
     """
@@ -28,3 +43,126 @@ class PermissionDeniedMiddleware(object):
     def process_exception(self, request, e):
         if isinstance(e, PermissionDenied):
             return render_403(request, ", ".join(e.args))
+
+
+class DeferredTasksMiddleware(object):
+    """
+    Middleware which starts the tasks deferred by a view only once the
+    response is ready.
+
+    It must come before ``TransactionMiddleware``, so that the request's
+    transaction has been committed by then and the tasks see its changes.
+    Tasks of requests which failed with an exception are dropped, since
+    their changes were rolled back.
+    """
+
+    def process_request(self, request):
+        tasks.hold()
+
+    def process_exception(self, request, e):
+        tasks.discard()
+
+    def process_response(self, request, response):
+        tasks.release()
+        return response
+
+
+class RapiMetricsMiddleware(object):
+    """
+    Middleware which tags RAPI metrics with the view that made the calls.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        set_view("%s.%s" % (view_func.__module__, view_func.__name__))
+
+    def process_response(self, request, response):
+        set_view(None)
+        return response
+
+
+def time_templates():
+    """
+    Make template rendering report its time to ``perf``. Safe to call more
+    than once.
+    """
+    if getattr(Template.render, "timed", False):
+        return
+
+    render = Template.render
+
+    def timed_render(self, context):
+        with perf.timed("template"):
+            return render(self, context)
+
+    timed_render.timed = True
+    Template.render = timed_render
+
+
+class PerformanceMiddleware(object):
+    """
+    Middleware which breaks down where the time of a request went: SQL
+    queries, RAPI calls, unpickling cached Ganeti info, and template
+    rendering.
+
+    Only a PERF_SAMPLE_RATE fraction of requests is measured. For those, the
+    breakdown is added to the response as ``X-Perf-*`` headers, each holding
+    the number of events and the milliseconds spent, and logged as JSON to
+    the ``ganeti_web.perf`` logger.
+
+    This middleware is opt-in; it should be listed first in
+    MIDDLEWARE_CLASSES so that the total covers all other middleware.
+    """
+
+    def __init__(self):
+        time_templates()
+
+    def process_request(self, request):
+        if random.random() >= settings.PERF_SAMPLE_RATE:
+            return
+
+        # Django only records queries in DEBUG mode, unless told to.
+        queries = {}
+        for connection in connections.all():
+            queries[connection.alias] = (connection.use_debug_cursor,
+                                         len(connection.queries))
+            connection.use_debug_cursor = True
+
+        request._perf = time.time(), queries
+        perf.start()
+
+    def process_response(self, request, response):
+        try:
+            start, queries = request._perf
+        except AttributeError:
+            return response
+        del request._perf
+
+        totals = perf.stop()
+        total = time.time() - start
+
+        count = elapsed = 0
+        for connection in connections.all():
+            if connection.alias not in queries:
+                continue
+            debug_cursor, first = queries[connection.alias]
+            connection.use_debug_cursor = debug_cursor
+            for query in connection.queries[first:]:
+                count += 1
+                elapsed += float(query["time"])
+        totals["sql"] = count, elapsed
+
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "total": total,
+        }
+        response["X-Perf-Total"] = "%.1f" % (total * 1000)
+        for kind in ("sql", "rapi", "pickle", "template"):
+            count, elapsed = totals.get(kind, (0, 0.0))
+            record[kind] = {"count": count, "time": elapsed}
+            response["X-Perf-%s" % kind.capitalize()] = \
+                "%d;%.1f" % (count, elapsed * 1000)
+
+        perf_logger.info(json.dumps(record))
+        return response
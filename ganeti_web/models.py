@@ -19,13 +19,17 @@
 # USA.
 
 import binascii
+from collections import defaultdict
+from contextlib import contextmanager
 import cPickle
 from datetime import datetime, timedelta
 from hashlib import sha1
+import os
 import random
 import re
 import string
 import sys
+import threading
 import time
 
 from django.conf import settings
@@ -36,10 +40,10 @@ from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites import models as sites_app
 from django.contrib.sites.management import create_default_site
 from django.core.validators import RegexValidator, MinValueValidator
-from django.db import models
-from django.db.models import BooleanField, Q, Sum
+from django.db import IntegrityError, models, transaction
+from django.db.models import BooleanField, Count, Q, Sum
 from django.db.models.query import QuerySet
-from django.db.models.signals import post_save, post_syncdb
+from django.db.models.signals import post_delete, post_save, post_syncdb
 from django.db.utils import DatabaseError
 from django.utils.encoding import force_unicode
 from django.utils.translation import ugettext_lazy as _
@@ -56,10 +60,14 @@ from object_permissions.registration import register
 from muddle_users import signals as muddle_user_signals
 
 from ganeti_web import constants, management, permissions
+from ganeti_web.backend.versions import JOBS, bump_object, bump_versions
 from ganeti_web.fields import (PatchedEncryptedCharField, LowerCaseCharField,
                                PreciseDateTimeField, SumIf)
-from ganeti_web.util import client
+from ganeti_web.util import client, perf
 from ganeti_web.util.client import GanetiApiError, REPLACE_DISK_AUTO
+from ganeti_web.util.health import CircuitBreaker
+from ganeti_web.util.limiter import RateLimiter
+from ganeti_web.util.metrics import rapi_metrics
 
 from south.signals import post_migrate
 
@@ -104,8 +112,53 @@ def generate_random_password(length=12):
 
 FINISHED_JOBS = 'success', 'unknown', 'error'
 
+UNAVAILABLE_MSG = _('The cluster is not responding; showing cached data')
+
+# fields requested when querying jobs; these match the keys returned by
+# GanetiRapiClient.GetJobStatus()
+JOB_FIELDS = ['id', 'status', 'ops', 'opstatus', 'oplog', 'opresult',
+              'received_ts', 'start_ts', 'end_ts', 'summary']
+# field status for a normal result in RAPI query responses
+RS_NORMAL = 0
+
 RAPI_CACHE = {}
 RAPI_CACHE_HASHES = {}
+# circuit breakers are kept per cluster id so that they survive the client
+# being replaced when the credentials change
+RAPI_BREAKERS = {}
+RAPI_LIMITERS = {}
+
+
+def get_breaker(cluster_id):
+    """
+    Returns the circuit breaker tracking the health of a cluster's RAPI.
+    """
+    try:
+        return RAPI_BREAKERS[cluster_id]
+    except KeyError:
+        breaker = CircuitBreaker(threshold=settings.RAPI_FAILURE_THRESHOLD,
+                                 backoff=settings.RAPI_BACKOFF)
+        return RAPI_BREAKERS.setdefault(cluster_id, breaker)
+
+
+def get_limiter(cluster_id):
+    """
+    Returns the limiter shared by all requests to a cluster's RAPI in this
+    process, and in other processes too if RAPI_LOCK_DIR is set.
+    """
+    try:
+        return RAPI_LIMITERS[cluster_id]
+    except KeyError:
+        lock_path = None
+        if settings.RAPI_LOCK_DIR:
+            lock_path = os.path.join(settings.RAPI_LOCK_DIR,
+                                     "rapi-%s" % cluster_id)
+        limiter = RateLimiter(concurrency=settings.RAPI_MAX_CONCURRENCY,
+                              rate=settings.RAPI_RATE_LIMIT,
+                              burst=settings.RAPI_RATE_BURST,
+                              timeout=settings.RAPI_QUEUE_TIMEOUT,
+                              lock_path=lock_path)
+        return RAPI_LIMITERS.setdefault(cluster_id, limiter)
 
 
 def get_rapi(hash, cluster):
@@ -152,8 +205,13 @@ def get_rapi(hash, cluster):
         del RAPI_CACHE[RAPI_CACHE_HASHES[cluster]]
 
     # Set connect timeout in settings.py so that you do not learn patience.
+    breaker = get_breaker(cluster)
     rapi = client.GanetiRapiClient(host, port, user, password,
-                                   timeout=settings.RAPI_CONNECT_TIMEOUT)
+                                   timeout=settings.RAPI_CONNECT_TIMEOUT,
+                                   breaker=breaker,
+                                   limiter=get_limiter(cluster),
+                                   metrics=rapi_metrics)
+    breaker.probe = rapi.CheckHealth
     RAPI_CACHE[hash] = rapi
     RAPI_CACHE_HASHES[cluster] = hash
     return rapi
@@ -165,6 +223,34 @@ def clear_rapi_cache():
     """
     RAPI_CACHE.clear()
     RAPI_CACHE_HASHES.clear()
+    RAPI_BREAKERS.clear()
+    RAPI_LIMITERS.clear()
+
+
+def owner_tag(owner_id):
+    """
+    Returns the Ganeti tag marking an instance as owned by a ClusterUser.
+    """
+    return '%s%s' % (constants.OWNER_TAG, owner_id)
+
+
+def diff_owner_tags(tags, owner_id):
+    """
+    Compare the tags of an instance with the owner tag it should have.
+
+    @return tuple of (tags to remove, tags to add)
+    """
+    remove = []
+    found = False
+    for tag in tags:
+        if tag.startswith(constants.OWNER_TAG):
+            if tag == owner_tag(owner_id):
+                found = True
+            else:
+                remove.append(tag)
+
+    add = [owner_tag(owner_id)] if owner_id and not found else []
+    return remove, add
 
 
 ssh_public_key_re = re.compile(
@@ -174,6 +260,24 @@ validate_sshkey = RegexValidator(ssh_public_key_re, ssh_public_key_error,
                                  "invalid")
 
 
+_no_refresh = threading.local()
+
+
+@contextmanager
+def no_refresh():
+    """
+    CachedClusterObjects created inside this block, in this thread, skip
+    load_info(): their cached info is neither checked nor refreshed from
+    Ganeti, and is only unpickled if ``info`` is read. For listings which
+    only need database columns.
+    """
+    _no_refresh.depth = getattr(_no_refresh, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _no_refresh.depth -= 1
+
+
 class CachedClusterObject(models.Model):
     """
     Parent class for objects which belong to Ganeti but have cached data in
@@ -213,7 +317,8 @@ class CachedClusterObject(models.Model):
 
     def __init__(self, *args, **kwargs):
         super(CachedClusterObject, self).__init__(*args, **kwargs)
-        self.load_info()
+        if not getattr(_no_refresh, "depth", 0):
+            self.load_info()
 
     @property
     def info(self):
@@ -229,7 +334,8 @@ class CachedClusterObject(models.Model):
 
         if self.__info is None:
             if self.serialized_info:
-                self.__info = cPickle.loads(str(self.serialized_info))
+                with perf.timed("pickle"):
+                    self.__info = cPickle.loads(str(self.serialized_info))
         return self.__info
 
     def _set_info(self, value):
@@ -256,12 +362,29 @@ class CachedClusterObject(models.Model):
             if (self.ignore_cache
                     or self.cached is None
                     or datetime.now() > self.cached + epsilon):
-                self.refresh()
+                if self.cluster_available:
+                    self.refresh()
+                else:
+                    # don't wait on a cluster known to be down; show what
+                    # we have
+                    self.error = UNAVAILABLE_MSG
+                    if self.info:
+                        self.parse_transient_info()
             elif self.info:
                 self.parse_transient_info()
             else:
                 self.error = 'No Cached Info'
 
+    @property
+    def cluster_available(self):
+        """
+        False while the circuit breaker for this object's cluster is open,
+        i.e. the cluster recently failed to respond and RAPI calls would fail
+        immediately.
+        """
+        breaker = RAPI_BREAKERS.get(self.cluster_id)
+        return breaker is None or breaker.allow()
+
     def parse_info(self):
         """
         Parse all of the attached metadata, and attach it to this object.
@@ -303,15 +426,27 @@ class CachedClusterObject(models.Model):
                 self.info = info_
                 self.save()
             else:
-                # There was no change on the server. Only update the cache
-                # time. This bypasses the info serialization mechanism and
-                # uses a smaller query.
-                if job_data:
+                # Ganeti didn't bump mtime, but runtime state such as the
+                # status of a VM may still have changed.  Only update the
+                # cache time and the columns which changed. This bypasses
+                # the full save and uses a smaller query.
+                updates = dict(cached=self.cached, **job_data)
+                if info_ and self.id is not None:
+                    changed = self.changed_fields(info_)
+                    if changed:
+                        for name, value in changed.items():
+                            field = self._meta.get_field(name)
+                            setattr(self, field.attname, value)
+                        self.__info = info_
+                        self.parse_transient_info()
+                        self.serialized_info = cPickle.dumps(info_)
+                        updates.update(changed)
+                        updates['serialized_info'] = self.serialized_info
+                if job_data or self.id is not None:
                     self.__class__.objects.filter(pk=self.id) \
-                        .update(cached=self.cached, **job_data)
-                elif self.id is not None:
-                    self.__class__.objects.filter(pk=self.id) \
-                        .update(cached=self.cached)
+                        .update(**updates)
+                    if job_data or 'serialized_info' in updates:
+                        bump_object(self)
 
         except GanetiApiError, e:
             # Use regular expressions to match the quoted message
@@ -327,12 +462,45 @@ class CachedClusterObject(models.Model):
             else:
                 msg = str(e)
                 self.error = str(e)
-            GanetiError.store_error(msg, obj=self, code=e.code)
+            recorder = GanetiErrorRecorder.active()
+            if recorder is not None:
+                recorder.store_error(msg, obj=self, code=e.code)
+            else:
+                GanetiError.store_error(msg, obj=self, code=e.code)
 
         else:
             if self.error:
                 self.error = None
-                GanetiError.objects.clear_errors(obj=self)
+                recorder = GanetiErrorRecorder.active()
+                if recorder is not None:
+                    recorder.clear_errors(obj=self)
+                else:
+                    GanetiError.objects.clear_errors(obj=self)
+
+    def changed_fields(self, info, **kwargs):
+        """
+        Compare the persistent properties parsed from ``info`` with the
+        values currently set on this object.
+
+        Related objects are compared by primary key, so this does not load
+        any related objects.
+
+        @param kwargs  passed on to ``parse_persistent_info()``
+        @return dict of the fields whose values differ, mapped to their new
+                values, suitable for ``QuerySet.update()``
+        """
+        # properties may be parsed by name or, for foreign keys, by attname
+        fields = dict((f.attname, f) for f in self._meta.fields)
+        fields.update((f.name, f) for f in self._meta.fields)
+
+        changed = {}
+        for name, value in self.parse_persistent_info(info, **kwargs).items():
+            field = fields[name]
+            if isinstance(value, models.Model):
+                value = value.pk
+            if getattr(self, field.attname) != value:
+                changed[field.name] = value
+        return changed
 
     def _refresh(self):
         """
@@ -348,33 +516,29 @@ class CachedClusterObject(models.Model):
             return {}
 
         ct = ContentType.objects.get_for_model(self)
-        qs = Job.objects.filter(content_type=ct, object_id=self.pk)
-        jobs = qs.order_by("job_id")
-
-        updates = {}
-        op = None
-        status = 'unknown'
-
-        for job in jobs:
-            try:
-                data = self.rapi.GetJobStatus(job.job_id)
-
-                if Job.valid_job(data):
-                    op = data['ops'][-1]['OP_ID']
-                    status = data['status']
+        jobs = list(Job.objects.filter(content_type=ct, object_id=self.pk)
+                    .order_by("job_id")
+                    .values_list("pk", "job_id", "status", "op"))
 
-            except GanetiApiError:
-                pass
+        # Finished jobs never change, so only pending jobs are polled, all
+        # of them with a single request.
+        pending = [job for job in jobs if job[2] not in FINISHED_JOBS]
+        try:
+            polled = Job.update_statuses(self.rapi, pending)
+        except GanetiApiError:
+            # leave the jobs pending and try again next time
+            polled = {}
 
-            if status in ('success', 'error'):
-                for k, v in Job.parse_persistent_info(data).items():
-                    setattr(job, k, v)
+        updates = {}
+        status = None
 
-            if status == 'unknown':
-                job.status = "unknown"
-                job.ignore_cache = False
+        for pk, job_id, status, op in jobs:
+            if pk in polled:
+                status, op = polled[pk]
+            elif pk != self.last_job_id:
+                continue
 
-            if status in ('success', 'error', 'unknown'):
+            if status in FINISHED_JOBS:
                 _updates = self._complete_job(self.cluster_id,
                                               self.hostname, op, status)
                 # XXX if the delete flag is set in updates then delete this
@@ -388,12 +552,12 @@ class CachedClusterObject(models.Model):
                         # Revisit that when we finally nuke all this caching
                         # bullshit.
                         self.delete()
-                        job.delete()
+                        Job.objects.filter(pk=pk).delete()
                     else:
                         updates.update(_updates)
 
         # we only care about the very last job for resetting the cache flags
-        if not jobs or status in ('success', 'error', 'unknown'):
+        if not jobs or status in FINISHED_JOBS:
             updates['ignore_cache'] = False
             updates['last_job'] = None
 
@@ -479,6 +643,10 @@ class Job(CachedClusterObject):
     status = models.CharField(max_length=10)
     op = models.CharField(max_length=50)
 
+    # set for jobs submitted together, see JobBatch
+    batch = models.ForeignKey('JobBatch', related_name='jobs', null=True,
+                              blank=True, on_delete=models.SET_NULL)
+
     objects = JobManager()
 
     def save(self, *args, **kwargs):
@@ -509,6 +677,9 @@ class Job(CachedClusterObject):
         otherwise this will always load from the cache.
         """
         if self.id and (self.ignore_cache or self.info is None):
+            if not self.cluster_available:
+                self.error = UNAVAILABLE_MSG
+                return
             try:
                 self.refresh()
             except GanetiApiError, e:
@@ -531,6 +702,82 @@ class Job(CachedClusterObject):
         # else:
         #     Job.objects.get(job_id=self.info['id']).delete()
 
+    @classmethod
+    def fetch_statuses(cls, rapi, job_ids):
+        """
+        Fetch the status of several jobs of one cluster.
+
+        All jobs are fetched with a single RAPI query. Clusters which don't
+        support the query resource are polled one job at a time instead.
+
+        @return dict mapping job ids to job info. Jobs which no longer exist
+                in Ganeti, e.g. because they were archived, are left out.
+        """
+        if not job_ids:
+            return {}
+
+        qfilter = ['|'] + [['=', 'id', int(job_id)] for job_id in job_ids]
+        try:
+            response = rapi.Query('job', JOB_FIELDS, qfilter)
+        except GanetiApiError, e:
+            if e.code not in (404, 501):
+                raise
+            return cls._fetch_statuses_singly(rapi, job_ids)
+
+        infos = {}
+        for row in response['data']:
+            # each field is a (status, value) pair; anything but a normal
+            # status means the job is unknown
+            if any(field_status != RS_NORMAL for field_status, v in row):
+                continue
+            info = dict(zip(JOB_FIELDS, [value for s, value in row]))
+            infos[int(info['id'])] = info
+        return infos
+
+    @classmethod
+    def _fetch_statuses_singly(cls, rapi, job_ids):
+        infos = {}
+        for job_id in job_ids:
+            try:
+                infos[int(job_id)] = rapi.GetJobStatus(job_id)
+            except GanetiApiError, e:
+                if e.code != 404:
+                    raise
+        return infos
+
+    @classmethod
+    def update_statuses(cls, rapi, jobs):
+        """
+        Poll the status of several jobs of one cluster and store the changes
+        without instantiating any Jobs.
+
+        Jobs no longer known to Ganeti are marked as 'unknown'.
+
+        @param jobs  list of (pk, job_id, status, op) tuples
+        @return dict mapping the pk of every polled job to its new
+                (status, op)
+        """
+        if not jobs:
+            return {}
+
+        infos = cls.fetch_statuses(rapi, [job[1] for job in jobs])
+
+        polled = {}
+        for pk, job_id, status, op in jobs:
+            info = infos.get(int(job_id))
+            if info is None:
+                data = dict(status='unknown', ignore_cache=False)
+            elif cls.valid_job(info):
+                data = cls.parse_persistent_info(info)
+                data['serialized_info'] = cPickle.dumps(info)
+            else:
+                continue
+
+            if data['status'] != status:
+                cls.objects.filter(pk=pk).update(**data)
+            polled[pk] = data['status'], data.get('op', op)
+        return polled
+
     @classmethod
     def valid_job(cls, info):
         status = info.get('status')
@@ -600,6 +847,62 @@ class Job(CachedClusterObject):
     __unicode__ = __repr__
 
 
+class JobBatch(models.Model):
+    """
+    Jobs submitted together, such as for powering a selection of virtual
+    machines, and tracked as one unit.
+
+    ``total`` is the number of objects the batch was asked to act on, and
+    ``failed`` the number of them for which no job could be submitted.
+    """
+    user = models.ForeignKey(User, related_name='+', null=True, blank=True,
+                             on_delete=models.SET_NULL)
+    op = models.CharField(max_length=50)
+    created = models.DateTimeField(auto_now_add=True)
+    total = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+
+    def poll(self):
+        """
+        Poll the unfinished jobs of the batch, with one RAPI query per
+        cluster and without instantiating any Jobs.
+        """
+        pending = defaultdict(list)
+        for job in self.jobs.exclude(status__in=FINISHED_JOBS) \
+                .values_list('cluster_id', 'pk', 'job_id', 'status', 'op'):
+            pending[job[0]].append(job[1:])
+        if not pending:
+            return
+
+        with no_refresh():
+            clusters = Cluster.objects.in_bulk(pending.keys())
+        for cluster_id, jobs in pending.items():
+            try:
+                Job.update_statuses(clusters[cluster_id].rapi, jobs)
+            except GanetiApiError:
+                # leave the jobs pending and try again next time
+                pass
+
+    def progress(self):
+        """
+        @return dict with the number of objects in the batch, how many of
+                them failed to submit, how many jobs were submitted and have
+                finished, and the number of jobs in each status
+        """
+        statuses = dict(self.jobs.order_by().values_list('status')
+                        .annotate(Count('pk')))
+        finished = sum(n for status, n in statuses.items()
+                       if status in FINISHED_JOBS)
+        return {
+            'total': self.total,
+            'failed': self.failed,
+            'submitted': sum(statuses.values()),
+            'finished': finished,
+            'statuses': statuses,
+            'done': finished + self.failed >= self.total,
+        }
+
+
 class VirtualMachine(CachedClusterObject):
     """
     The VirtualMachine (VM) model represents VMs within a Ganeti cluster.
@@ -653,6 +956,11 @@ class VirtualMachine(CachedClusterObject):
     pending_delete = models.BooleanField(default=False)
     deleted = False
 
+    # Set when the owner tag in Ganeti does not match the owner.  Tags are
+    # written to Ganeti in the background, see ganeti_web.backend.tags.
+    owner_tag_dirty = models.BooleanField(default=False, db_index=True,
+                                          editable=False)
+
     # Template temporarily stores parameters used to create this virtual
     # machine. This template is used to recreate the values entered into the
     # form.
@@ -670,34 +978,18 @@ class VirtualMachine(CachedClusterObject):
     def save(self, *args, **kwargs):
         """
         sets the cluster_hash for newly saved instances
+
+        Owner tags are not written to Ganeti here. If the cached tags don't
+        match the owner, the VM is flagged and its tags are updated later by
+        ``ganeti_web.backend.tags.reconcile_owner_tags()``.
         """
         if self.id is None:
             self.cluster_hash = self.cluster.hash
 
         info_ = self.info
         if info_:
-            found = False
-            remove = []
-            if self.cluster.username:
-                for tag in info_['tags']:
-                    # Update owner Tag. Make sure the tag is set to the owner
-                    #  that is set in webmgr.
-                    if tag.startswith(constants.OWNER_TAG):
-                        id = int(tag[len(constants.OWNER_TAG):])
-                        # Since there is no 'update tag' delete old tag and
-                        #  replace with tag containing correct owner id.
-                        if id == self.owner_id:
-                            found = True
-                        else:
-                            remove.append(tag)
-                if remove:
-                    self.rapi.DeleteInstanceTags(self.hostname, remove)
-                    for tag in remove:
-                        info_['tags'].remove(tag)
-                if self.owner_id and not found:
-                    tag = '%s%s' % (constants.OWNER_TAG, self.owner_id)
-                    self.rapi.AddInstanceTags(self.hostname, [tag])
-                    self.info['tags'].append(tag)
+            remove, add = diff_owner_tags(info_['tags'], self.owner_id)
+            self.owner_tag_dirty = bool(remove or add)
 
         super(VirtualMachine, self).save(*args, **kwargs)
 
@@ -718,11 +1010,63 @@ class VirtualMachine(CachedClusterObject):
     def is_running(self):
         return self.status == 'running'
 
+    def changed_fields(self, info):
+        """
+        Overridden so that nodes are only looked up when they differ from the
+        cached info, and then among the nodes of this VM's cluster.
+        """
+        hostnames = [info['pnode']] + info['snodes'][:1]
+        cached = self.info
+        if cached and [cached['pnode']] + cached['snodes'][:1] == hostnames:
+            nodes = {info['pnode'].lower(): self.primary_node_id}
+            if info['snodes']:
+                nodes[info['snodes'][0].lower()] = self.secondary_node_id
+        else:
+            nodes = dict(Node.objects
+                         .filter(cluster=self.cluster_id,
+                                 hostname__in=[h.lower() for h in hostnames
+                                               if h])
+                         .values_list('hostname', 'id'))
+        return super(VirtualMachine, self).changed_fields(info, nodes=nodes)
+
+    def quota_key(self):
+        """
+        What this VM counts against its owner's quota, see QuotaUsage.
+        """
+        return (self.owner_id, self.cluster_id, self.is_running, self.ram,
+                self.virtual_cpus, self.disk_size)
+
+    def refresh(self):
+        """
+        Overridden to keep the QuotaUsage of the owner up to date, and to
+        release QuotaReservations once no job is pending and the new status
+        is stored.
+        """
+        before = self.quota_key()
+        pending = self.last_job_id
+        super(VirtualMachine, self).refresh()
+        if self.id is None:
+            # deleted by its job; the usage is reconciled on delete
+            return
+
+        # a failed refresh leaves the status stale and the last job stored,
+        # so the reservations are released by the next one
+        if pending and not self.last_job_id and not self.error:
+            QuotaReservation.release([self.id])
+        after = self.quota_key()
+        if after != before:
+            QuotaUsage.reconcile([before[:2], after[:2]])
+
     @classmethod
-    def parse_persistent_info(cls, info):
+    def parse_persistent_info(cls, info, nodes=None):
         """
         Loads all values from cached info, included persistent properties that
         are stored in the database
+
+        @param nodes  optional dict mapping lowercase node hostnames, as
+                      stored in the database, to Node ids. When given, node
+                      ids are looked up in it instead of querying the
+                      database for each node.
         """
         data = super(VirtualMachine, cls).parse_persistent_info(info)
 
@@ -737,6 +1081,14 @@ class VirtualMachine(CachedClusterObject):
         data['operating_system'] = info['os']
         data['status'] = info['status']
 
+        if nodes is not None:
+            secondary = info['snodes']
+            # node hostnames are stored in lowercase
+            data['primary_node_id'] = nodes.get(info['pnode'].lower())
+            data['secondary_node_id'] = \
+                nodes.get(secondary[0].lower()) if secondary else None
+            return data
+
         primary = info['pnode']
         if primary:
             try:
@@ -1119,7 +1471,11 @@ class Cluster(CachedClusterObject):
         return self.hostname
 
     def save(self, *args, **kwargs):
+        old_hash = self.hash
         self.hash = self.create_hash()
+        # checked by update_cluster_hash() so that related objects are only
+        # rewritten when the credentials actually changed
+        self._hash_changed = self.hash != old_hash
         super(Cluster, self).save(*args, **kwargs)
 
     @models.permalink
@@ -1263,27 +1619,101 @@ class Cluster(CachedClusterObject):
             * VMs no longer in ganeti are deleted
             * VMs missing from the database are added
         """
-        ganeti = self.instances()
+        # XXX imported here to avoid a circular import
+        from ganeti_web.backend.importing import import_virtual_machines
+
+        ganeti = self.instances(bulk=True)
+        hostnames = [info['name'] for info in ganeti]
         db = self.virtual_machines.all().values_list('hostname', flat=True)
 
-        # add VMs missing from the database
-        for hostname in filter(lambda x: unicode(x) not in db, ganeti):
-            vm = VirtualMachine.objects.create(cluster=self, hostname=hostname)
-            vm.refresh()
+        # add VMs missing from the database. They are created from the bulk
+        # info and don't need to be refreshed again.
+        started = datetime.now()
+        import_virtual_machines(self, instances=ganeti)
+
+        with GanetiErrorRecorder():
+            # deletes VMs that are no longer in ganeti
+            if remove:
+                missing_ganeti = filter(lambda x: str(x) not in hostnames, db)
+                if missing_ganeti:
+                    self.virtual_machines \
+                        .filter(hostname__in=missing_ganeti).delete()
+
+            # Get up to date data on all VMs which weren't just imported
+            self.check_pending_jobs()
+            qs = self.virtual_machines.exclude(cached__gte=started)
+            for vm in qs:
+                vm.refresh()
 
-        # deletes VMs that are no longer in ganeti
-        if remove:
-            missing_ganeti = filter(lambda x: str(x) not in ganeti, db)
-            if missing_ganeti:
-                self.virtual_machines \
-                    .filter(hostname__in=missing_ganeti).delete()
+    def refresh_virtual_machines(self):
+        with GanetiErrorRecorder():
+            self.check_pending_jobs()
+            for vm in self.virtual_machines.all():
+                vm.refresh()
 
-        # Get up to date data on all VMs
-        self.refresh_virtual_machines()
+    def check_pending_jobs(self):
+        """
+        Poll all pending jobs of this cluster, whether they belong to VMs,
+        nodes, or the cluster itself, with a single request.
 
-    def refresh_virtual_machines(self):
-        for vm in self.virtual_machines.all():
-            vm.refresh()
+        Jobs which finished are completed for the objects they belong to,
+        without instantiating them. Jobs already known to be finished are
+        never polled again.
+
+        @return number of jobs which finished
+        """
+        jobs = list(Job.objects.filter(cluster=self)
+                    .exclude(status__in=FINISHED_JOBS).order_by('job_id')
+                    .values_list('pk', 'job_id', 'status', 'op',
+                                 'content_type', 'object_id'))
+        try:
+            polled = Job.update_statuses(self.rapi,
+                                         [job[:4] for job in jobs])
+        except GanetiApiError:
+            return 0
+
+        finished = defaultdict(list)
+        for job in jobs:
+            if job[0] in polled and polled[job[0]][0] in FINISHED_JOBS:
+                finished[job[4]].append(job)
+        if finished:
+            bump_versions(Cluster, [self.pk])
+
+        for ct_id, model_jobs in finished.items():
+            model = ContentType.objects.get_for_id(ct_id).model_class()
+            obj_ids = [job[5] for job in model_jobs]
+            objs = model.objects.filter(pk__in=obj_ids) \
+                .values_list('pk', 'hostname', 'last_job')
+            objs = dict((pk, (hostname, last_job))
+                        for pk, hostname, last_job in objs)
+
+            # VMs holding QuotaReservations keep their last job, so that
+            # their own refresh stores the new status before releasing them
+            reserved = set()
+            if model is VirtualMachine:
+                reserved = set(QuotaReservation.objects
+                               .filter(virtual_machine__in=obj_ids)
+                               .values_list('virtual_machine', flat=True))
+
+            for pk, job_id, status, op, ct, obj_id in model_jobs:
+                if obj_id not in objs:
+                    continue
+                hostname, last_job = objs[obj_id]
+                status, op = polled[pk]
+                updates = model._complete_job(self.pk, hostname, op,
+                                              status) or {}
+                if 'deleted' in updates:
+                    # see check_job_status() for why the job is deleted too
+                    model.objects.filter(pk=obj_id).delete()
+                    Job.objects.filter(pk=pk).delete()
+                    continue
+                if last_job == pk and obj_id not in reserved:
+                    updates.update(ignore_cache=False, last_job=None)
+                if updates:
+                    model.objects.filter(pk=obj_id).update(**updates)
+                    bump_versions(model, [obj_id])
+
+        return sum(len(model_jobs) for model_jobs in finished.values())
 
     def sync_nodes(self, remove=False):
         """
@@ -1295,23 +1725,26 @@ class Cluster(CachedClusterObject):
         ganeti = self.rapi.GetNodes()
         db = self.nodes.all().values_list('hostname', flat=True)
 
-        # add Nodes missing from the database
-        for hostname in filter(lambda x: unicode(x) not in db, ganeti):
-            node = Node.objects.create(cluster=self, hostname=hostname)
-            node.refresh()
+        with GanetiErrorRecorder():
+            # add Nodes missing from the database
+            for hostname in filter(lambda x: unicode(x) not in db, ganeti):
+                node = Node.objects.create(cluster=self, hostname=hostname)
+                node.refresh()
 
-        # deletes Nodes that are no longer in ganeti
-        if remove:
-            missing_ganeti = filter(lambda x: str(x) not in ganeti, db)
-            if missing_ganeti:
-                self.nodes.filter(hostname__in=missing_ganeti).delete()
+            # deletes Nodes that are no longer in ganeti
+            if remove:
+                missing_ganeti = filter(lambda x: str(x) not in ganeti, db)
+                if missing_ganeti:
+                    self.nodes.filter(hostname__in=missing_ganeti).delete()
 
-        # Get up to date data for all Nodes
-        self.refresh_nodes()
+            # Get up to date data for all Nodes
+            self.refresh_nodes()
 
     def refresh_nodes(self):
-        for node in self.nodes.all():
-            node.refresh()
+        with GanetiErrorRecorder():
+            self.check_pending_jobs()
+            for node in self.nodes.all():
+                node.refresh()
 
     @property
     def missing_in_ganeti(self):
@@ -1491,6 +1924,10 @@ class VirtualMachineTemplate(models.Model):
                                  validators=[MinValueValidator(100)],
                                  null=True, blank=True)
     disks = PickleField(verbose_name=_('Disks'), null=True, blank=True)
+    # Totals of ``disks``, kept so that templates can be sorted and filtered
+    # by disk in SQL. They are set on save.
+    disk_space = models.IntegerField(default=0, editable=False)
+    disk_count = models.IntegerField(default=0, editable=False)
     # XXX why isn't this an enum?
     disk_type = models.CharField(verbose_name=_('Disk Type'), max_length=255,
                                  default="")
@@ -1523,6 +1960,15 @@ class VirtualMachineTemplate(models.Model):
         else:
             return self.template_name
 
+    def save(self, *args, **kwargs):
+        """
+        overridden to store the total size and the number of the disks
+        """
+        disks = self.disks or []
+        self.disk_space = sum(int(disk['size']) for disk in disks)
+        self.disk_count = len(disks)
+        super(VirtualMachineTemplate, self).save(*args, **kwargs)
+
     def set_name(self, name):
         """
         Set this template's name.
@@ -1679,6 +2125,149 @@ class GanetiError(models.Model):
                                       **kwargs)
 
 
+class GanetiErrorRecorder(object):
+    """
+    Collects errors during a sync pass and writes them all at once.
+
+    Refreshing a broken cluster stores one error per object, and each call to
+    ``GanetiError.store_error`` costs several queries. While a recorder is
+    active, ``CachedClusterObject.refresh()`` hands its errors to the
+    recorder instead. Errors are deduplicated in memory and written with a
+    single bulk insert when the recorder exits; clearing errors is batched the
+    same way.
+
+    The deduplication rules are the same as those of ``store_error``.
+
+    Usage::
+
+        with GanetiErrorRecorder():
+            for vm in cluster.virtual_machines.all():
+                vm.refresh()
+    """
+
+    _local = threading.local()
+
+    def __init__(self):
+        # (msg, obj_type_id, obj_id, code) -> cluster_id
+        self.errors = {}
+        # obj_type_id -> set of obj_ids
+        self.cleared = defaultdict(set)
+
+    @classmethod
+    def active(cls):
+        """
+        Return the innermost recorder active in this thread, if any.
+        """
+        stack = getattr(cls._local, "stack", None)
+        if stack:
+            return stack[-1]
+        return None
+
+    def __enter__(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        self._local.stack.append(self)
+        return self
+
+    def __exit__(self, type, value, tb):
+        self._local.stack.remove(self)
+        self.flush()
+
+    def store_error(self, msg, obj, code):
+        """
+        Record an error. Arguments are the same as for
+        ``GanetiError.store_error``.
+        """
+        if isinstance(obj, Cluster):
+            cluster_id = obj.pk
+        else:
+            cluster_id = obj.cluster_id
+            # 401 is cluster-specific; see GanetiError.store_error. Loading
+            # obj.cluster could refresh it, so only its id is used.
+            if code == 401:
+                ct = ContentType.objects.get_for_model(Cluster)
+                self.errors[(msg, ct.pk, cluster_id, code)] = cluster_id
+                return
+
+        ct = ContentType.objects.get_for_model(obj.__class__)
+        self.errors[(msg, ct.pk, obj.pk, code)] = cluster_id
+
+    def clear_errors(self, obj):
+        """
+        Record that errors for an object should be cleared.
+        """
+        ct = ContentType.objects.get_for_model(obj.__class__)
+        self.cleared[ct.pk].add(obj.pk)
+
+    def flush(self):
+        """
+        Write all recorded changes to the database.
+        """
+        self._flush_cleared()
+        self._flush_errors()
+
+    def _flush_cleared(self):
+        cluster_ct = ContentType.objects.get_for_model(Cluster)
+        for ct_id, ids in self.cleared.items():
+            qs = GanetiError.objects.filter(cleared=False)
+            # Clearing a cluster clears errors of all its objects, just like
+            # GanetiError.objects.clear_errors(obj=cluster) would.
+            if ct_id == cluster_ct.pk:
+                qs = qs.filter(cluster__in=ids)
+            else:
+                qs = qs.filter(obj_type=ct_id, obj_id__in=ids)
+            qs.update(cleared=True)
+        self.cleared.clear()
+
+    def _flush_errors(self):
+        if not self.errors:
+            return
+
+        cluster_ct = ContentType.objects.get_for_model(Cluster)
+
+        # 404s for an object are suppressed when its cluster already has an
+        # active 404 with the same message. Look them all up at once, along
+        # with any recorded in this batch.
+        cluster_404s = set((msg, obj_id) for msg, ct_id, obj_id, code
+                           in self.errors
+                           if ct_id == cluster_ct.pk and code == 404)
+        cluster_ids = set(cluster_id for (msg, ct_id, obj_id, code),
+                          cluster_id in self.errors.items()
+                          if ct_id != cluster_ct.pk and code == 404)
+        if cluster_ids:
+            cluster_404s.update(GanetiError.objects
+                                .filter(obj_type=cluster_ct, code=404,
+                                        obj_id__in=cluster_ids,
+                                        cleared=False)
+                                .values_list("msg", "obj_id"))
+
+        # Find errors which already exist, one query per content type.
+        by_type = defaultdict(set)
+        for msg, ct_id, obj_id, code in self.errors:
+            by_type[ct_id].add(obj_id)
+        existing = set()
+        for ct_id, ids in by_type.items():
+            existing.update(GanetiError.objects
+                            .filter(obj_type=ct_id, obj_id__in=ids)
+                            .values_list("msg", "obj_type", "obj_id", "code"))
+
+        now = datetime.now()
+        new = []
+        for key, cluster_id in self.errors.items():
+            msg, ct_id, obj_id, code = key
+            if key in existing:
+                continue
+            if (code == 404 and ct_id != cluster_ct.pk
+                    and (msg, cluster_id) in cluster_404s):
+                continue
+            new.append(GanetiError(timestamp=now, msg=msg, obj_type_id=ct_id,
+                                   obj_id=obj_id, cluster_id=cluster_id,
+                                   code=code))
+
+        GanetiError.objects.bulk_create(new)
+        self.errors.clear()
+
+
 class ClusterUser(models.Model):
     """
     Base class for objects that may interact with a Cluster or VirtualMachine.
@@ -1842,6 +2431,85 @@ class Quota(models.Model):
     virtual_cpus = models.IntegerField(default=0, null=True, blank=True)
 
 
+class QuotaUsage(models.Model):
+    """
+    The resources a ClusterUser's virtual machines use on a Cluster, counted
+    the same way as ``ClusterUser.used_resources()``: RAM and virtual CPUs of
+    running VMs, and the disk of all of them.
+
+    This is a ledger, so that quotas can be checked by reading a single row.
+    Rows are created on first use and reconciled with the VMs whenever what
+    a VM counts changes; see ``ganeti_web.backend.quotas``.
+    """
+    owner = models.ForeignKey(ClusterUser, related_name='quota_usage')
+    cluster = models.ForeignKey(Cluster, related_name='quota_usage')
+
+    ram = models.IntegerField(default=0)
+    disk = models.IntegerField(default=0)
+    virtual_cpus = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (("owner", "cluster"),)
+
+    @classmethod
+    def reconcile(cls, keys, create=False):
+        """
+        Recount the usage of owners on clusters from their VMs.
+
+        @param keys  iterable of (owner id, cluster id) pairs. Pairs without
+                     an owner are ignored.
+        @param create  create missing rows. Otherwise only existing rows are
+                       updated, and missing ones are counted when first used.
+        """
+        for owner_id, cluster_id in set(keys):
+            if owner_id is None:
+                continue
+            used = ClusterUser(pk=owner_id).used_resources(cluster_id)
+            query = cls.objects.filter(owner=owner_id, cluster=cluster_id)
+            if query.update(**used) or not create:
+                continue
+
+            # another request may be creating the same row
+            sid = transaction.savepoint()
+            try:
+                cls.objects.create(owner_id=owner_id, cluster_id=cluster_id,
+                                   **used)
+                transaction.savepoint_commit(sid)
+            except IntegrityError:
+                transaction.savepoint_rollback(sid)
+                query.update(**used)
+
+
+class QuotaReservation(models.Model):
+    """
+    Resources set aside for the pending jobs of a virtual machine, such as a
+    startup, so that they count against the owner's quota before the VM
+    shows them. Reservations are released when the VM is refreshed and has
+    no pending job left.
+    """
+    virtual_machine = models.ForeignKey(VirtualMachine,
+                                        related_name='quota_reservations')
+    owner = models.ForeignKey(ClusterUser, related_name='+')
+    cluster = models.ForeignKey(Cluster, related_name='+')
+    created = models.DateTimeField(auto_now_add=True)
+
+    ram = models.IntegerField(default=0)
+    disk = models.IntegerField(default=0)
+    virtual_cpus = models.IntegerField(default=0)
+
+    @classmethod
+    def release(cls, vm_ids):
+        """
+        Release the reservations of virtual machines, and recount the usage
+        of their owners.
+        """
+        reservations = cls.objects.filter(virtual_machine__in=vm_ids)
+        keys = list(reservations.values_list('owner', 'cluster'))
+        if keys:
+            reservations.delete()
+            QuotaUsage.reconcile(keys)
+
+
 class SSHKey(models.Model):
     """
     Model representing user's SSH public key. Virtual machines rely on
@@ -1869,13 +2537,21 @@ def create_profile(sender, instance, **kwargs):
         pass
 
 
-def update_cluster_hash(sender, instance, **kwargs):
+def update_cluster_hash(sender, instance, created=False, **kwargs):
     """
     Updates the Cluster hash for all of it's VirtualMachines, Nodes, and Jobs
+
+    Most saves come from refreshing the cluster and don't touch the
+    credentials, so nothing is updated unless the hash changed.
     """
-    instance.virtual_machines.all().update(cluster_hash=instance.hash)
-    instance.jobs.all().update(cluster_hash=instance.hash)
-    instance.nodes.all().update(cluster_hash=instance.hash)
+    if created or not getattr(instance, '_hash_changed', True):
+        return
+
+    hash = instance.hash
+    instance.virtual_machines.exclude(cluster_hash=hash) \
+        .update(cluster_hash=hash)
+    instance.jobs.exclude(cluster_hash=hash).update(cluster_hash=hash)
+    instance.nodes.exclude(cluster_hash=hash).update(cluster_hash=hash)
 
 
 def update_organization(sender, instance, **kwargs):
@@ -1886,9 +2562,43 @@ def update_organization(sender, instance, **kwargs):
     org.name = instance.name
     org.save()
 
+def bump_fragment_versions(sender, instance, **kwargs):
+    """
+    Invalidates cached template fragments of a Cluster, Node or
+    VirtualMachine, and of the cluster it belongs to.
+    """
+    bump_object(instance)
+
+
+def bump_job_versions(sender, instance, **kwargs):
+    """
+    Notifies pages waiting for updates of the object a job belongs to.
+    """
+    model = ContentType.objects.get_for_id(instance.content_type_id) \
+        .model_class()
+    bump_versions(model, [instance.object_id], JOBS)
+
+
+def reconcile_quota_usage(sender, instance, created=True, **kwargs):
+    """
+    Recounts the quota usage of the owner of a new or deleted VirtualMachine.
+    Other changes are reconciled when the VM is refreshed.
+    """
+    if created:
+        QuotaUsage.reconcile([(instance.owner_id, instance.cluster_id)])
+
 post_save.connect(create_profile, sender=User)
 post_save.connect(update_cluster_hash, sender=Cluster)
 post_save.connect(update_organization, sender=Group)
+post_save.connect(bump_fragment_versions, sender=Cluster)
+post_save.connect(bump_fragment_versions, sender=Node)
+post_save.connect(bump_fragment_versions, sender=VirtualMachine)
+post_delete.connect(bump_fragment_versions, sender=Cluster)
+post_delete.connect(bump_fragment_versions, sender=Node)
+post_delete.connect(bump_fragment_versions, sender=VirtualMachine)
+post_save.connect(bump_job_versions, sender=Job)
+post_save.connect(reconcile_quota_usage, sender=VirtualMachine)
+post_delete.connect(reconcile_quota_usage, sender=VirtualMachine)
 
 # Disconnect create_default_site from django.contrib.sites so that
 #  the useless table for sites is not created. This will be
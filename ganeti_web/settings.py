@@ -28,8 +28,26 @@ of course.
 
 __all__ = (
     "AUTH_PROFILE_MODULE",
+    "BATCH_CONCURRENCY",
+    "ERROR_RETENTION_DAYS",
+    "EXPORT_CHUNK_SIZE",
+    "FRAGMENT_CACHE_TIMEOUT",
+    "IMPORT_CHUNK_SIZE",
     "INSTALLED_APPS",
+    "JOB_RETENTION_DAYS",
+    "JOB_UPDATES_TIMEOUT",
     "MIDDLEWARE_CLASSES",
+    "PERF_SAMPLE_RATE",
+    "RAPI_BACKOFF",
+    "RAPI_FAILURE_THRESHOLD",
+    "RAPI_LOCK_DIR",
+    "RAPI_MAX_CONCURRENCY",
+    "RAPI_QUEUE_TIMEOUT",
+    "RAPI_RATE_BURST",
+    "RAPI_RATE_LIMIT",
+    "RETENTION_BATCH_SIZE",
+    "TABLE_COUNT_LIMIT",
+    "TAG_BATCH_SIZE",
     "TEMPLATE_CONTEXT_PROCESSORS",
     "TEMPLATE_LOADERS",
     "ugettext",
@@ -60,6 +78,9 @@ TEMPLATE_CONTEXT_PROCESSORS = (
 # Middleware. Order matters; these are all applied *in the order given*.
 MIDDLEWARE_CLASSES = (
     'django.middleware.common.CommonMiddleware',
+    # Starts background tasks after the transaction middleware has committed
+    # the request.
+    'ganeti_web.middleware.DeferredTasksMiddleware',
     # Transaction middleware is early so that it can apply to all later
     # middlewares.
     'django.middleware.transaction.TransactionMiddleware',
@@ -69,6 +90,7 @@ MIDDLEWARE_CLASSES = (
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'ganeti_web.middleware.PermissionDeniedMiddleware',
+    'ganeti_web.middleware.RapiMetricsMiddleware',
 )
 
 INSTALLED_APPS = (
@@ -96,3 +118,72 @@ INSTALLED_APPS = (
 
 # The model that contains extra user profile stuff.
 AUTH_PROFILE_MODULE = 'ganeti_web.Profile'
+
+# Retention policy applied by the ``compact_tables`` management command.
+# Cleared errors older than ERROR_RETENTION_DAYS are deleted, and finished
+# jobs older than JOB_RETENTION_DAYS have their op logs and results stripped.
+# Rows are processed RETENTION_BATCH_SIZE at a time.
+ERROR_RETENTION_DAYS = 30
+JOB_RETENTION_DAYS = 30
+RETENTION_BATCH_SIZE = 500
+
+# Number of VirtualMachines inserted per query when importing VMs from a
+# cluster, either through the import views or the ``import_vms`` command.
+IMPORT_CHUNK_SIZE = 500
+
+# Number of rows read per query when exporting the inventory.
+EXPORT_CHUNK_SIZE = 1000
+
+# Number of VirtualMachines read per query when pushing owner tags to Ganeti.
+TAG_BATCH_SIZE = 100
+
+# Circuit breaker for unresponsive clusters. After RAPI_FAILURE_THRESHOLD
+# consecutive connection failures, RAPI calls to a cluster fail immediately
+# and pages show cached data. After RAPI_BACKOFF seconds the cluster is probed
+# in the background, and calls resume once it answers.
+RAPI_FAILURE_THRESHOLD = 3
+RAPI_BACKOFF = 30
+
+# Limits on the requests sent to each cluster's RAPI, to avoid overloading
+# ganeti-rapi on the master. At most RAPI_MAX_CONCURRENCY requests are in
+# flight at once, and RAPI_RATE_LIMIT requests per second are sent on
+# average, in bursts of up to RAPI_RATE_BURST. None disables a limit.
+# Requests over a limit queue for up to RAPI_QUEUE_TIMEOUT seconds.
+#
+# The limits apply per process. To share them between all processes on this
+# host, set RAPI_LOCK_DIR to a directory writable by all of them; lock files
+# are kept there.
+RAPI_MAX_CONCURRENCY = 8
+RAPI_RATE_LIMIT = None
+RAPI_RATE_BURST = None
+RAPI_QUEUE_TIMEOUT = 30
+RAPI_LOCK_DIR = None
+
+# Fraction of requests measured by ganeti_web.middleware.PerformanceMiddleware,
+# between 0 and 1. The middleware is only active if it is added, first, to
+# MIDDLEWARE_CLASSES.
+PERF_SAMPLE_RATE = 0.05
+
+# Seconds that rendered fragments of cluster, node and VM pages are cached.
+# Fragments are keyed on version counters which change with the objects
+# shown, so they never go stale. This needs a cache shared by all processes,
+# such as memcached; with the default per-process cache, fragments are only
+# reused by the process which rendered them. 0 disables fragment caching.
+FRAGMENT_CACHE_TIMEOUT = 0
+
+# Seconds that a request for job updates is held open until something
+# changes. Job and VM pages then get updates as they happen instead of
+# polling. Each waiting page keeps a worker busy, so this needs threaded or
+# asynchronous workers, and a cache shared by all processes. 0 makes the
+# pages poll instead.
+JOB_UPDATES_TIMEOUT = 0
+
+# Most rows counted for the totals of VM and job tables. Counting every row
+# of a large table is slow; over this limit, tables show "more than" the
+# limit instead. 0 always counts every row.
+TABLE_COUNT_LIMIT = 0
+
+# RAPI calls made at once to each cluster when acting on a batch of virtual
+# machines, such as starting up a selection of them. Clusters are called in
+# parallel. This should stay below RAPI_MAX_CONCURRENCY.
+BATCH_CONCURRENCY = 4
@@ -0,0 +1,34 @@
+/* Follow the progress of a batch of jobs in #messages.
+ *
+ * data is the response to submitting the batch: its status_url, its
+ * progress so far, and the reason no job was submitted for some objects,
+ * by name. */
+
+// Milliseconds between polls of the status of a batch. This matches the
+// interval of JobPoller in job_status.js.
+var BATCH_POLL_INTERVAL = 3000;
+
+function follow_batch(data) {
+    var messages = $("#messages").empty();
+    $.each(data.errors, function(name, msg) {
+        messages.append($("<li class='error'>").text(name + ": " + msg));
+    });
+    messages.append("<li class='batch'></li>");
+    render_batch(data.progress, data.status_url);
+}
+
+function render_batch(progress, url) {
+    var text = progress.finished + " of " + progress.total + " finished";
+    if (progress.failed) {
+        text += ", " + progress.failed + " not submitted";
+    }
+    $("#messages li.batch").text(text);
+
+    if (!progress.done) {
+        setTimeout(function() {
+            $.getJSON(url, function(progress) {
+                render_batch(progress, url);
+            });
+        }, BATCH_POLL_INTERVAL);
+    }
+}
@@ -36,19 +36,32 @@ function JobPoller() {
     this.SLOW = 60000;
     var get_xhr = undefined;
     var poller;
+    var updates_url;
+    var updates_xhr = undefined;
+    var updates_retry = undefined;
+    var version;
+    var digest;
 
 
-    this.init = function (url, new_cluster, new_callback, new_errback) {
+    // updates_url is optional.  If given, the server is asked to send changes
+    // as they happen instead of being polled at a fixed interval.
+    this.init = function (url, new_cluster, new_callback, new_errback,
+                          new_updates_url) {
         poller = this;
         get_jobs_url = url;
         cluster = new_cluster;
         callback = new_callback==undefined ? $.noop : new_callback;
         errback = new_errback==undefined ? $.noop : new_errback;
+        updates_url = new_updates_url;
     };
 
     // poll for active jobs.  This maintains the list of jobs that are being
     // actively queried for updates.  This will pull in new jobs started elsewhere
     this.poll = function (interval) {
+        if (updates_url != undefined) {
+            wait_for_updates();
+            return;
+        }
         interval = interval==undefined ? poller.SLOW : interval;
         if (get_interval_speed != interval) {
             if (get_interval != undefined) {
@@ -62,6 +75,10 @@ function JobPoller() {
 
     // get list of active jobs
     this.get_jobs = function () {
+        if (updates_url != undefined) {
+            wait_for_updates();
+            return;
+        }
         /* Run the AJAX call. if a call is pending, just skip this one */
         if (get_xhr == undefined) {
             get_xhr = $.ajax({
@@ -104,7 +121,9 @@ function JobPoller() {
             }
         });
 
-        if (data.length==0) {
+        if (updates_url != undefined) {
+            // the next request is sent by wait_for_updates()
+        } else if (data.length==0) {
             poller.poll(poller.SLOW);
         } else {
             poller.poll(poller.FAST);
@@ -112,6 +131,50 @@ function JobPoller() {
     }
 
 
+    // wait for the server to answer with changed jobs, or with a new version
+    // of the object.  The server holds the request until something changes
+    // and says how long to wait before the next one.  Only one request is
+    // open at a time; a new job started from this page wakes it up.
+    function wait_for_updates() {
+        if (updates_xhr != undefined) {
+            return;
+        }
+        if (updates_retry != undefined) {
+            clearTimeout(updates_retry);
+            updates_retry = undefined;
+        }
+
+        var params = {};
+        if (version != undefined) {
+            params = {version: version, digest: digest};
+        }
+        updates_xhr = $.ajax({
+            url: updates_url,
+            data: params,
+            dataType: 'json',
+            cache: false,
+            error: function() {
+                // fall back to polling
+                updates_xhr = undefined;
+                updates_url = undefined;
+                poller.poll(poller.SLOW);
+            },
+            success: function(data) {
+                updates_xhr = undefined;
+                var changed = version != undefined && data.version != version;
+                version = data.version;
+                digest = data.digest;
+                process_get_jobs(data.jobs);
+                // the object changed outside of a job of this page
+                if (changed && data.jobs.length == 0) {
+                    callback();
+                }
+                updates_retry = setTimeout(wait_for_updates, data.retry);
+            }
+        });
+    }
+
+
     function active_op(data) {
         /* Find a sub-operation which has not successfully completed. */
         for (var sub_op = 0; sub_op < data['opstatus'].length; sub_op++) {
@@ -17,16 +17,21 @@
 # USA.
 
 from datetime import datetime
+from hashlib import md5
 import re
 
-from django.db.models import Count
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
 from django.template import Library, Node, TemplateSyntaxError
 from django.template.defaultfilters import stringfilter, filesizeformat
+from django.utils.encoding import smart_str
 from django.utils.safestring import mark_safe
-from django.utils.translation import ugettext_lazy as _
+from django.utils.translation import get_language, ugettext_lazy as _
 
+from ganeti_web.backend.versions import get_versions
 from ganeti_web.constants import NODE_ROLE_MAP
-from ganeti_web.models import Cluster
+from ganeti_web.models import Cluster, VirtualMachine
 from ganeti_web.utilities import hv_prettify
 
 register = Library()
@@ -406,6 +411,79 @@ def format_online_nodes(cluster):
     return "%d/%d" % (online, offline+online)
 
 
+@register.assignment_tag
+def allocated_cpus(cluster, nodes):
+    """
+    Map of node id to the CPUs allocated to running VMs on that node, for
+    the given nodes of a cluster, using one query.
+    """
+    values = VirtualMachine.objects \
+        .filter(cluster=cluster, status='running') \
+        .exclude(virtual_cpus=-1) \
+        .order_by() \
+        .values_list('primary_node') \
+        .annotate(cpus=Sum('virtual_cpus'))
+    cpus = dict((node.pk, 0) for node in nodes)
+    cpus.update(values)
+    return cpus
+
+
+@register.tag
+def cachefragment(parser, token):
+    """
+    Cache a template fragment until the objects it shows change.
+
+    Usage::
+
+        {% cachefragment "name" obj1 [obj2 ...] [vary ...] %}
+            ...
+        {% endcachefragment %}
+
+    Model instances are keyed on their version, see
+    ``ganeti_web.backend.versions``; any other argument, such as a
+    permission, selects a separate variant of the fragment. Fragments are
+    cached for ``FRAGMENT_CACHE_TIMEOUT`` seconds.
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise TemplateSyntaxError("%r tag requires a name and at least one "
+                                  "object" % bits[0])
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    return CacheFragmentNode(nodelist, bits[1],
+                             [parser.compile_filter(b) for b in bits[2:]])
+
+
+class CacheFragmentNode(Node):
+    def __init__(self, nodelist, name, args):
+        self.nodelist = nodelist
+        self.name = name.strip('"\'')
+        self.args = args
+
+    def render(self, context):
+        timeout = settings.FRAGMENT_CACHE_TIMEOUT
+        if not timeout:
+            return self.nodelist.render(context)
+
+        values = [arg.resolve(context) for arg in self.args]
+        objs = [v for v in values if hasattr(v, '_meta')]
+        versions = get_versions(objs)
+        parts = [self.name, get_language() or '']
+        for value in values:
+            if hasattr(value, '_meta'):
+                parts.append('%s:%s:%s' % (value._meta.db_table, value.pk,
+                                           versions.pop(0)))
+            else:
+                parts.append(smart_str(value))
+        key = 'gwm:fragment:%s' % md5('|'.join(parts)).hexdigest()
+
+        content = cache.get(key)
+        if content is None:
+            content = self.nodelist.render(context)
+            cache.set(key, content, timeout)
+        return mark_safe(content)
+
+
 @register.tag
 def get_nics(parser, token):
     try:
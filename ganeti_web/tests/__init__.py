@@ -17,17 +17,28 @@
 
 from ganeti_web.tests.accounts import *
 from ganeti_web.tests.backend import *
+from ganeti_web.tests.batches import *
+from ganeti_web.tests.benchmarks import *
 from ganeti_web.tests.caps import *
 #from ganeti_web.tests.cache_updater import *
 from ganeti_web.tests.cluster_user import *
 from ganeti_web.tests.fields import *
+from ganeti_web.tests.fragments import *
 from ganeti_web.tests.ganeti_errors import *
 from ganeti_web.tests.general import *
+from ganeti_web.tests.health import *
 from ganeti_web.tests.importing import *
 from ganeti_web.tests.importing_nodes import *
 from ganeti_web.tests.job import *
+from ganeti_web.tests.limiter import *
+from ganeti_web.tests.metrics import *
 from ganeti_web.tests.forms import *
 from ganeti_web.tests.models import *
+from ganeti_web.tests.owner_tags import *
+from ganeti_web.tests.perf import *
+from ganeti_web.tests.quotas import *
+from ganeti_web.tests.retention import *
+from ganeti_web.tests.simulator import *
 from ganeti_web.tests.ssh_keys import *
 from ganeti_web.tests.tags import *
 from ganeti_web.tests.utilities import *
@@ -1,18 +1,26 @@
+import cPickle
+from datetime import datetime
+
 from django.contrib.auth.models import AnonymousUser, Group, User
+from django.db import connection
 from django.test import TestCase
 
 from django_test_tools.users import UserTestMixin
 
 from ganeti_web.backend.queries import (
-    cluster_qs_for_user, owner_qs, cluster_vm_qs
+    cluster_qs_for_user, owner_qs, cluster_vm_qs, prefetch_objects
 )
-from ganeti_web.models import Cluster, VirtualMachine
+from ganeti_web.models import (Cluster, GanetiError, Job, Node,
+                               VirtualMachine)
+from ganeti_web.util.proxy import RapiProxy
+from ganeti_web import models
 
 __all__ = (
     "TestClusterQSForUser",
     "TestOwnerQSNoGroups",
     "TestOwnerQSWithGroups",
     "TestClusterVMQS",
+    "TestPrefetchObjects",
 )
 
 
@@ -220,3 +228,74 @@ class TestClusterVMQS(TestCase):
         self.standard.grant('admin', self.vm1)
         self.assertQuerysetEqual(vms, [])
 
+
+class TestPrefetchObjects(TestCase):
+
+    def setUp(self):
+        models.client.GanetiRapiClient = RapiProxy
+        self.cluster = Cluster.objects.create(hostname='cluster.example.org',
+                                              slug='cluster')
+        self.vms = [VirtualMachine.objects.create(
+            cluster=self.cluster, hostname='vm%d.example.org' % i)
+            for i in range(3)]
+        self.node = Node.objects.create(cluster=self.cluster,
+                                        hostname='node.example.org')
+        now = datetime.now()
+        for obj in self.vms + [self.node, self.cluster]:
+            GanetiError.objects.create(cluster=self.cluster, obj=obj,
+                                       msg='error', timestamp=now)
+        # cached, finished jobs, so listing them doesn't refresh them
+        Job.objects.bulk_create([
+            Job(job_id=i, cluster=self.cluster, obj=obj, status='error',
+                cluster_hash=self.cluster.hash, cached=now,
+                serialized_info=cPickle.dumps({'id': i, 'status': 'error'}))
+            for i, obj in enumerate(self.vms + [self.node, self.cluster])])
+
+    def tearDown(self):
+        models.clear_rapi_cache()
+
+    def assertPrefetched(self, records):
+        """
+        One query for the records and one per content type, and no RAPI
+        calls. The cluster is one of the objects, so it isn't queried again.
+        """
+        rapi = self.cluster.rapi
+        rapi.GetInstance.reset()
+        rapi.GetNode.reset()
+        debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        try:
+            del connection.queries[:]
+            records = prefetch_objects(records)
+            self.assertEqual(4, len(connection.queries))
+            del connection.queries[:]
+            names = sorted(r.obj.hostname for r in records)
+            slugs = set(r.obj.cluster.slug for r in records
+                        if not isinstance(r.obj, Cluster))
+            slugs.update(r.cluster.slug for r in records)
+            self.assertEqual([], connection.queries)
+        finally:
+            connection.use_debug_cursor = debug_cursor
+        rapi.GetInstance.assertNotCalled(self)
+        rapi.GetNode.assertNotCalled(self)
+
+        self.assertEqual(sorted([vm.hostname for vm in self.vms]
+                                + [self.node.hostname,
+                                   self.cluster.hostname]), names)
+        self.assertEqual(set(['cluster']), slugs)
+
+    def test_errors(self):
+        self.assertPrefetched(GanetiError.objects.all())
+
+    def test_jobs(self):
+        self.assertPrefetched(Job.objects.all())
+
+    def test_missing_object(self):
+        vm = self.vms[0]
+        job = Job.objects.get(object_id=vm.pk, content_type__model=
+                              'virtualmachine')
+        VirtualMachine.objects.filter(pk=vm.pk).delete()
+        self.assertEqual(None, prefetch_objects([job])[0].obj)
+
+    def test_empty(self):
+        self.assertEqual([], prefetch_objects(Job.objects.none()))
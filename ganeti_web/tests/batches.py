@@ -0,0 +1,393 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+import threading
+import unittest
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from django.utils import simplejson as json
+
+from django_test_tools.users import UserTestMixin
+
+from ganeti_web.backend.batches import power_vms, provision_vms
+from ganeti_web.forms.vm_template import VMInstancesFromTemplate
+from ganeti_web.middleware import DeferredTasksMiddleware
+from ganeti_web.backend import tasks
+from ganeti_web.backend.tasks import defer, parallel
+from ganeti_web.util.client import GanetiApiError
+from ganeti_web.util.proxy import RapiProxy
+from ganeti_web.util.proxy.constants import JOB
+from ganeti_web.util.proxy.response_map import ResponseMap
+from ganeti_web import models
+from ganeti_web.models import owner_tag
+from ganeti_web.tests.views.virtual_machine.base \
+    import VirtualMachineTestCaseMixin
+
+Cluster = models.Cluster
+Job = models.Job
+JobBatch = models.JobBatch
+VirtualMachine = models.VirtualMachine
+VirtualMachineTemplate = models.VirtualMachineTemplate
+
+__all__ = ('TestDefer', 'TestParallel', 'TestPowerBatch', 'TestProvisionBatch')
+
+
+class TestParallel(unittest.TestCase):
+
+    def double(self, n):
+        if n < 0:
+            raise ValueError(n)
+        return n * 2
+
+    def test_results_in_order(self):
+        for concurrency in (1, 3, 10):
+            results = parallel(self.double, range(5), concurrency)
+            self.assertEqual([(0, None), (2, None), (4, None), (6, None),
+                              (8, None)], results)
+
+    def test_exceptions(self):
+        results = parallel(self.double, [1, -1, 2], 2)
+        self.assertEqual((2, None), results[0])
+        self.assertEqual(None, results[1][0])
+        self.assertTrue(isinstance(results[1][1], ValueError))
+        self.assertEqual((4, None), results[2])
+
+    def test_empty(self):
+        self.assertEqual([], parallel(self.double, [], 4))
+
+
+class TestDefer(unittest.TestCase):
+
+    def tearDown(self):
+        tasks.discard()
+
+    @override_settings(TESTING=False)
+    def test_held(self):
+        """
+        Tasks deferred while holding only start when released
+        """
+        calls = []
+        tasks.hold()
+        self.assertEqual(None, defer(calls.append, 1))
+        self.assertEqual([], calls)
+
+        threads = tasks.release()
+        self.assertEqual(1, len(threads))
+        threads[0].join()
+        self.assertEqual([1], calls)
+
+        # no longer holding
+        defer(calls.append, 2).join()
+        self.assertEqual([1, 2], calls)
+
+    @override_settings(TESTING=False)
+    def test_middleware(self):
+        """
+        Tasks deferred by a view start after its response, and are dropped
+        if it raised an exception
+        """
+        dropped = threading.Event()
+        started = threading.Event()
+        middleware = DeferredTasksMiddleware()
+        request = RequestFactory().get('/')
+
+        middleware.process_request(request)
+        defer(dropped.set)
+        middleware.process_exception(request, ValueError())
+        self.assertEqual([], tasks.release())
+
+        middleware.process_request(request)
+        defer(started.set)
+        self.assertFalse(started.is_set())
+        middleware.process_response(request, HttpResponse())
+        self.assertTrue(started.wait(5))
+        self.assertFalse(dropped.is_set())
+
+
+class TestPowerBatch(TestCase, VirtualMachineTestCaseMixin, UserTestMixin):
+
+    def setUp(self):
+        models.client.GanetiRapiClient = RapiProxy
+        self.vm, self.cluster = self.create_virtual_machine()
+        self.vm2, self.cluster = self.create_virtual_machine(
+            self.cluster, 'vm2.example.bak')
+        self.cluster2 = Cluster.objects.create(hostname='test2.example.bak',
+                                               slug='OSL_TEST2')
+        self.vm3 = VirtualMachine.objects.create(cluster=self.cluster2,
+                                                 hostname='vm3.example.bak')
+        self.vms = [self.vm, self.vm2, self.vm3]
+
+        self.rapi = self.cluster.rapi
+        self.rapi.StartupInstance.response = ResponseMap([
+            (((self.vm.hostname,), {}), 11),
+            (((self.vm2.hostname,), {}), 12),
+        ])
+        self.rapi2 = self.cluster2.rapi
+        self.rapi2.StartupInstance.response = 21
+
+        self.create_standard_users()
+        self.create_users(['user'])
+
+    def tearDown(self):
+        models.clear_rapi_cache()
+
+    def post(self, op, vms, user):
+        self.assertTrue(self.client.login(username=user.username,
+                                          password='secret'))
+        return self.client.post(
+            reverse('virtualmachine-batch-power', args=[op]),
+            {'virtual_machines': [vm.pk for vm in vms]})
+
+    def test_power_vms(self):
+        """
+        A job is stored for each VM, with one insert, and tracked by the batch
+        """
+        batch, errors = power_vms(self.superuser, 'startup', self.vms)
+
+        self.assertEqual({}, errors)
+        self.assertEqual(3, batch.total)
+        self.assertEqual(0, batch.failed)
+        self.rapi.StartupInstance.assertCalled(self, self.vm.hostname)
+        self.rapi.StartupInstance.assertCalled(self, self.vm2.hostname)
+        self.rapi2.StartupInstance.assertCalled(self, self.vm3.hostname)
+
+        jobs = dict((job.object_id, job) for job in batch.jobs.all())
+        self.assertEqual(11, jobs[self.vm.pk].job_id)
+        self.assertEqual(12, jobs[self.vm2.pk].job_id)
+        self.assertEqual(21, jobs[self.vm3.pk].job_id)
+        self.assertEqual(self.cluster2.pk, jobs[self.vm3.pk].cluster_id)
+        for vm in self.vms:
+            vm = VirtualMachine.objects.get(pk=vm.pk)
+            self.assertEqual(jobs[vm.pk].pk, vm.last_job_id)
+            self.assertTrue(vm.ignore_cache)
+
+    def test_power_vms_errors(self):
+        """
+        VMs whose job could not be submitted are reported and counted
+        """
+        self.rapi2.ShutdownInstance.error = GanetiApiError('unreachable')
+
+        batch, errors = power_vms(self.superuser, 'shutdown', self.vms)
+
+        self.assertEqual([self.vm3], errors.keys())
+        self.assertTrue('unreachable' in errors[self.vm3])
+        self.assertEqual(3, batch.total)
+        self.assertEqual(1, batch.failed)
+        self.assertEqual(2, batch.jobs.count())
+
+    def test_startup_quota(self):
+        """
+        VMs started earlier in the batch count against the owner's quota
+        """
+        owner = self.user.get_profile()
+        self.cluster.set_quota(owner, dict(ram=200, disk=2000,
+                                           virtual_cpus=10))
+        VirtualMachine.objects.filter(pk__in=[self.vm.pk, self.vm2.pk]) \
+            .update(owner=owner, ram=128, virtual_cpus=1, status='stopped')
+        self.user.grant('power', self.vm)
+        self.user.grant('power', self.vm2)
+        with models.no_refresh():
+            vms = list(VirtualMachine.objects.order_by('pk')
+                       .filter(pk__in=[self.vm.pk, self.vm2.pk])
+                       .select_related('cluster', 'owner'))
+
+        batch, errors = power_vms(self.user, 'startup', vms)
+
+        self.assertEqual([self.vm2], errors.keys())
+        self.assertTrue('RAM' in errors[self.vm2])
+        self.rapi.StartupInstance.assertNotCalled(self, self.vm2.hostname)
+        self.assertEqual(1, batch.failed)
+        self.assertEqual(1, batch.jobs.count())
+
+    def test_progress(self):
+        batch, errors = power_vms(self.superuser, 'reboot', self.vms)
+        progress = batch.progress()
+        self.assertEqual(3, progress['submitted'])
+        self.assertEqual(0, progress['finished'])
+        self.assertFalse(progress['done'])
+
+        # one RAPI query per cluster
+        self.rapi.GetJobStatus.response = JOB
+        self.rapi2.GetJobStatus.response = JOB
+        batch.poll()
+        progress = batch.progress()
+        self.assertEqual(3, progress['finished'])
+        self.assertEqual({'success': 3}, progress['statuses'])
+        self.assertTrue(progress['done'])
+
+    def test_view_batch_power(self):
+        """
+        Only the selected VMs which the user may power are in the batch
+        """
+        self.user.grant('power', self.vm)
+
+        response = self.post('reboot', self.vms, self.user)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('application/json', response['content-type'])
+        data = json.loads(response.content)
+        batch = JobBatch.objects.get(pk=data['batch'])
+        self.assertEqual(self.user, batch.user)
+        self.assertEqual('reboot', batch.op)
+        self.assertEqual([self.vm.pk],
+                         [job.object_id for job in batch.jobs.all()])
+        self.rapi.RebootInstance.assertNotCalled(self, self.vm2.hostname)
+        self.rapi2.RebootInstance.assertNotCalled(self)
+
+        # the batch can be followed by its user
+        response = self.client.get(data['status_url'])
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, json.loads(response.content)['submitted'])
+
+        # ... but not by others
+        self.client.logout()
+        other = User(username='other')
+        other.set_password('secret')
+        other.save()
+        self.assertTrue(self.client.login(username='other',
+                                          password='secret'))
+        response = self.client.get(data['status_url'])
+        self.assertEqual(403, response.status_code)
+
+    def test_view_batch_power_denied(self):
+        url = reverse('virtualmachine-batch-power', args=['startup'])
+
+        # anonymous user
+        response = self.client.post(url, {'virtual_machines': self.vm.pk})
+        self.assertEqual(302, response.status_code)
+
+        # unauthorized user
+        response = self.post('startup', self.vms, self.user)
+        self.assertEqual(403, response.status_code)
+        self.assertEqual(0, JobBatch.objects.count())
+
+        # nothing selected
+        response = self.post('startup', [], self.superuser)
+        self.assertEqual(400, response.status_code)
+
+        # not a POST
+        response = self.client.get(url)
+        self.assertEqual(405, response.status_code)
+
+
+class TestProvisionBatch(TestCase, VirtualMachineTestCaseMixin, UserTestMixin):
+
+    def setUp(self):
+        models.client.GanetiRapiClient = RapiProxy
+        self.vm, self.cluster = self.create_virtual_machine()
+        self.template = VirtualMachineTemplate(template_name='worker',
+                                               cluster=self.cluster,
+                                               memory=256, vcpus=2,
+                                               disk_template='plain')
+        self.template.disks = [{'size': 1000}]
+        self.template.nics = [{'mode': 'bridged', 'link': 'br0'}]
+        self.template.save()
+        self.template = VirtualMachineTemplate.objects.get(pk=self.template.pk)
+
+        self.rapi = self.cluster.rapi
+        self.rapi.CreateInstance.response = 100
+
+        self.create_standard_users()
+        self.create_users(['user'])
+        self.owner = self.user.get_profile()
+
+    def tearDown(self):
+        models.clear_rapi_cache()
+
+    def form(self, user=None, **data):
+        data.setdefault('owner', self.owner.pk)
+        return VMInstancesFromTemplate(self.template, user or self.superuser,
+                                       data)
+
+    def test_provision_vms(self):
+        names = ['web1.example.bak', 'web2.example.bak', 'web3.example.bak']
+        batch, errors = provision_vms(self.superuser, self.template, names,
+                                      self.owner)
+
+        self.assertEqual({}, errors)
+        self.assertEqual('create', batch.op)
+        self.assertEqual(3, batch.total)
+        calls = self.rapi.CreateInstance.calls
+        self.assertEqual(sorted(names), sorted(args[1] for args, kw in calls))
+        # saved templates use the default hypervisor of their cluster
+        self.assertEqual('kvm', calls[0][1]['hypervisor'])
+        # new instances are tagged with their owner when they are created
+        self.assertEqual([owner_tag(self.owner.pk)], calls[0][1]['tags'])
+
+        with models.no_refresh():
+            vms = list(VirtualMachine.objects.filter(hostname__in=names))
+        self.assertEqual(3, len(vms))
+        jobs = dict((job.object_id, job.pk) for job in batch.jobs.all())
+        for vm in vms:
+            self.assertEqual(self.owner.pk, vm.owner_id)
+            self.assertEqual(256, vm.ram)
+            self.assertEqual(1000, vm.disk_size)
+            self.assertEqual(jobs[vm.pk], vm.last_job_id)
+            self.assertTrue(self.user.has_perm('admin', vm))
+
+    def test_provision_vms_errors(self):
+        self.rapi.CreateInstance.error = GanetiApiError('no space')
+        batch, errors = provision_vms(self.superuser, self.template,
+                                      ['web1.example.bak'], self.owner)
+
+        self.assertEqual(['web1.example.bak'], errors.keys())
+        self.assertEqual(1, batch.failed)
+        self.assertFalse(VirtualMachine.objects
+                         .filter(hostname='web1.example.bak').exists())
+
+    def test_form_pattern(self):
+        form = self.form(pattern='Web{n:02}.example.bak', count=3)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(['web01.example.bak', 'web02.example.bak',
+                          'web03.example.bak'], form.cleaned_data['names'])
+
+        form = self.form(hostnames='a.example.bak\n\n b.example.bak \n')
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(['a.example.bak', 'b.example.bak'],
+                         form.cleaned_data['names'])
+
+    def test_form_invalid(self):
+        self.assertFalse(self.form().is_valid())
+        self.assertFalse(self.form(pattern='web.example.bak',
+                                   count=2).is_valid())
+        self.assertFalse(self.form(pattern='web{n}', count=2,
+                                   hostnames='a').is_valid())
+        self.assertFalse(self.form(hostnames='a\na').is_valid())
+
+        form = self.form(hostnames='new.example.bak\n%s' % self.vm.hostname)
+        self.assertFalse(form.is_valid())
+        self.assertTrue(self.vm.hostname in unicode(form.errors))
+
+    def test_form_quota(self):
+        """
+        The quota is checked once, for all of the new VMs together
+        """
+        self.cluster.set_quota(self.owner, dict(ram=600, disk=10000,
+                                                virtual_cpus=10))
+        self.assertTrue(self.form(self.user, pattern='web{n}',
+                                  count=2).is_valid())
+
+        form = self.form(self.user, pattern='web{n}', count=3)
+        self.assertFalse(form.is_valid())
+        self.assertTrue('RAM' in unicode(form.errors))
+
+        # superusers aren't limited
+        self.assertTrue(self.form(pattern='web{n}', count=3).is_valid())
@@ -0,0 +1,284 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Page benchmarks.
+
+The main pages are requested against a seeded database, and the number of
+SQL queries, the number of RAPI calls and the wall time of each request are
+compared with the baselines stored in ``benchmarks.json``. A page using more
+queries or RAPI calls than its baseline fails the test.
+
+The ``small`` scale runs with the rest of the test suite and only checks
+counts. Other scales are selected with the ``GWM_BENCHMARK`` environment
+variable, and also check wall time::
+
+    GWM_BENCHMARK=large ./manage.py test ganeti_web.PageBenchmark
+
+Set ``GWM_BENCHMARK_UPDATE=1`` to write the measured numbers as the new
+baselines instead of comparing against them.
+"""
+
+import copy
+import cPickle
+from datetime import datetime
+import os
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.utils import simplejson as json
+
+from ganeti_web.backend.importing import build_virtual_machine
+from ganeti_web.util.proxy import CallProxy, RapiProxy
+from ganeti_web.util.proxy.constants import INSTANCE, NODE
+from ganeti_web import models
+
+Cluster = models.Cluster
+GanetiError = models.GanetiError
+Job = models.Job
+Node = models.Node
+VirtualMachine = models.VirtualMachine
+
+__all__ = ('PageBenchmark',)
+
+BASELINES = os.path.join(os.path.dirname(__file__), 'benchmarks.json')
+
+# per cluster counts, except users and groups
+SCALES = {
+    'small': dict(clusters=2, nodes=4, vms=20, users=5, groups=2, errors=5,
+                  jobs=5),
+    'large': dict(clusters=5, nodes=50, vms=2000, users=200, groups=20,
+                  errors=200, jobs=100),
+}
+
+# a page may take this many times its baseline wall time
+TIME_TOLERANCE = 2.0
+
+# requests per page; the first one warms up caches and isn't measured
+RUNS = 4
+
+
+def rapi_calls():
+    """
+    Total calls made through all cached RapiProxy clients.
+    """
+    total = 0
+    for rapi in models.RAPI_CACHE.values():
+        for value in vars(rapi).values():
+            if isinstance(value, CallProxy):
+                total += len(value.calls)
+    return total
+
+
+class PageBenchmark(TestCase):
+
+    def setUp(self):
+        models.client.GanetiRapiClient = RapiProxy
+        self.scale = os.environ.get('GWM_BENCHMARK', 'small')
+        self.update = bool(os.environ.get('GWM_BENCHMARK_UPDATE'))
+        self.seed(**SCALES[self.scale])
+
+    def tearDown(self):
+        models.clear_rapi_cache()
+
+    def seed(self, clusters, nodes, vms, users, groups, errors, jobs):
+        now = datetime.now()
+
+        self.admin = User.objects.create_superuser(
+            'benchmark-admin', 'admin@example.test', 'secret')
+        self.users = []
+        for i in xrange(users):
+            user = User(username='user%d' % i)
+            user.set_password('secret')
+            user.save()
+            self.users.append(user)
+        self.user = self.users[0]
+
+        self.groups = []
+        for i in xrange(groups):
+            group = Group.objects.create(name='group%d' % i)
+            group.user_set.add(*self.users[i::groups])
+            self.groups.append(group)
+        owners = [u.get_profile() for u in self.users] \
+            + [g.organization for g in self.groups]
+
+        self.clusters = []
+        for i in xrange(clusters):
+            cluster = Cluster.objects.create(
+                hostname='cluster%d.example.test' % i, slug='cluster%d' % i)
+            self.clusters.append(cluster)
+
+            node_list = []
+            for n in xrange(nodes):
+                info = dict(NODE, name='node%d.%s' % (n, cluster.hostname))
+                node = Node(cluster=cluster, hostname=info['name'],
+                            cluster_hash=cluster.hash, cached=now,
+                            serialized_info=cPickle.dumps(info))
+                for k, v in Node.parse_persistent_info(info).items():
+                    setattr(node, k, v)
+                node_list.append(node)
+            Node.objects.bulk_create(node_list)
+            node_ids = dict(cluster.nodes.values_list('hostname', 'id'))
+            node_names = sorted(node_ids)
+
+            instances = []
+            for v in xrange(vms):
+                info = copy.deepcopy(INSTANCE)
+                info.update(name='vm%d.%s' % (v, cluster.hostname),
+                            pnode=node_names[v % nodes])
+                instances.append(build_virtual_machine(
+                    cluster, info, owners[v % len(owners)], node_ids, now))
+            VirtualMachine.objects.bulk_create(instances)
+
+            # every user gets some permissions on the first clusters, and
+            # on the VMs they don't own
+            for n, user in enumerate(self.users):
+                if n % clusters == i:
+                    user.grant('create_vm', cluster)
+            self.groups[i % groups].grant('admin', cluster)
+            vm_qs = cluster.virtual_machines.order_by('pk')
+            for n, vm in enumerate(vm_qs[:len(self.users)]):
+                self.users[n].grant('power', vm)
+
+            GanetiError.objects.bulk_create([
+                GanetiError(cluster=cluster, obj=vm, msg='error %d' % e,
+                            code=500, timestamp=now)
+                for e, vm in enumerate(vm_qs[:errors])])
+
+            Job.objects.bulk_create([
+                Job(job_id=j + 1, cluster=cluster, obj=vm, status='running',
+                    cluster_hash=cluster.hash, cached=now,
+                    serialized_info=cPickle.dumps({'id': j + 1,
+                                                   'status': 'running'}))
+                for j, vm in enumerate(vm_qs[:jobs])])
+
+    def pages(self):
+        cluster = self.clusters[0]
+        vm = cluster.virtual_machines.order_by('pk')[0]
+        return [
+            ('overview', reverse('overview')),
+            ('vm_list', reverse('virtualmachine-list')),
+            ('cluster_list', reverse('cluster-list')),
+            ('nodes', reverse('cluster-nodes', args=[cluster.slug])),
+            ('errors', reverse('cluster-errors')),
+            ('ssh_keys', reverse('key-list', args=[settings.WEB_MGR_API_KEY])),
+            ('search_suggestions',
+             reverse('search-suggestions') + '?term=vm1'),
+            ('cluster_job_status',
+             reverse('cluster-job-status', args=[cluster.pk])),
+            ('vm_job_status', reverse('instance-job-status', args=[vm.pk])),
+        ]
+
+    def measure(self, url):
+        """
+        Request ``url`` RUNS times, sending back the ETag of the previous
+        response like a browser.
+
+        @return (queries, rapi calls, seconds) of the last request, with the
+                fastest time of all measured requests
+        """
+        debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        times = []
+        headers = {}
+        try:
+            for i in xrange(RUNS):
+                del connection.queries[:]
+                calls = rapi_calls()
+                start = time.time()
+                response = self.client.get(url, **headers)
+                elapsed = time.time() - start
+                self.assertTrue(response.status_code in (200, 304, 403),
+                                "%s returned %s" % (url,
+                                                    response.status_code))
+                # revalidate like a browser would
+                if response.has_header('ETag'):
+                    headers['HTTP_IF_NONE_MATCH'] = response['ETag']
+                if i:
+                    times.append(elapsed)
+            return (len(connection.queries), rapi_calls() - calls,
+                    min(times))
+        finally:
+            connection.use_debug_cursor = debug_cursor
+
+    def test_pages(self):
+        results = {}
+        for user in (self.admin, self.user):
+            self.client.login(username=user.username, password='secret')
+            role = 'admin' if user.is_superuser else 'user'
+            for name, url in self.pages():
+                queries, calls, seconds = self.measure(url)
+                results['%s/%s' % (name, role)] = {
+                    'queries': queries,
+                    'rapi': calls,
+                    'time': round(seconds, 4),
+                }
+            self.client.logout()
+
+        try:
+            with open(BASELINES) as f:
+                baselines = json.load(f)
+        except IOError:
+            baselines = {}
+
+        if self.update:
+            baselines[self.scale] = results
+            with open(BASELINES, 'w') as f:
+                json.dump(baselines, f, indent=4, sort_keys=True)
+                f.write('\n')
+            return
+
+        self.compare(results, baselines.get(self.scale, {}))
+
+    def compare(self, results, baselines):
+        check_time = self.scale != 'small'
+        lines = []
+        failed = False
+        for page in sorted(results):
+            result = results[page]
+            baseline = baselines.get(page)
+            if baseline is None:
+                lines.append('%-32s no baseline' % page)
+                failed = True
+                continue
+
+            problems = []
+            for key in ('queries', 'rapi'):
+                if result[key] > baseline[key]:
+                    problems.append('%s %d > %d' % (key, result[key],
+                                                    baseline[key]))
+            if check_time and \
+                    result['time'] > baseline['time'] * TIME_TOLERANCE:
+                problems.append('time %.3fs > %.3fs' % (result['time'],
+                                                         baseline['time']))
+            failed = failed or bool(problems)
+            lines.append('%-32s %4d queries %4d rapi %8.3fs  %s' % (
+                page, result['queries'], result['rapi'], result['time'],
+                ', '.join(problems) or 'ok'))
+
+        report = '\n'.join(lines)
+        if check_time:
+            sys.stderr.write('\n%s\n' % report)
+        if failed:
+            self.fail('Pages slower than their %s baselines (set '
+                      'GWM_BENCHMARK_UPDATE=1 to accept):\n%s'
+                      % (self.scale, report))
@@ -0,0 +1,189 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.template import Context, Template
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from ganeti_web.backend.tags import set_owner
+from ganeti_web.backend.versions import get_versions
+from ganeti_web.util.proxy import RapiProxy
+from ganeti_web.util.proxy.constants import INSTANCE
+from ganeti_web import models
+
+Cluster = models.Cluster
+ClusterUser = models.ClusterUser
+Node = models.Node
+VirtualMachine = models.VirtualMachine
+
+__all__ = ('TestFragmentCache', 'TestVersions')
+
+
+class TestVersions(TestCase):
+
+    def setUp(self):
+        models.client.GanetiRapiClient = RapiProxy
+        cache.clear()
+        self.cluster = Cluster.objects.create(hostname='test.example.test',
+                                              slug='test')
+        self.node = Node.objects.create(cluster=self.cluster,
+                                        hostname='node.example.test')
+        self.vm = VirtualMachine.objects.create(cluster=self.cluster,
+                                                hostname='vm.example.test')
+
+    def tearDown(self):
+        models.clear_rapi_cache()
+
+    def versions(self):
+        return get_versions([self.cluster, self.node, self.vm])
+
+    def test_stable(self):
+        self.assertEqual(self.versions(), self.versions())
+
+    def test_save(self):
+        """
+        Saving an object bumps it and its cluster, but not its siblings
+        """
+        cluster, node, vm = self.versions()
+        self.vm.save()
+        self.assertEqual([cluster + 1, node, vm + 1], self.versions())
+
+        self.node.save()
+        self.assertEqual([cluster + 2, node + 1, vm + 1], self.versions())
+
+        self.cluster.save()
+        self.assertEqual([cluster + 3, node + 1, vm + 1], self.versions())
+
+    def test_delete(self):
+        cluster = get_versions([self.cluster])[0]
+        self.vm.delete()
+        self.assertEqual(cluster + 1, get_versions([self.cluster])[0])
+
+    def test_evicted(self):
+        """
+        Evicted versions come back higher, not at a reused value
+        """
+        cluster = get_versions([self.cluster])[0]
+        cache.clear()
+        self.assertTrue(get_versions([self.cluster])[0] >= cluster)
+
+    def test_refresh_runtime_change(self):
+        """
+        Runtime changes saved without a full save() still bump the version
+        """
+        self.vm.refresh()
+        before = self.versions()
+        self.vm.refresh()
+        self.assertEqual(before, self.versions())
+
+        self.vm.rapi.GetInstance.response = dict(INSTANCE,
+                                                 status='ADMIN_down')
+        try:
+            self.vm.refresh()
+        finally:
+            self.vm.rapi.GetInstance.response = INSTANCE
+        cluster, node, vm = self.versions()
+        self.assertTrue(vm > before[2])
+        self.assertTrue(cluster > before[0])
+
+    def test_set_owner(self):
+        before = self.versions()
+        owner = ClusterUser.objects.create(name='owner')
+        set_owner(VirtualMachine.objects.filter(pk=self.vm.pk), owner)
+        cluster, node, vm = self.versions()
+        self.assertEqual(before[2] + 1, vm)
+        self.assertTrue(cluster > before[0])
+
+
+class TestFragmentCache(TestCase):
+
+    template = Template('{% load webmgr_tags %}'
+                        '{% cachefragment "test" cluster admin %}'
+                        '{{ cluster.description }}:{{ admin }}'
+                        '{% endcachefragment %}')
+
+    def setUp(self):
+        models.client.GanetiRapiClient = RapiProxy
+        cache.clear()
+        self.cluster = Cluster.objects.create(hostname='test.example.test',
+                                              slug='test', description='a')
+
+    def tearDown(self):
+        models.clear_rapi_cache()
+
+    def render(self, description=None, admin=True):
+        if description is not None:
+            self.cluster.description = description
+        return self.template.render(Context({'cluster': self.cluster,
+                                             'admin': admin}))
+
+    @override_settings(FRAGMENT_CACHE_TIMEOUT=60)
+    def test_cached(self):
+        """
+        Fragments are reused until the object's version changes
+
+        Verifies:
+            * unchanged objects are served from the cache
+            * permission variants are cached separately
+            * saving the object invalidates the fragment
+        """
+        self.assertEqual('a:True', self.render())
+        # not saved, so the cached fragment is still used
+        self.assertEqual('a:True', self.render('b'))
+        self.assertEqual('b:False', self.render(admin=False))
+
+        self.cluster.save()
+        self.assertEqual('b:True', self.render())
+
+    @override_settings(FRAGMENT_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        self.assertEqual('a:True', self.render())
+        self.assertEqual('b:True', self.render('b'))
+
+    @override_settings(FRAGMENT_CACHE_TIMEOUT=60)
+    def test_nodes_view(self):
+        """
+        The node list of a cluster is served from the cache, and updated
+        when a VM on the cluster changes
+        """
+        user = User.objects.create_superuser('admin', 'admin@example.test',
+                                             'secret')
+        self.client.login(username=user.username, password='secret')
+        node = Node.objects.create(cluster=self.cluster,
+                                   hostname='node.example.test')
+        vm = VirtualMachine.objects.create(cluster=self.cluster,
+                                           hostname='vm.example.test',
+                                           primary_node=node,
+                                           status='running', virtual_cpus=3)
+        url = reverse('cluster-nodes', args=[self.cluster.slug])
+
+        # the first request refreshes the node from Ganeti, which bumps the
+        # cluster again
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        self.assertContains(response, 'node.example.test')
+        self.assertContains(response, '<td>3 / 3</td>')
+
+        VirtualMachine.objects.filter(pk=vm.pk).update(virtual_cpus=5)
+        self.assertContains(self.client.get(url), '<td>3 / 3</td>')
+        vm.virtual_cpus = 5
+        vm.save()
+        self.assertContains(self.client.get(url), '<td>5 / 3</td>')
@@ -28,8 +28,10 @@ from ganeti_web import models
 VirtualMachine = models.VirtualMachine
 Cluster = models.Cluster
 GanetiError = models.GanetiError
+GanetiErrorRecorder = models.GanetiErrorRecorder
 
-__all__ = ('TestGanetiErrorModel', 'TestErrorViews')
+__all__ = ('TestGanetiErrorModel', 'TestGanetiErrorRecorder',
+           'TestErrorViews')
 
 
 class TestGanetiErrorBase():
@@ -325,6 +327,116 @@ class TestGanetiErrorModel(TestGanetiErrorBase, TestCase):
             self.assertEqual(None, i.error)
 
 
+class TestGanetiErrorRecorder(TestGanetiErrorBase, TestCase):
+    """
+    Tests for recording errors in bulk.
+    """
+
+    def setUp(self):
+        super(TestGanetiErrorRecorder, self).setUp()
+        self.cluster = self.create_model(Cluster, hostname="test0",
+                                         slug="OSL_TEST0")
+        self.vm0 = self.create_model(VirtualMachine, cluster=self.cluster,
+                                     hostname="vm0.test.org")
+        self.vm1 = self.create_model(VirtualMachine, cluster=self.cluster,
+                                     hostname="vm1.test.org")
+
+    def test_dedupe(self):
+        """
+        Duplicate errors are only stored once, including errors which
+        already exist in the database.
+        """
+        GanetiError.store_error("broken", obj=self.vm0, code=500)
+
+        with GanetiErrorRecorder() as recorder:
+            for i in range(3):
+                recorder.store_error("broken", obj=self.vm0, code=500)
+                recorder.store_error("broken", obj=self.vm1, code=500)
+            self.assertEqual(1, GanetiError.objects.count())
+
+        self.assertEqual(1, len(GanetiError.objects.get_errors(obj=self.vm0)))
+        self.assertEqual(1, len(GanetiError.objects.get_errors(obj=self.vm1)))
+
+    def test_specified_code_values(self):
+        """
+        401s move to the cluster, and 404s are suppressed when the cluster
+        has the same 404.
+        """
+        with GanetiErrorRecorder() as recorder:
+            recorder.store_error("denied", obj=self.vm0, code=401)
+            recorder.store_error("missing", obj=self.cluster, code=404)
+            recorder.store_error("missing", obj=self.vm0, code=404)
+            recorder.store_error("gone", obj=self.vm1, code=404)
+
+        errors = GanetiError.objects.get_errors(obj=self.cluster)
+        self.assertEqual(3, len(errors))
+        self.assertEqual(0, len(GanetiError.objects.get_errors(obj=self.vm0)))
+        self.assertEqual(1, len(GanetiError.objects.get_errors(obj=self.vm1)))
+
+    def test_401_without_cluster(self):
+        """
+        A 401 is moved to the cluster without loading it.
+        """
+        recorder = GanetiErrorRecorder()
+        # warm the content type cache
+        recorder.store_error("denied", obj=self.cluster, code=401)
+        with models.no_refresh():
+            vm = VirtualMachine.objects.get(pk=self.vm0.pk)
+
+        self.assertNumQueries(0, recorder.store_error, "denied", obj=vm,
+                              code=401)
+        recorder.flush()
+        self.assertEqual(1, len(GanetiError.objects.get_errors(
+            obj=self.cluster)))
+
+    def test_query_count(self):
+        """
+        Flushing costs a fixed number of queries.
+        """
+        recorder = GanetiErrorRecorder()
+        for vm in (self.vm0, self.vm1):
+            for i in range(5):
+                recorder.store_error("error %d" % i, obj=vm, code=500)
+
+        # one query for existing errors, one insert
+        self.assertNumQueries(2, recorder.flush)
+        self.assertEqual(10, GanetiError.objects.count())
+
+    def test_clear_errors(self):
+        """
+        Clearing is applied in bulk.
+        """
+        GanetiError.store_error("broken", obj=self.vm0, code=500)
+        GanetiError.store_error("broken", obj=self.vm1, code=500)
+
+        with GanetiErrorRecorder() as recorder:
+            recorder.clear_errors(self.vm0)
+            recorder.clear_errors(self.vm1)
+
+        self.assertFalse(GanetiError.objects.filter(cleared=False).exists())
+
+    def test_refresh(self):
+        """
+        Errors raised while refreshing are collected by the active recorder.
+        """
+        RapiProxy.error = client.GanetiApiError("Simulating an error", 777)
+
+        with GanetiErrorRecorder():
+            self.vm0.refresh()
+            self.vm1.refresh()
+            self.assertFalse(GanetiError.objects.exists())
+
+        self.assertEqual(2, GanetiError.objects.count())
+
+        RapiProxy.error = None
+        with GanetiErrorRecorder():
+            self.vm0.refresh()
+
+        errors = GanetiError.objects.filter(cleared=False)
+        self.assertEqual(1, len(errors.get_errors(obj=self.vm1)))
+        self.assertEqual(0, len(errors.get_errors(obj=self.vm0)))
+
+
 class TestErrorViews(TestGanetiErrorBase, TestCase):
 
     def setUp(self):
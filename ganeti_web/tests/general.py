@@ -20,6 +20,7 @@ from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User, Group
 from django.test import TestCase
 from django.test.client import Client
+from django.test.utils import override_settings
 # Per #6579, do not change this import without discussion.
 from django.utils import simplejson as json
 
@@ -35,7 +36,7 @@ VirtualMachine = models.VirtualMachine
 Job = models.Job
 
 
-__all__ = ('TestGeneralViews', 'TestOverviewVMSummary')
+__all__ = ('TestGeneralViews', 'TestOverviewVMSummary', 'TestExport')
 
 
 class TestGeneralViews(TestCase, ViewTestMixin):
@@ -214,6 +215,44 @@ class TestGeneralViews(TestCase, ViewTestMixin):
         self.assertEqual(mimetype, response['content-type'])
         self.assertTemplateUsed(response, template)
 
+    def test_used_resources_etag(self):
+        """
+        Unchanged resources are answered with 304 Not Modified
+
+        Verifies:
+            * the response has an ETag
+            * the same ETag is answered with 304
+            * a new VM or quota changes the ETag
+            * unauthorized users still get 403
+        """
+        url = reverse('used_resources')
+        args = {'id': user.get_profile().pk}
+        self.assertTrue(c.login(username=user.username, password='secret'))
+
+        response = c.get(url, args)
+        self.assertEqual(200, response.status_code)
+        etag = response['ETag']
+        response = c.get(url, args, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual('', response.content)
+
+        VirtualMachine.objects.create(hostname='vm2.example.bak',
+                                      cluster=cluster,
+                                      owner=user.get_profile())
+        response = c.get(url, args, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        etag = response['ETag']
+
+        user.grant('create_vm', cluster)
+        cluster.set_quota(user.get_profile(), dict(ram=1, disk=2,
+                                                   virtual_cpus=3))
+        response = c.get(url, args, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+
+        self.assertTrue(c.login(username=user1.username, password='secret'))
+        response = c.get(url, args, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(403, response.status_code)
+
     def test_view_ssh_keys(self):
         """ tests retrieving all sshkeys from the gwm instance """
 
@@ -330,3 +369,87 @@ class TestOverviewVMSummary(TestCase):
             }
         }
         self.assertEqual(vm_summary, expected_summary)
+
+
+class TestExport(TestCase):
+
+    def setUp(self):
+        models.client.GanetiRapiClient = RapiProxy
+        self.cluster = Cluster.objects.create(hostname='test.example.test',
+                                              slug='OSL_TEST')
+        self.other = Cluster.objects.create(hostname='other.example.test',
+                                            slug='other')
+        self.node = models.Node.objects.create(
+            cluster=self.cluster, hostname='node1.example.test',
+            ram_total=4096)
+        models.Node.objects.create(cluster=self.other,
+                                   hostname='node2.example.test')
+        self.vms = [VirtualMachine.objects.create(
+            cluster=self.cluster, hostname='vm%d.example.test' % i, ram=512,
+            primary_node=self.node) for i in range(5)]
+        VirtualMachine.objects.create(cluster=self.other,
+                                      hostname='hidden.example.test')
+
+        self.user = User.objects.create_user('tester', 'a@b.test', 'secret')
+        self.user.grant('admin', self.cluster)
+        self.vms[0].owner = self.user.get_profile()
+        self.vms[0].save()
+        self.client.login(username='tester', password='secret')
+
+    def tearDown(self):
+        models.clear_rapi_cache()
+
+    def export(self, kind, format):
+        url = reverse('export', args=[kind, format])
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        return response
+
+    def test_anonymous(self):
+        self.client.logout()
+        url = reverse('export', args=['virtual_machines', 'csv'])
+        response = self.client.get(url)
+        self.assertEqual(302, response.status_code)
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_vms_csv(self):
+        response = self.export('virtual_machines', 'csv')
+        self.assertEqual('text/csv', response['Content-Type'])
+        self.assertTrue(response._base_content_is_iter)
+        lines = response.content.splitlines()
+        self.assertEqual('hostname,cluster,owner,node,ram,disk,vcpus,'
+                         'status,os', lines[0])
+        self.assertEqual(6, len(lines))
+        self.assertEqual('vm0.example.test,test.example.test,tester,'
+                         'node1.example.test,512,-1,-1,,', lines[1])
+        self.assertFalse('hidden' in response.content)
+
+    def test_vms_json(self):
+        response = self.export('virtual_machines', 'ndjson')
+        rows = [json.loads(line) for line in response.content.splitlines()]
+        self.assertEqual(sorted(vm.hostname for vm in self.vms),
+                         [row['hostname'] for row in rows])
+        self.assertEqual(None, rows[1]['owner'])
+        self.assertEqual(512, rows[1]['ram'])
+
+    def test_no_instances(self):
+        """
+        Exporting reads values only, so no VM is refreshed from Ganeti
+        """
+        rapi = self.cluster.rapi
+        rapi.GetInstance.reset()
+        self.export('virtual_machines', 'csv').content
+        rapi.GetInstance.assertNotCalled(self)
+
+    def test_nodes(self):
+        lines = self.export('nodes', 'csv').content.splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertTrue(lines[1].startswith('node1.example.test,'
+                                            'test.example.test,'))
+
+    def test_clusters(self):
+        response = self.export('clusters', 'ndjson')
+        rows = [json.loads(line) for line in response.content.splitlines()]
+        self.assertEqual([{'hostname': 'test.example.test',
+                           'slug': 'OSL_TEST', 'description': '',
+                           'port': 5080}], rows)
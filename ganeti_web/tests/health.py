@@ -0,0 +1,142 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+from django.test import TestCase
+
+from ganeti_web.util.client import GanetiApiError, GanetiRapiClient
+from ganeti_web.util.health import CircuitBreaker, CLOSED, OPEN, PROBING
+from ganeti_web.util.proxy import RapiProxy
+from ganeti_web import models
+from ganeti_web.tests.views.virtual_machine.base \
+    import VirtualMachineTestCaseMixin
+
+Cluster = models.Cluster
+VirtualMachine = models.VirtualMachine
+
+__all__ = ('TestCircuitBreaker', 'TestClusterHealth')
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.breaker = CircuitBreaker(threshold=2, backoff=10,
+                                      clock=self.clock)
+
+    def test_opens_after_threshold(self):
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+
+    def test_success_resets_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.healthy)
+
+    def test_trial_request_after_backoff(self):
+        """
+        Without a probe, one request is let through after the backoff.
+        """
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.now += 10
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(PROBING, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+
+        # a failed trial opens the breaker again right away
+        self.breaker.record_failure()
+        self.assertEqual(OPEN, self.breaker.state)
+        self.assertEqual(1020, self.breaker.retry_at)
+
+    def probe_breaker(self, probe):
+        self.breaker.probe = probe
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.now += 10
+        self.assertFalse(self.breaker.allow())
+        self.breaker.probe_thread.join()
+
+    def test_probe_success(self):
+        probed = []
+        self.probe_breaker(lambda: probed.append(True))
+        self.assertEqual([True], probed)
+        self.assertEqual(CLOSED, self.breaker.state)
+        self.assertTrue(self.breaker.allow())
+
+    def test_probe_failure(self):
+        def probe():
+            raise GanetiApiError("down")
+        self.probe_breaker(probe)
+        self.assertEqual(OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+
+    def test_client_fails_fast(self):
+        """
+        An open breaker stops the client before it touches the network.
+        """
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        rapi = GanetiRapiClient("ganeti.invalid", breaker=self.breaker)
+        self.assertRaises(GanetiApiError, rapi.GetVersion)
+        self.assertEqual(2, self.breaker.failures)
+
+
+class TestClusterHealth(TestCase, VirtualMachineTestCaseMixin):
+
+    def setUp(self):
+        models.client.GanetiRapiClient = RapiProxy
+        self.vm, self.cluster = self.create_virtual_machine()
+
+    def tearDown(self):
+        models.clear_rapi_cache()
+        VirtualMachine.objects.all().delete()
+        Cluster.objects.all().delete()
+
+    def test_get_rapi_breaker(self):
+        rapi = self.cluster.rapi
+        breaker = models.get_breaker(self.cluster.id)
+        self.assertTrue(rapi.breaker is breaker)
+        self.assertEqual(rapi.CheckHealth, breaker.probe)
+
+    def test_unavailable_uses_cache(self):
+        """
+        Objects of an unavailable cluster load from the cache without
+        refreshing.
+        """
+        self.cluster.rapi
+        breaker = models.get_breaker(self.cluster.id)
+        for i in range(breaker.threshold):
+            breaker.record_failure()
+        self.assertFalse(self.cluster.cluster_available)
+
+        self.cluster.rapi.GetInstance.reset()
+        vm = VirtualMachine.objects.get(pk=self.vm.pk)
+        vm.rapi.GetInstance.assertNotCalled(self)
+        self.assertEqual(models.UNAVAILABLE_MSG, vm.error)
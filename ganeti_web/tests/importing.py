@@ -16,18 +16,39 @@
 # USA.
 
 
+from StringIO import StringIO
+
 from django.contrib.auth.models import User, Group
+from django.core.management import call_command
 from django.test import TestCase
 from django.test.client import Client
 
+from ganeti_web.backend.importing import import_virtual_machines
+from ganeti_web.util.client import GanetiApiError
 from ganeti_web.util.proxy import RapiProxy, CallProxy
+from ganeti_web.util.proxy.constants import INSTANCE
+from ganeti_web.util.proxy.response_map import ResponseMap
 from ganeti_web import models
 Cluster = models.Cluster
+Node = models.Node
 VirtualMachine = models.VirtualMachine
 Organization = models.Organization
 Profile = models.Profile
 
-__all__ = ('ImportViews', )
+__all__ = ('ImportViews', 'TestImportVirtualMachines')
+
+
+def instances_map(hostnames):
+    """
+    Build a GetInstances response for the given hostnames, for both plain
+    and bulk calls.
+    """
+    bulk = [dict(INSTANCE, name=hostname) for hostname in hostnames]
+    return ResponseMap([
+        (((), {}), hostnames),
+        (((), {'bulk': False}), hostnames),
+        (((), {'bulk': True}), bulk),
+    ])
 
 
 class ImportViews(TestCase):
@@ -146,14 +167,16 @@ class ImportViews(TestCase):
         self.assertTemplateUsed(response, 'ganeti/importing/orphans.html')
         self.assertFalse(response.context['form'].errors)
         self.assertEqual([], response.context['vms'])
+        self.assertEqual(1, self.owner.virtual_machines
+                         .filter(pk=self.vm0.pk).count())
 
     def test_missing_ganeti(self):
         """
         Tests view for Virtual Machines missing from ganeti
         """
         url = '/import/missing/'
-        self.cluster0.rapi.GetInstances.response = ['vm0', 'vm2']
-        self.cluster1.rapi.GetInstances.response = ['vm3', 'vm5']
+        self.cluster0.rapi.GetInstances.response = instances_map(['vm0', 'vm2'])
+        self.cluster1.rapi.GetInstances.response = instances_map(['vm3', 'vm5'])
 
         # anonymous user
         response = self.c.get(url, follow=True)
@@ -219,8 +242,8 @@ class ImportViews(TestCase):
         Tests view for Virtual Machines missing from database
         """
         url = '/import/missing_db/'
-        self.cluster0.rapi.GetInstances.response = ['vm0', 'vm2']
-        self.cluster1.rapi.GetInstances.response = ['vm3', 'vm5']
+        self.cluster0.rapi.GetInstances.response = instances_map(['vm0', 'vm2'])
+        self.cluster1.rapi.GetInstances.response = instances_map(['vm3', 'vm5'])
 
         # anonymous user
         response = self.c.get(url, follow=True)
@@ -291,3 +314,120 @@ class ImportViews(TestCase):
         self.assertFalse(response.context['form'].errors)
         self.assertEqual([], response.context['vms'])
         self.assertTrue(VirtualMachine.objects.filter(hostname='vm2').exists())
+        vm = VirtualMachine.objects.get(hostname='vm2')
+        self.assertEqual(self.owner.pk, vm.owner_id)
+        self.assertEqual(INSTANCE['os'], vm.operating_system)
+
+    def test_missing_db_error(self):
+        """
+        Errors fetching the instances to import are shown to the user
+        """
+        url = '/import/missing_db/'
+        hostnames = ['vm0', 'vm2']
+
+        def get_instances(bulk=False):
+            if bulk:
+                raise GanetiApiError('cluster unreachable')
+            return hostnames
+
+        self.user.is_superuser = True
+        self.user.save()
+        self.assertTrue(self.c.login(username=self.user.username,
+                                     password='secret'))
+        rapi = self.cluster0.rapi
+        proxy = rapi.GetInstances
+        rapi.GetInstances = get_instances
+        try:
+            response = self.c.post(url, {'virtual_machines': ['1:vm2'],
+                                         'owner': self.owner.id})
+        finally:
+            rapi.GetInstances = proxy
+
+        self.assertEqual(200, response.status_code)
+        self.assertTrue('cluster unreachable' in
+                        str(response.context['form'].errors['__all__']))
+        self.assertFalse(VirtualMachine.objects.filter(hostname='vm2')
+                         .exists())
+
+
+class TestImportVirtualMachines(TestCase):
+
+    def setUp(self):
+        models.client.GanetiRapiClient = RapiProxy
+
+        self.cluster = Cluster.objects.create(hostname='test0', slug='test0')
+        self.cluster.rapi.GetInstances.response = \
+            instances_map(['vm0', 'vm1', 'vm2'])
+        self.node = Node.objects.create(cluster=self.cluster,
+                                        hostname=INSTANCE['pnode'])
+        VirtualMachine.objects.create(cluster=self.cluster, hostname='vm0')
+
+    def tearDown(self):
+        VirtualMachine.objects.all().delete()
+        Node.objects.all().delete()
+        Cluster.objects.all().delete()
+
+    def test_import(self):
+        """
+        Only VMs missing from the database are imported, fully populated.
+        """
+        self.cluster.rapi.GetInstance.reset()
+        self.assertEqual(2, import_virtual_machines(self.cluster))
+        self.assertEqual(['vm0', 'vm1', 'vm2'], list(
+            self.cluster.virtual_machines.values_list('hostname', flat=True)))
+
+        vm = VirtualMachine.objects.get(hostname='vm1')
+        self.assertEqual(INSTANCE['beparams']['memory'], vm.ram)
+        self.assertEqual(self.node, vm.primary_node)
+        self.assertEqual(self.cluster.hash, vm.cluster_hash)
+        self.assertEqual('vm1', vm.info['name'])
+        vm.rapi.GetInstance.assertNotCalled(self)
+
+        # importing again is a no-op
+        self.assertEqual(0, import_virtual_machines(self.cluster))
+
+    def test_hostnames(self):
+        """
+        Only the requested VMs are imported.
+        """
+        self.assertEqual(1, import_virtual_machines(self.cluster,
+                                                    hostnames=['VM2']))
+        self.assertFalse(VirtualMachine.objects.filter(hostname='vm1')
+                         .exists())
+        self.assertTrue(VirtualMachine.objects.filter(hostname='vm2')
+                        .exists())
+
+    def test_node_case(self):
+        """
+        Nodes are found whatever the case of their hostname in Ganeti
+        """
+        info = dict(INSTANCE, name='vm3', pnode=INSTANCE['pnode'].upper())
+        self.assertEqual(1, import_virtual_machines(
+            self.cluster, hostnames=['vm3'], instances=[info]))
+        with models.no_refresh():
+            vm = VirtualMachine.objects.get(hostname='vm3')
+        self.assertEqual(self.node.pk, vm.primary_node_id)
+
+    def test_chunks(self):
+        """
+        VMs are inserted in chunks, with one RAPI call for the cluster.
+        """
+        calls = []
+
+        def progress(done, total):
+            calls.append((done, total))
+
+        # existing hostnames, nodes, and one insert per chunk
+        self.assertNumQueries(4, import_virtual_machines, self.cluster,
+                              chunk_size=1, progress=progress)
+        self.assertEqual([(1, 2), (2, 2)], calls)
+        self.cluster.rapi.GetInstances.assertCalled(self, bulk=True)
+
+    def test_command(self):
+        """
+        The management command imports from the given clusters.
+        """
+        out = StringIO()
+        call_command('import_vms', 'test0', stdout=out)
+        self.assertEqual("Imported 2 VMs from test0.\n", out.getvalue())
+        self.assertEqual(3, self.cluster.virtual_machines.count())
@@ -15,17 +15,26 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
 # USA.
 
+import time
+
+from django.core.cache import cache, get_cache
+from django.core.urlresolvers import reverse
 from django.test import TestCase
 from django.test.client import Client
+from django.test.utils import override_settings
+from django.utils import simplejson as json
 
 from django_test_tools.views import ViewTestMixin
 from django_test_tools.users import UserTestMixin
 
+from ganeti_web.backend import versions
+from ganeti_web.util.client import GanetiApiError
 from ganeti_web.util.proxy import RapiProxy, CallProxy
 from ganeti_web.util.proxy.constants import JOB, JOB_RUNNING, JOB_ERROR
 from ganeti_web import models
 from ganeti_web.tests.views.virtual_machine.base \
     import VirtualMachineTestCaseMixin
+from ganeti_web.views import jobs as job_views
 
 
 Cluster = models.Cluster
@@ -182,6 +191,92 @@ class TestJobModel(TestJobMixin, TestCase):
         job._refresh.assertNotCalled(self)
 
 
+    def create_job(self, job_id, vm, status=''):
+        job = Job.objects.create(job_id=job_id, obj=vm, cluster=self.cluster)
+        Job.objects.filter(pk=job.pk).update(status=status)
+        VirtualMachine.objects.filter(pk=vm.pk) \
+            .update(last_job=job, ignore_cache=True)
+        return job
+
+    def test_fetch_statuses(self):
+        """
+        Statuses of several jobs are fetched with a single query.
+        """
+        rapi = self.cluster.rapi
+        rapi.GetJobStatus.response = JOB_RUNNING
+        rapi.Query.reset()
+        rapi.GetJobStatus.reset()
+
+        infos = Job.fetch_statuses(rapi, [1, 2])
+        self.assertEqual([1, 2], sorted(infos))
+        self.assertEqual('running', infos[2]['status'])
+        self.assertEqual(1, len(rapi.Query.calls))
+        rapi.GetJobStatus.assertNotCalled(self)
+
+    def test_fetch_statuses_fallback(self):
+        """
+        Clusters without the query resource are polled one job at a time.
+        """
+        rapi = self.cluster.rapi
+        rapi.GetJobStatus.response = JOB_RUNNING
+        rapi.GetJobStatus.reset()
+        rapi.Query.error = GanetiApiError('Not Found', 404)
+        try:
+            infos = Job.fetch_statuses(rapi, [1, 2])
+        finally:
+            rapi.Query.error = False
+        self.assertEqual([1, 2], sorted(infos))
+        self.assertEqual(2, len(rapi.GetJobStatus.calls))
+
+    def test_check_job_status_skips_finished(self):
+        """
+        Only pending jobs are polled when an object checks its jobs.
+        """
+        rapi = self.cluster.rapi
+        rapi.GetJobStatus.response = JOB
+        self.create_job(1, self.vm, status='success')
+        job = self.create_job(2, self.vm)
+        rapi.Query.reset()
+
+        vm = VirtualMachine.objects.get(pk=self.vm.pk)
+        rapi.Query.assertCalled(self, 'job', models.JOB_FIELDS,
+                                ['|', ['=', 'id', 2]])
+        self.assertEqual(1, len(rapi.Query.calls))
+        self.assertFalse(vm.last_job_id)
+        self.assertFalse(vm.ignore_cache)
+        self.assertEqual('success', Job.objects.get(pk=job.pk).status)
+
+    def test_check_pending_jobs(self):
+        """
+        Pending jobs of all objects on a cluster are polled together and
+        completed in bulk.
+        """
+        rapi = self.cluster.rapi
+        rapi.GetJobStatus.response = JOB
+        vm2, chaff = self.create_virtual_machine(self.cluster,
+                                                 'vm2.example.bak')
+        self.create_job(1, vm2, status='error')
+        job2 = self.create_job(2, self.vm)
+        job3 = self.create_job(3, vm2)
+        rapi.Query.reset()
+
+        self.assertEqual(2, self.cluster.check_pending_jobs())
+        self.assertEqual(1, len(rapi.Query.calls))
+        self.assertEqual(0, VirtualMachine.objects
+                         .filter(last_job__isnull=False).count())
+        self.assertEqual(0, VirtualMachine.objects
+                         .filter(ignore_cache=True).count())
+        self.assertEqual(['success', 'success'], list(
+            Job.objects.filter(pk__in=[job2.pk, job3.pk])
+            .values_list('status', flat=True)))
+
+        # nothing is pending anymore
+        rapi.Query.reset()
+        self.assertEqual(0, self.cluster.check_pending_jobs())
+        rapi.Query.assertNotCalled(self)
+        vm2.delete()
+
+
 class TestJobViews(TestJobMixin, TestCase, UserTestMixin, ViewTestMixin):
 
     def setUp(self):
@@ -359,3 +454,168 @@ class TestJobViews(TestJobMixin, TestCase, UserTestMixin, ViewTestMixin):
         self.assert_standard_fails(url, args, authorized=False)
         self.assert_200(url, args, users=[self.superuser, self.cluster_admin],
                         template='ganeti/job/detail.html')
+
+    def test_job_status_etag(self):
+        """
+        Polling unchanged jobs is answered with 304 Not Modified
+
+        Verifies:
+            * there is no ETag while a job is running
+            * finished jobs and no jobs at all have an ETag
+            * a new job changes the ETag
+        """
+        url = reverse('instance-job-status', args=[self.vm.pk])
+        self.assertTrue(self.c.login(username=self.superuser.username,
+                                     password='secret'))
+
+        response = self.c.get(url)
+        self.assertEqual('[]', response.content)
+        etag = response['ETag']
+        response = self.c.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+
+        job = Job.objects.create(job_id=1, obj=self.vm, cluster=self.cluster,
+                                 status='running')
+        response = self.c.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(response.has_header('ETag'))
+
+        Job.objects.filter(pk=job.pk).update(status='error',
+                                             ignore_cache=False)
+        response = self.c.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+        response = self.c.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(304, response.status_code)
+
+    @override_settings(JOB_UPDATES_TIMEOUT=0.3)
+    def test_job_updates(self):
+        """
+        Waiting for job updates
+
+        Verifies:
+            * the first request answers immediately
+            * requests are held until the timeout while nothing changes
+            * new jobs and changes to the object answer immediately
+        """
+        interval = job_views.UPDATES_CHECK_INTERVAL
+        job_views.UPDATES_CHECK_INTERVAL = 0.05
+        self.cluster.rapi.GetJobStatus.response = JOB_RUNNING
+        url = reverse('instance-job-updates', args=[self.vm.pk])
+        self.assertTrue(self.c.login(username=self.superuser.username,
+                                     password='secret'))
+
+        def get(data):
+            start = time.time()
+            response = self.c.get(url, data)
+            self.assertEqual(200, response.status_code)
+            return json.loads(response.content), time.time() - start
+
+        try:
+            data, elapsed = get({})
+            self.assertEqual([], data['jobs'])
+            self.assertEqual(0, data['retry'])
+            self.assertTrue(elapsed < 0.3)
+
+            since = dict(version=data['version'], digest=data['digest'])
+            data, elapsed = get(since)
+            self.assertTrue(elapsed >= 0.3)
+            self.assertEqual(since['digest'], data['digest'])
+
+            Job.objects.create(job_id=1, obj=self.vm, cluster=self.cluster,
+                               status='running')
+            data, elapsed = get(since)
+            self.assertTrue(elapsed < 0.3)
+            self.assertEqual(1, len(data['jobs']))
+            self.assertEqual(since['version'], data['version'])
+
+            since = dict(version=data['version'], digest=data['digest'])
+            self.vm.save()
+            data, elapsed = get(since)
+            self.assertTrue(elapsed < 0.3)
+            self.assertNotEqual(since['version'], data['version'])
+        finally:
+            job_views.UPDATES_CHECK_INTERVAL = interval
+
+    @override_settings(JOB_UPDATES_TIMEOUT=0.3)
+    def test_job_updates_cache_cleared(self):
+        """
+        A version counter missing from the cache, e.g. evicted or in the
+        cache of another process, is not reported as a change
+        """
+        interval = job_views.UPDATES_CHECK_INTERVAL
+        job_views.UPDATES_CHECK_INTERVAL = 0.05
+        url = reverse('instance-job-updates', args=[self.vm.pk])
+        self.assertTrue(self.c.login(username=self.superuser.username,
+                                     password='secret'))
+        try:
+            data = json.loads(self.c.get(url).content)
+            since = dict(version=data['version'], digest=data['digest'])
+
+            cache.clear()
+            start = time.time()
+            data = json.loads(self.c.get(url, since).content)
+            self.assertTrue(time.time() - start >= 0.3)
+            self.assertEqual(since['version'], data['version'])
+            self.assertEqual(since['digest'], data['digest'])
+        finally:
+            job_views.UPDATES_CHECK_INTERVAL = interval
+
+    @override_settings(JOB_UPDATES_TIMEOUT=0)
+    def test_job_updates_disabled(self):
+        """
+        Without long polling, clients are told to poll at the old intervals,
+        and changes to the object are not watched
+        """
+        self.assertTrue(self.c.login(username=self.superuser.username,
+                                     password='secret'))
+        url = reverse('cluster-job-updates', args=[self.cluster.pk])
+        data = json.loads(self.c.get(url).content)
+        self.assertEqual('', data['version'])
+        self.assertEqual(60000, data['retry'])
+
+        url = reverse('instance-job-updates', args=[self.vm.pk])
+        data = json.loads(self.c.get(url).content)
+        self.assertEqual('', data['version'])
+        since = dict(version=data['version'], digest=data['digest'])
+        cache.clear()
+        self.vm.save()
+        data = json.loads(self.c.get(url, since).content)
+        self.assertEqual('', data['version'])
+
+        # unchanged jobs are answered with 304, as by job_status
+        response = self.c.get(url, since)
+        response = self.c.get(url, since, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(304, response.status_code)
+        with self.settings(JOB_UPDATES_TIMEOUT=0.3):
+            self.assertFalse(self.c.get(url).has_header('ETag'))
+
+        # pages poll the job status instead
+        response = self.c.get(reverse('instance-detail',
+                                      args=[self.cluster.slug,
+                                            self.vm.hostname]))
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(url in response.content)
+        with self.settings(JOB_UPDATES_TIMEOUT=0.3):
+            response = self.c.get(reverse('instance-detail',
+                                          args=[self.cluster.slug,
+                                                self.vm.hostname]))
+        self.assertTrue(url in response.content)
+
+    @override_settings(JOB_UPDATES_TIMEOUT=0.3)
+    def test_job_updates_no_cache(self):
+        """
+        Job updates work without a cache, where every version is None
+        """
+        dummy = get_cache('django.core.cache.backends.dummy.DummyCache')
+        self.assertTrue(self.c.login(username=self.superuser.username,
+                                     password='secret'))
+        url = reverse('instance-job-updates', args=[self.vm.pk])
+        cache = versions.cache
+        versions.cache = dummy
+        try:
+            data = json.loads(self.c.get(url).content)
+        finally:
+            versions.cache = cache
+        self.assertEqual([], data['jobs'])
+        self.assertTrue(data['digest'])
@@ -0,0 +1,142 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+import os
+import shutil
+import tempfile
+import threading
+
+from django.test import TestCase
+
+from ganeti_web.util.limiter import LimitTimeout, RateLimiter
+from ganeti_web.util.proxy import RapiProxy
+from ganeti_web import models
+
+Cluster = models.Cluster
+
+__all__ = ('TestRateLimiter',)
+
+
+class Clock(object):
+    """
+    Fake clock whose sleep() advances time instead of blocking.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class TestRateLimiter(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        models.clear_rapi_cache()
+        Cluster.objects.all().delete()
+
+    def test_concurrency(self):
+        """
+        Requests over the cap wait for a slot to free up.
+        """
+        limiter = RateLimiter(concurrency=1)
+        entered = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with limiter.slot():
+                entered.set()
+                release.wait()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        entered.wait()
+        self.assertEqual(1, limiter.active)
+
+        limiter.timeout = 0.05
+        self.assertRaises(LimitTimeout, limiter.slot().__enter__)
+
+        limiter.timeout = None
+        release.set()
+        with limiter.slot():
+            pass
+        thread.join()
+        stats = limiter.stats()
+        self.assertEqual(0, stats["active"])
+        self.assertEqual(2, stats["requests"])
+
+    def test_rate(self):
+        """
+        Requests past the burst are spaced out at the configured rate, and
+        the time spent waiting is recorded.
+        """
+        limiter = RateLimiter(rate=2, burst=2, clock=self.clock,
+                              sleep=self.clock.sleep)
+        for i in range(4):
+            with limiter.slot():
+                pass
+        self.assertEqual([0.5, 0.5], self.clock.slept)
+
+        stats = limiter.stats()
+        self.assertEqual(4, stats["requests"])
+        self.assertEqual(2, stats["queued"])
+        self.assertEqual(1.0, stats["queue_time"])
+        self.assertEqual(0.5, stats["max_queue_time"])
+
+    def test_rate_timeout(self):
+        limiter = RateLimiter(rate=1, timeout=0.5, clock=self.clock,
+                              sleep=self.clock.sleep)
+        with limiter.slot():
+            pass
+        self.assertRaises(LimitTimeout, limiter.slot().__enter__)
+
+    def test_shared(self):
+        """
+        Limiters with the same lock path share their limits.
+        """
+        path = os.path.join(self.tmp, "rapi")
+        first = RateLimiter(concurrency=1, rate=1, lock_path=path,
+                            clock=self.clock, sleep=self.clock.sleep)
+        second = RateLimiter(concurrency=1, rate=1, timeout=0.1,
+                             lock_path=path, clock=self.clock,
+                             sleep=self.clock.sleep)
+
+        with first.slot():
+            # the only slot is held by the other limiter
+            self.assertRaises(LimitTimeout, second.slot().__enter__)
+
+        # the token was taken by the other limiter too
+        self.assertRaises(LimitTimeout, second.slot().__enter__)
+        self.clock.now += 1
+        with second.slot():
+            pass
+
+    def test_get_rapi(self):
+        models.client.GanetiRapiClient = RapiProxy
+        cluster = Cluster.objects.create(hostname='test.example.test',
+                                         slug='test')
+        self.assertTrue(cluster.rapi.limiter is models.get_limiter(cluster.id))
@@ -0,0 +1,104 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+from StringIO import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.test.client import Client
+from django.utils import simplejson as json
+
+from ganeti_web.util.metrics import (normalize_path, rapi_metrics,
+                                     RapiMetrics, set_view)
+
+__all__ = ('TestRapiMetrics',)
+
+
+class TestRapiMetrics(TestCase):
+
+    def setUp(self):
+        self.metrics = RapiMetrics()
+
+    def tearDown(self):
+        set_view(None)
+        rapi_metrics.reset()
+        User.objects.all().delete()
+
+    def test_normalize_path(self):
+        self.assertEqual("/2/instances/<name>/startup",
+                         normalize_path("/2/instances/vm1.example.com/startup"))
+        self.assertEqual("/2/jobs/<name>", normalize_path("/2/jobs/42"))
+        self.assertEqual("/2/instances", normalize_path("/2/instances"))
+        self.assertEqual("/version", normalize_path("/version"))
+
+    def test_record(self):
+        self.metrics.record("c1", "get", "/2/instances/a", 200, 0.02, 100)
+        set_view("ganeti_web.views.test")
+        self.metrics.record("c1", "get", "/2/instances/b", 404, 3, 10)
+        self.metrics.record("c2", "put", "/2/nodes/n/role", None, 20)
+
+        rows = self.metrics.snapshot()
+        self.assertEqual(2, len(rows))
+        c2, c1 = rows
+        self.assertEqual(("c1", "GET", "/2/instances/<name>"),
+                         (c1["host"], c1["method"], c1["path"]))
+        self.assertEqual(2, c1["count"])
+        self.assertEqual(1, c1["errors"])
+        self.assertEqual(110, c1["bytes"])
+        self.assertEqual({200: 1, 404: 1}, c1["status"])
+        self.assertEqual({"ganeti_web.views.test": {"count": 1, "time": 3}},
+                         c1["views"])
+        self.assertEqual(1, c1["latency"][1])
+        self.assertEqual(1, c1["latency"][8])
+        self.assertEqual(1, c2["latency"][-1])
+
+        self.assertEqual(1, self.metrics.totals("host")["c2"]["errors"])
+        self.assertEqual(2, self.metrics.totals("view")
+                         ["ganeti_web.views.test"]["count"])
+
+    def test_view(self):
+        rapi_metrics.record("c1", "GET", "/version", 200, 0.01, 1)
+        url = reverse("metrics")
+        c = Client()
+
+        self.assertEqual(403, c.get(url).status_code)
+
+        User.objects.create_superuser("admin", "admin@example.test", "secret")
+        self.assertTrue(c.login(username="admin", password="secret"))
+        response = c.get(url)
+        self.assertEqual(200, response.status_code)
+        stats = json.loads(response.content)
+        self.assertEqual("/version", stats["calls"][0]["path"])
+
+        c.logout()
+        url = reverse("metrics", args=[settings.WEB_MGR_API_KEY])
+        self.assertEqual(200, c.get(url).status_code)
+        url = reverse("metrics", args=["wrong"])
+        self.assertEqual(403, c.get(url).status_code)
+
+    def test_command(self):
+        rapi_metrics.record("c1", "GET", "/version", 200, 0.01, 1)
+        out = StringIO()
+        call_command("rapi_stats", json=True, stdout=out)
+        self.assertEqual(1, json.loads(out.getvalue())["calls"][0]["count"])
+
+        out = StringIO()
+        call_command("rapi_stats", stdout=out)
+        self.assertTrue("/version" in out.getvalue())
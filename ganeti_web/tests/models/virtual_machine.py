@@ -20,6 +20,7 @@ from datetime import datetime
 
 from django.test import TestCase
 
+from ganeti_web.backend.tags import reconcile_owner_tags
 from ganeti_web.util.proxy import RapiProxy
 from ganeti_web.util.proxy.constants import (INSTANCE, JOB, JOB_RUNNING,
                                              JOB_DELETE_SUCCESS)
@@ -101,6 +102,23 @@ class TestVirtualMachineModel(TestCase, VirtualMachineTestCaseMixin):
         vm1.delete()
         cluster.delete()
 
+    def test_hash_not_updated(self):
+        """
+        Saving a cluster without changing its credentials leaves the hash of
+        its VirtualMachines alone
+        """
+        vm, cluster = self.create_virtual_machine()
+        VirtualMachine.objects.filter(pk=vm.pk).update(cluster_hash='stale')
+
+        cluster.description = 'no credentials changed'
+        cluster.save()
+        self.assertEqual(['stale'], list(VirtualMachine.objects
+                         .filter(pk=vm.pk)
+                         .values_list('cluster_hash', flat=True)))
+
+        vm.delete()
+        cluster.delete()
+
     def test_parse_info(self):
         """
         Test parsing values from cached info
@@ -121,36 +139,117 @@ class TestVirtualMachineModel(TestCase, VirtualMachineTestCaseMixin):
         vm.delete()
         cluster.delete()
 
+    def test_refresh_runtime_change(self):
+        """
+        Runtime changes are picked up even though mtime did not change
+
+        Verifies:
+            * changed columns are written and the cached info updated
+            * only fields which differ are reported as changed
+        """
+        vm, cluster = self.create_virtual_machine()
+        vm.refresh()
+        self.assertEqual('running', vm.status)
+
+        vm.rapi.GetInstance.response = dict(INSTANCE, status='ADMIN_down')
+        try:
+            vm.refresh()
+            self.assertEqual('ADMIN_down', vm.status)
+            self.assertEqual('ADMIN_down', vm.info['status'])
+            vm = VirtualMachine.objects.get(pk=vm.pk)
+            self.assertEqual('ADMIN_down', vm.status)
+            self.assertEqual('ADMIN_down', vm.info['status'])
+            self.assertEqual({}, vm.changed_fields(vm.info))
+            self.assertEqual({'ram': 1024}, vm.changed_fields(
+                dict(vm.info, beparams=dict(memory=1024, vcpus=2))))
+        finally:
+            vm.rapi.GetInstance.response = INSTANCE
+
+        vm.delete()
+        cluster.delete()
+
+    def test_changed_fields_nodes(self):
+        """
+        Nodes are only looked up when they differ from the cached info, and
+        only among the nodes of the VM's cluster
+
+        Verifies:
+            * unchanged nodes cost no queries
+            * nodes of other clusters are ignored
+        """
+        vm, cluster = self.create_virtual_machine()
+        vm.refresh()
+        pnode = Node.objects.get(cluster=cluster, hostname=INSTANCE['pnode'])
+        self.assertEqual(pnode.pk, vm.primary_node_id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual({}, vm.changed_fields(vm.info))
+
+        cluster2 = Cluster.objects.create(hostname='test2.example.bak',
+                                          slug='OSL_TEST2')
+        Node.objects.create(cluster=cluster2, hostname='other.example.bak')
+        node2 = Node.objects.get(cluster=cluster, hostname='gtest2.example.bak')
+
+        with self.assertNumQueries(1):
+            changed = vm.changed_fields(dict(vm.info,
+                                             pnode='gtest2.example.bak'))
+        self.assertEqual({'primary_node': node2.pk}, changed)
+        changed = vm.changed_fields(dict(vm.info, pnode='other.example.bak'))
+        self.assertEqual({'primary_node': None}, changed)
+
     def test_update_owner_tag(self):
         """
         Test changing owner
+
+        Verifies:
+            * save() only flags the VM, without any RAPI calls
+            * reconciling pushes the owner tag to ganeti
         """
         vm, cluster = self.create_virtual_machine()
+        rapi = cluster.rapi
 
         owner0 = ClusterUser(id=74, name='owner0')
         owner1 = ClusterUser(id=21, name='owner1')
         owner0.save()
         owner1.save()
 
+        def reconcile():
+            self.assertTrue(VirtualMachine.objects.get(pk=vm.pk)
+                            .owner_tag_dirty)
+            rapi.AddInstanceTags.assertNotCalled(self)
+            rapi.DeleteInstanceTags.assertNotCalled(self)
+            reconcile_owner_tags(cluster)
+            reloaded = VirtualMachine.objects.get(pk=vm.pk)
+            self.assertFalse(reloaded.owner_tag_dirty)
+            rapi.AddInstanceTags.reset()
+            rapi.DeleteInstanceTags.reset()
+            return reloaded
+
         # no owner
         vm.refresh()
         self.assertEqual([], vm.info['tags'])
+        self.assertFalse(vm.owner_tag_dirty)
+        rapi.AddInstanceTags.reset()
+        rapi.DeleteInstanceTags.reset()
 
         # setting owner
         vm.owner = owner0
         vm.save()
+        vm = reconcile()
         self.assertEqual(['%s%s' % (constants.OWNER_TAG, owner0.id)],
                          vm.info['tags'])
 
         # changing owner
         vm.owner = owner1
         vm.save()
+        vm = reconcile()
         self.assertEqual(['%s%s' % (constants.OWNER_TAG, owner1.id)],
                          vm.info['tags'])
 
         # setting owner to none
         vm.owner = None
         vm.save()
+        vm = reconcile()
         self.assertEqual([], vm.info['tags'])
 
         owner0.delete()
@@ -0,0 +1,183 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+import cPickle
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ganeti_web.backend.tags import reconcile_owner_tags, set_owner
+from ganeti_web.util.client import GanetiApiError
+from ganeti_web.util.proxy import RapiProxy
+from ganeti_web.util.proxy.constants import INSTANCE
+from ganeti_web import models
+from ganeti_web.models import diff_owner_tags, owner_tag
+from ganeti_web.tests.views.virtual_machine.base \
+    import VirtualMachineTestCaseMixin
+
+Cluster = models.Cluster
+ClusterUser = models.ClusterUser
+Node = models.Node
+VirtualMachine = models.VirtualMachine
+
+__all__ = ('TestOwnerTags',)
+
+
+class TestOwnerTags(TestCase, VirtualMachineTestCaseMixin):
+
+    def setUp(self):
+        models.client.GanetiRapiClient = RapiProxy
+        self.vm, self.cluster = self.create_virtual_machine()
+        self.vm2, chaff = self.create_virtual_machine(self.cluster,
+                                                      'vm2.example.bak')
+        self.owner = ClusterUser.objects.create(name='owner')
+
+        info = dict(INSTANCE, tags=[owner_tag(999), 'other'])
+        VirtualMachine.objects.update(serialized_info=cPickle.dumps(info))
+
+        self.rapi = self.cluster.rapi
+        self.rapi.AddInstanceTags.reset()
+        self.rapi.DeleteInstanceTags.reset()
+
+    def tearDown(self):
+        VirtualMachine.objects.all().delete()
+        Node.objects.all().delete()
+        Cluster.objects.all().delete()
+        ClusterUser.objects.all().delete()
+
+    def load_tags(self, vm):
+        serialized = VirtualMachine.objects.filter(pk=vm.pk) \
+            .values_list('serialized_info', flat=True)[0]
+        return cPickle.loads(str(serialized))['tags']
+
+    def test_diff_owner_tags(self):
+        self.assertEqual(([], [owner_tag(1)]), diff_owner_tags([], 1))
+        self.assertEqual(([], []), diff_owner_tags([owner_tag(1)], 1))
+        self.assertEqual(([owner_tag(2)], [owner_tag(1)]),
+                         diff_owner_tags([owner_tag(2), 'foo'], 1))
+        self.assertEqual(([owner_tag(2)], []),
+                         diff_owner_tags([owner_tag(2)], None))
+
+    def test_set_owner(self):
+        """
+        Owners are updated in bulk and tags are pushed for each VM.
+        """
+        qs = VirtualMachine.objects.filter(cluster=self.cluster)
+        self.assertEqual(2, set_owner(qs, self.owner))
+
+        self.assertEqual(2, self.owner.virtual_machines.count())
+        for vm in (self.vm, self.vm2):
+            self.rapi.DeleteInstanceTags.assertCalled(self, vm.hostname,
+                                                      [owner_tag(999)])
+            self.rapi.AddInstanceTags.assertCalled(
+                self, vm.hostname, [owner_tag(self.owner.pk)])
+            self.assertEqual(['other', owner_tag(self.owner.pk)],
+                             self.load_tags(vm))
+
+    def test_set_owner_unchanged_tags(self):
+        """
+        No RAPI calls are made for VMs whose tags are already correct.
+        """
+        qs = VirtualMachine.objects.filter(pk=self.vm.pk)
+        set_owner(qs, self.owner)
+        self.rapi.AddInstanceTags.reset()
+        self.rapi.DeleteInstanceTags.reset()
+
+        set_owner(qs, self.owner)
+        self.rapi.AddInstanceTags.assertNotCalled(self)
+        self.rapi.DeleteInstanceTags.assertNotCalled(self)
+
+    def test_set_owner_no_credentials(self):
+        """
+        Tags are not pushed to clusters without credentials.
+        """
+        Cluster.objects.update(username='')
+        try:
+            set_owner(VirtualMachine.objects.all(), self.owner)
+        finally:
+            Cluster.objects.update(username='foo')
+
+        self.assertEqual(2, self.owner.virtual_machines.count())
+        self.rapi.AddInstanceTags.assertNotCalled(self)
+        self.assertEqual([owner_tag(999), 'other'], self.load_tags(self.vm))
+        self.assertEqual(2, VirtualMachine.objects
+                         .filter(owner_tag_dirty=True).count())
+
+    def test_save_flags_vm(self):
+        """
+        save() flags VMs with wrong tags instead of calling the RAPI.
+        """
+        vm = VirtualMachine.objects.get(pk=self.vm.pk)
+        vm.owner = self.owner
+        vm.save()
+
+        self.rapi.AddInstanceTags.assertNotCalled(self)
+        self.assertTrue(VirtualMachine.objects.get(pk=vm.pk).owner_tag_dirty)
+
+    def test_reconcile_batches(self):
+        """
+        Flagged VMs are reconciled over several batches; VMs which already
+        have the right tags are only unflagged.
+        """
+        info = dict(INSTANCE, tags=[owner_tag(self.owner.pk)])
+        VirtualMachine.objects.filter(pk=self.vm2.pk) \
+            .update(serialized_info=cPickle.dumps(info))
+        VirtualMachine.objects.update(owner=self.owner, owner_tag_dirty=True)
+
+        self.assertEqual(1, reconcile_owner_tags(self.cluster, batch_size=1))
+        self.rapi.AddInstanceTags.assertCalled(self, self.vm.hostname,
+                                               [owner_tag(self.owner.pk)])
+        self.rapi.AddInstanceTags.assertNotCalled(self, self.vm2.hostname,
+                                                  [owner_tag(self.owner.pk)])
+        self.assertFalse(VirtualMachine.objects
+                         .filter(owner_tag_dirty=True).exists())
+
+    def test_reconcile_error(self):
+        """
+        VMs whose tags can't be written stay flagged.
+        """
+        VirtualMachine.objects.update(owner=self.owner, owner_tag_dirty=True)
+        self.rapi.error = GanetiApiError('Not Found', 404)
+        try:
+            self.assertEqual(0, reconcile_owner_tags(self.cluster))
+        finally:
+            self.rapi.error = None
+        self.assertEqual(2, VirtualMachine.objects
+                         .filter(owner_tag_dirty=True).count())
+
+    def test_reconcile_no_credentials(self):
+        """
+        VMs of clusters without credentials are unflagged without calling
+        the RAPI, so that they aren't selected again.
+        """
+        VirtualMachine.objects.update(owner=self.owner, owner_tag_dirty=True)
+        Cluster.objects.update(username='')
+        try:
+            call_command('reconcile_tags', verbosity=0)
+        finally:
+            Cluster.objects.update(username='foo')
+
+        self.rapi.AddInstanceTags.assertNotCalled(self)
+        self.assertEqual([owner_tag(999), 'other'], self.load_tags(self.vm))
+        self.assertFalse(VirtualMachine.objects
+                         .filter(owner_tag_dirty=True).exists())
+
+    def test_command(self):
+        VirtualMachine.objects.update(owner=self.owner, owner_tag_dirty=True)
+        call_command('reconcile_tags', verbosity=0)
+        self.assertEqual(['other', owner_tag(self.owner.pk)],
+                         self.load_tags(self.vm))
@@ -0,0 +1,66 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from ganeti_web.util import perf
+
+__all__ = ('TestPerformance',)
+
+MIDDLEWARE = (('ganeti_web.middleware.PerformanceMiddleware',)
+              + settings.MIDDLEWARE_CLASSES)
+
+
+class TestPerformance(TestCase):
+
+    def tearDown(self):
+        perf.stop()
+
+    def test_timed(self):
+        with perf.timed("pickle"):
+            pass
+        self.assertEqual({}, perf.stop())
+
+        perf.start()
+        with perf.timed("template"):
+            with perf.timed("template"):
+                pass
+        perf.add("rapi", 0.5)
+        perf.add("rapi", 0.25)
+        totals = perf.stop()
+        self.assertEqual(1, totals["template"][0])
+        self.assertEqual((2, 0.75), totals["rapi"])
+        self.assertFalse(perf.active())
+
+    @override_settings(MIDDLEWARE_CLASSES=MIDDLEWARE, PERF_SAMPLE_RATE=1)
+    def test_middleware(self):
+        response = self.client.get(reverse("about"))
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(float(response["X-Perf-Total"]) > 0)
+        count, ms = response["X-Perf-Template"].split(";")
+        self.assertEqual(1, int(count))
+        self.assertEqual("0;0.0", response["X-Perf-Rapi"])
+        self.assertTrue(response.has_header("X-Perf-Sql"))
+        self.assertFalse(perf.active())
+
+    @override_settings(MIDDLEWARE_CLASSES=MIDDLEWARE, PERF_SAMPLE_RATE=0)
+    def test_middleware_not_sampled(self):
+        response = self.client.get(reverse("about"))
+        self.assertFalse(response.has_header("X-Perf-Total"))
@@ -0,0 +1,206 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from ganeti_web.backend import quotas
+from ganeti_web.backend.batches import power_vms, provision_vms
+from ganeti_web.backend.tags import set_owner
+from ganeti_web.util.proxy import RapiProxy
+from ganeti_web.util.proxy.constants import JOB
+from ganeti_web import models
+
+Cluster = models.Cluster
+Job = models.Job
+QuotaReservation = models.QuotaReservation
+QuotaUsage = models.QuotaUsage
+VirtualMachine = models.VirtualMachine
+
+__all__ = ('TestQuotaUsage',)
+
+
+class TestQuotaUsage(TestCase):
+
+    def setUp(self):
+        models.client.GanetiRapiClient = RapiProxy
+        self.cluster = Cluster.objects.create(hostname='test.example.bak',
+                                              slug='OSL_TEST')
+        self.user = User.objects.create(username='owner')
+        self.owner = self.user.get_profile()
+        self.vm = self.create_vm('vm1.example.bak', 'running')
+        self.vm2 = self.create_vm('vm2.example.bak', 'ADMIN_down')
+
+    def tearDown(self):
+        models.clear_rapi_cache()
+
+    def create_vm(self, hostname, status):
+        return VirtualMachine.objects.create(
+            cluster=self.cluster, hostname=hostname, owner=self.owner,
+            status=status, ram=600, virtual_cpus=2, disk_size=1000)
+
+    def usage(self):
+        return QuotaUsage.objects.filter(owner=self.owner,
+                                         cluster=self.cluster) \
+            .values('ram', 'disk', 'virtual_cpus')[0]
+
+    def test_created_on_first_use(self):
+        """
+        The usage row is counted from the VMs the first time it is read
+        """
+        self.assertFalse(QuotaUsage.objects.exists())
+
+        used = quotas.used_resources(self.owner, self.cluster)
+
+        expected = dict(ram=600, disk=2000, virtual_cpus=2)
+        self.assertEqual(expected, used)
+        self.assertEqual(expected, self.usage())
+        self.assertEqual(self.owner.used_resources(self.cluster), used)
+
+    def test_reservations(self):
+        """
+        Reservations are counted on top of the usage of the VMs
+        """
+        quotas.reserve([
+            quotas.reservation(self.vm2, ram=600, virtual_cpus=2),
+            # nothing reserved
+            quotas.reservation(self.vm),
+        ])
+        self.assertEqual(1, QuotaReservation.objects.count())
+
+        used = quotas.used_resources(self.owner, self.cluster)
+        self.assertEqual(dict(ram=1200, disk=2000, virtual_cpus=4), used)
+
+        QuotaReservation.release([self.vm2.pk])
+        self.assertFalse(QuotaReservation.objects.exists())
+        used = quotas.used_resources(self.owner, self.cluster)
+        self.assertEqual(dict(ram=600, disk=2000, virtual_cpus=2), used)
+
+    def test_released_when_jobs_finish(self):
+        """
+        Refreshing a VM whose jobs finished releases its reservations and
+        recounts the usage from the refreshed VM
+        """
+        quotas.used_resources(self.owner, self.cluster)
+        job = Job.objects.create(job_id=1, obj=self.vm2, cluster=self.cluster,
+                                 status='success')
+        VirtualMachine.objects.filter(pk=self.vm2.pk).update(last_job=job)
+        quotas.reserve([quotas.reservation(self.vm2, ram=600,
+                                           virtual_cpus=2)])
+
+        with models.no_refresh():
+            vm2 = VirtualMachine.objects.get(pk=self.vm2.pk)
+        vm2.refresh()
+
+        self.assertEqual(None, vm2.last_job_id)
+        self.assertFalse(QuotaReservation.objects.exists())
+        self.assertEqual(self.owner.used_resources(self.cluster),
+                         self.usage())
+
+    def test_kept_until_refreshed(self):
+        """
+        A startup job finished through Cluster.check_pending_jobs() keeps
+        its reservation until the VM itself is refreshed with its new status
+        """
+        self.cluster.rapi.GetJobStatus.response = JOB
+        job = Job.objects.create(job_id=1, obj=self.vm2, cluster=self.cluster)
+        VirtualMachine.objects.filter(pk=self.vm2.pk) \
+            .update(last_job=job, ignore_cache=True)
+        quotas.reserve([quotas.reservation(self.vm2, ram=600,
+                                           virtual_cpus=2)])
+
+        self.assertEqual(1, self.cluster.check_pending_jobs())
+        self.assertEqual('success', Job.objects.get(pk=job.pk).status)
+        self.assertEqual(dict(ram=1200, disk=2000, virtual_cpus=4),
+                         quotas.used_resources(self.owner, self.cluster))
+
+        # loading the VM refreshes it, since its job was not cleared
+        vm2 = VirtualMachine.objects.get(pk=self.vm2.pk)
+        self.assertEqual('running', vm2.status)
+        self.assertEqual(None, vm2.last_job_id)
+        self.assertFalse(QuotaReservation.objects.exists())
+        self.assertEqual(self.owner.used_resources(self.cluster),
+                         quotas.used_resources(self.owner, self.cluster))
+        self.assertEqual(600 + vm2.ram, quotas.used_resources(
+            self.owner, self.cluster)['ram'])
+
+    def test_reconciled_on_create(self):
+        """
+        A new VM is counted even if it won't change once it is refreshed
+        """
+        quotas.used_resources(self.owner, self.cluster)
+        self.create_vm('vm3.example.bak', 'ADMIN_down')
+        self.assertEqual(dict(ram=600, disk=3000, virtual_cpus=2), self.usage())
+
+    def test_provision_counts_first_disk(self):
+        """
+        Provisioned VMs count their first disk right away and reserve the
+        rest of their template
+        """
+        self.cluster.refresh()
+        template = models.VirtualMachineTemplate(
+            template_name='worker', cluster=self.cluster, memory=256, vcpus=1,
+            disk_template='plain', start=False)
+        template.disks = [{'size': 500}, {'size': 200}]
+        template.nics = []
+        template.save()
+        quotas.used_resources(self.owner, self.cluster)
+        self.cluster.rapi.CreateInstance.response = 100
+
+        provision_vms(self.user, template, ['vm3.example.bak'], self.owner)
+
+        self.assertEqual(dict(ram=600, disk=2500, virtual_cpus=2), self.usage())
+        self.assertEqual(dict(ram=600, disk=2700, virtual_cpus=2),
+                         quotas.used_resources(self.owner, self.cluster))
+
+    def test_reconciled_on_delete(self):
+        quotas.used_resources(self.owner, self.cluster)
+        self.vm.delete()
+        self.assertEqual(dict(ram=0, disk=1000, virtual_cpus=0), self.usage())
+
+    def test_reconciled_on_owner_change(self):
+        other = User.objects.create(username='other').get_profile()
+        quotas.used_resources(self.owner, self.cluster)
+        quotas.used_resources(other, self.cluster)
+
+        set_owner(VirtualMachine.objects.filter(pk=self.vm.pk), other)
+
+        self.assertEqual(dict(ram=0, disk=1000, virtual_cpus=0), self.usage())
+        self.assertEqual(dict(ram=600, disk=1000, virtual_cpus=2),
+                         quotas.used_resources(other, self.cluster))
+
+    def test_startup_batches_reserve(self):
+        """
+        A startup counts against the quota of later batches before the VM
+        is running
+        """
+        self.cluster.set_quota(self.owner, dict(ram=1000, disk=None,
+                                                virtual_cpus=None))
+        vm3 = self.create_vm('vm3.example.bak', 'ADMIN_down')
+        with models.no_refresh():
+            vm2, vm3 = VirtualMachine.objects.filter(pk__in=[
+                self.vm2.pk, vm3.pk]).select_related('cluster', 'owner') \
+                .order_by('hostname')
+            self.vm.delete()
+
+        batch, errors = power_vms(self.user, 'startup', [vm2])
+        self.assertEqual({}, errors)
+        self.assertEqual(1, QuotaReservation.objects.count())
+
+        batch, errors = power_vms(self.user, 'startup', [vm3])
+        self.assertEqual([vm3], errors.keys())
+        self.assertTrue('RAM' in errors[vm3])
@@ -0,0 +1,145 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+import copy
+import cPickle
+from datetime import datetime, timedelta
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import simplejson as json
+
+from ganeti_web.backend.retention import (prune_errors, compact_jobs,
+                                          compact_job_info)
+from ganeti_web.util.proxy import RapiProxy
+from ganeti_web.util.proxy.constants import JOB_ERROR, JOB_LOG
+from ganeti_web import models
+from ganeti_web.tests.views.virtual_machine.base \
+    import VirtualMachineTestCaseMixin
+
+Cluster = models.Cluster
+GanetiError = models.GanetiError
+Job = models.Job
+VirtualMachine = models.VirtualMachine
+
+__all__ = ('TestRetention',)
+
+
+class TestRetention(TestCase, VirtualMachineTestCaseMixin):
+
+    def setUp(self):
+        models.client.GanetiRapiClient = RapiProxy
+        self.vm, self.cluster = self.create_virtual_machine()
+        self.old = datetime.now() - timedelta(days=60)
+
+    def tearDown(self):
+        Job.objects.all().delete()
+        GanetiError.objects.all().delete()
+        VirtualMachine.objects.all().delete()
+        Cluster.objects.all().delete()
+
+    def create_error(self, msg, cleared, timestamp):
+        error = GanetiError.store_error(msg, obj=self.vm, code=500)
+        GanetiError.objects.filter(pk=error.pk) \
+            .update(cleared=cleared, timestamp=timestamp)
+        return error
+
+    def create_job(self, job_id, info, finished):
+        job = Job.objects.create(job_id=job_id, obj=self.vm,
+                                 cluster=self.cluster)
+        Job.objects.filter(pk=job.pk).update(
+            status=info["status"], finished=finished, ignore_cache=False,
+            serialized_info=cPickle.dumps(info))
+        return job
+
+    def load_info(self, job):
+        serialized = Job.objects.filter(pk=job.pk) \
+            .values_list("serialized_info", flat=True)[0]
+        return cPickle.loads(str(serialized))
+
+    def test_prune_errors(self):
+        """
+        Only old, cleared errors are removed.
+        """
+        self.create_error("old cleared", True, self.old)
+        self.create_error("old active", False, self.old)
+        self.create_error("new cleared", True, datetime.now())
+
+        self.assertEqual(1, prune_errors(30, 10))
+        msgs = GanetiError.objects.values_list("msg", flat=True)
+        self.assertEqual(set(["old active", "new cleared"]), set(msgs))
+
+    def test_prune_errors_batches(self):
+        """
+        Removal continues over several batches and archives every row.
+        """
+        for i in range(5):
+            self.create_error("error %d" % i, True, self.old)
+
+        archive = StringIO()
+        self.assertEqual(5, prune_errors(30, 2, archive))
+        self.assertFalse(GanetiError.objects.exists())
+
+        lines = archive.getvalue().splitlines()
+        self.assertEqual(5, len(lines))
+        self.assertEqual("error 0", json.loads(lines[0])["msg"])
+
+    def test_compact_job_info(self):
+        """
+        Op logs are emptied; results are only kept for failed jobs.
+        """
+        info = copy.deepcopy(JOB_LOG)
+        info["status"] = "success"
+        self.assertTrue(compact_job_info(info))
+        self.assertEqual([[]], info["oplog"])
+        self.assertEqual([None], info["opresult"])
+        self.assertFalse(compact_job_info(info))
+
+        info = copy.deepcopy(JOB_ERROR)
+        self.assertFalse(compact_job_info(info))
+        self.assertEqual(JOB_ERROR["opresult"], info["opresult"])
+
+    def test_compact_jobs(self):
+        """
+        Only finished jobs older than the cutoff are compacted.
+        """
+        info = copy.deepcopy(JOB_LOG)
+        info["status"] = "success"
+        old = self.create_job(1, info, self.old)
+        new = self.create_job(2, info, datetime.now())
+
+        self.assertEqual(1, compact_jobs(30, 1))
+        self.assertEqual([[]], self.load_info(old)["oplog"])
+        self.assertEqual(JOB_LOG["oplog"], self.load_info(new)["oplog"])
+
+        # Compacting again is a no-op.
+        self.assertEqual(0, compact_jobs(30, 1))
+
+    def test_command(self):
+        """
+        The management command applies both policies.
+        """
+        self.create_error("old cleared", True, self.old)
+        info = copy.deepcopy(JOB_LOG)
+        info["status"] = "success"
+        job = self.create_job(1, info, self.old)
+
+        call_command("compact_tables", verbosity=0)
+
+        self.assertFalse(GanetiError.objects.exists())
+        self.assertEqual([[]], self.load_info(job)["oplog"])
@@ -0,0 +1,123 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+import shutil
+import tempfile
+import time
+
+from django.utils import unittest
+
+from ganeti_web.util.client import GanetiApiError, GanetiRapiClient
+from ganeti_web.util.proxy.simulator import (make_certificate,
+                                             SimulatedCluster,
+                                             SimulatorServer)
+
+__all__ = ('TestSimulatedCluster', 'TestSimulatorServer')
+
+
+class TestSimulatedCluster(unittest.TestCase):
+
+    def setUp(self):
+        self.cluster = SimulatedCluster("test.example.test", nodes=2,
+                                        instances=4, queued=0, running=0,
+                                        seed=1)
+
+    def test_generate(self):
+        self.assertEqual(2, len(self.cluster.nodes))
+        self.assertEqual(4, len(self.cluster.instances))
+        node = self.cluster.nodes["node000.test.example.test"]
+        self.assertEqual(["vm00000.test.example.test",
+                          "vm00002.test.example.test"], node["pinst_list"])
+
+    def test_job_effect(self):
+        name = "vm00001.test.example.test"
+        job_id = self.cluster.instance_action(name, "shutdown")
+        self.cluster.advance()
+        self.assertEqual("success", self.cluster.job(job_id).info()["status"])
+        self.assertEqual("ADMIN_down", self.cluster.instance(name)["status"])
+
+    def test_job_lifecycle(self):
+        self.cluster.queued = 60
+        self.cluster.running = 60
+        job = self.cluster.job(self.cluster.submit("OP_TEST", "TEST"))
+        now = time.time()
+        self.assertEqual("queued", job.status(now))
+        self.assertEqual("running", job.status(now + 61))
+        self.assertEqual("success", job.status(now + 121))
+
+    def test_query(self):
+        ids = [self.cluster.submit("OP_TEST", "TEST") for i in range(3)]
+        result = self.cluster.query("job", ["id", "status"],
+                                    ["|", ["=", "id", ids[0]],
+                                     ["=", "id", str(ids[2])]])
+        self.assertEqual([[[0, ids[0]], [0, "success"]],
+                          [[0, ids[2]], [0, "success"]]],
+                         sorted(result["data"]))
+
+    def test_wait_for_change(self):
+        self.cluster.running = 0.2
+        job_id = self.cluster.submit("OP_TEST", "TEST")
+        result = self.cluster.wait_for_change(job_id, ["status"],
+                                              ["running"], 1)
+        self.assertEqual(["success"], result["job_info"])
+
+        self.cluster.queued = 60
+        job_id = self.cluster.submit("OP_TEST", "TEST")
+        self.assertEqual(None, self.cluster.wait_for_change(
+            job_id, ["status"], ["queued"], None, 0.1))
+
+
+class TestSimulatorServer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        cluster = SimulatedCluster("test.example.test", nodes=2,
+                                   instances=5, queued=0, running=0)
+        self.server = SimulatorServer(("localhost", 0), cluster,
+                                      make_certificate(self.tmp))
+        self.server.start()
+        self.rapi = GanetiRapiClient("localhost",
+                                     self.server.server_address[1],
+                                     username="user", password="secret")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp)
+
+    def test_rapi(self):
+        self.assertEqual(2, self.rapi.GetVersion())
+        self.assertEqual("test.example.test", self.rapi.GetInfo()["name"])
+        self.assertEqual(5, len(self.rapi.GetInstances()))
+        self.assertEqual(5, len(self.rapi.GetInstances(bulk=True)))
+        self.assertEqual(2, len(self.rapi.GetNodes(bulk=True)))
+
+        name = "vm00000.test.example.test"
+        job_id = self.rapi.StartupInstance(name)
+        self.assertEqual("success", self.rapi.GetJobStatus(job_id)["status"])
+        self.assertEqual("running", self.rapi.GetInstance(name)["status"])
+
+        job_id = self.rapi.AddInstanceTags(name, ["a", "b"])
+        self.rapi.GetJobStatus(job_id)
+        self.assertEqual(["a", "b"], self.rapi.GetInstanceTags(name))
+
+        try:
+            self.rapi.GetInstance("missing")
+        except GanetiApiError, e:
+            self.assertEqual(404, e.code)
+        else:
+            self.fail("no error for a missing instance")
@@ -16,8 +16,13 @@
 # USA.
 
 
+import cPickle
+from datetime import datetime
+
 from django.contrib.auth.models import User, Group
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.test.client import Client
 # Per #6579, do not change this import without discussion.
 from django.utils import simplejson as json
@@ -41,7 +46,8 @@ Job = models.Job
 __all__ = [
     "TestClusterViews",
     "TestClusterQuotaViews",
-    "TestClusterVMListView"
+    "TestClusterVMListView",
+    "TestKeysetPagination",
 ]
 
 
@@ -1186,3 +1192,124 @@ class TestClusterVMListView(TestCase):
         expected_vms = [self.vm1.pk]
         self.assertEqual(vms, expected_vms)
 
+
+class TestKeysetPagination(TestCase):
+
+    def setUp(self):
+        models.client.GanetiRapiClient = RapiProxy
+        self.admin = User.objects.create_user(
+            username="admin", password="secret")
+        self.cluster = Cluster.objects.create(
+            hostname='test.example.test', slug='OSL_TEST')
+        self.admin.grant('admin', self.cluster)
+        self.hostnames = ['vm%d' % i for i in range(7)]
+        for hostname in reversed(self.hostnames):
+            VirtualMachine.objects.create(hostname=hostname,
+                                          cluster=self.cluster)
+        now = datetime.now()
+        Job.objects.bulk_create([
+            Job(job_id=i, cluster=self.cluster, obj=self.cluster,
+                status='success', cluster_hash=self.cluster.hash, cached=now,
+                serialized_info=cPickle.dumps({'id': i, 'status': 'success'}))
+            for i in range(1, 6)])
+        self.client.login(username=self.admin.username, password='secret')
+
+    def tearDown(self):
+        models.clear_rapi_cache()
+
+    def get(self, url, **params):
+        params.setdefault('per_page', 3)
+        response = self.client.get(url, params)
+        self.assertEqual(200, response.status_code)
+        return response.context['table']
+
+    def test_vm_pages(self):
+        url = '/cluster/%s/virtual_machines' % self.cluster.slug
+        table = self.get(url)
+        page = table.page
+        self.assertTrue(page.keyset)
+        self.assertEqual(self.hostnames[:3],
+                         [row.record.hostname for row in page.object_list])
+        self.assertFalse(page.has_previous())
+        self.assertTrue(page.has_next())
+        self.assertEqual(7, table.paginator.count)
+
+        page = self.get(url, after=page.next_cursor).page
+        self.assertEqual(self.hostnames[3:6],
+                         [row.record.hostname for row in page.object_list])
+        self.assertTrue(page.has_previous())
+        self.assertTrue(page.has_next())
+        last = self.get(url, after=page.next_cursor).page
+        self.assertEqual(self.hostnames[6:],
+                         [row.record.hostname for row in last.object_list])
+        self.assertFalse(last.has_next())
+
+        # back to the first page
+        page = self.get(url, before=page.previous_cursor).page
+        self.assertEqual(self.hostnames[:3],
+                         [row.record.hostname for row in page.object_list])
+        self.assertFalse(page.has_previous())
+
+    def test_vm_pages_descending(self):
+        url = '/cluster/%s/virtual_machines' % self.cluster.slug
+        page = self.get(url, sort='-hostname').page
+        self.assertTrue(page.keyset)
+        page = self.get(url, sort='-hostname', after=page.next_cursor).page
+        self.assertEqual(['vm3', 'vm2', 'vm1'],
+                         [row.record.hostname for row in page.object_list])
+
+    def test_deep_page_queries(self):
+        """
+        A deep page costs the same number of queries as the first one
+        """
+        url = '/cluster/%s/virtual_machines' % self.cluster.slug
+        cursor = self.get(url).page.next_cursor
+        # the VMs refresh themselves the first time they are shown
+        self.get(url, after=cursor)
+        with self.assertNumQueries(self.num_queries(url)):
+            self.get(url, after=cursor)
+
+    def num_queries(self, url):
+        debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        try:
+            del connection.queries[:]
+            self.get(url)
+            return len(connection.queries)
+        finally:
+            connection.use_debug_cursor = debug_cursor
+
+    def test_invalid_cursor(self):
+        url = '/cluster/%s/virtual_machines' % self.cluster.slug
+        page = self.get(url, after='vm4,nope').page
+        self.assertEqual(self.hostnames[:3],
+                         [row.record.hostname for row in page.object_list])
+
+    def test_other_sorting(self):
+        """
+        Tables sorted by other columns are paginated by page number
+        """
+        url = '/cluster/%s/virtual_machines' % self.cluster.slug
+        page = self.get(url, sort='ram', page=2).page
+        self.assertFalse(getattr(page, 'keyset', False))
+        self.assertEqual(2, page.number)
+
+    @override_settings(TABLE_COUNT_LIMIT=5)
+    def test_count_limit(self):
+        url = '/cluster/%s/virtual_machines' % self.cluster.slug
+        response = self.client.get(url, {'per_page': 3})
+        paginator = response.context['table'].paginator
+        self.assertEqual(5, paginator.count)
+        self.assertTrue(paginator.approximate)
+        self.assertContains(response, 'more than 5')
+
+    def test_job_pages(self):
+        url = '/cluster/%s/jobs' % self.cluster.slug
+        page = self.get(url, sort='-job_id').page
+        self.assertTrue(page.keyset)
+        self.assertEqual([5, 4, 3],
+                         [row.record.job_id for row in page.object_list])
+        page = self.get(url, sort='-job_id', after=page.next_cursor).page
+        self.assertEqual([2, 1],
+                         [row.record.job_id for row in page.object_list])
+        self.assertFalse(page.has_next())
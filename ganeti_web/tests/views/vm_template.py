@@ -97,6 +97,29 @@ class TestTemplateViews(TestCase, ViewTestMixin, UserTestMixin):
         args = ()
         self.assert_standard_fails(url, args, authorized=False)
 
+    def test_list_view_sort_disk_space(self):
+        """
+        Test sorting templates by the total size of their disks, which is
+        stored on save.
+        """
+        template = VirtualMachineTemplate(template_name="Template2",
+                                          cluster=self.cluster)
+        template.disks = [{'size': 100}, {'size': 200}]
+        template.save()
+        self.assertEqual(300, template.disk_space)
+        self.assertEqual(2, template.disk_count)
+        self.assertEqual(500, self.template.disk_space)
+        self.assertEqual(1, self.template.disk_count)
+
+        self.assertTrue(self.c.login(username=self.superuser.username,
+                                     password='secret'))
+        for sort, expected in (("disk_space", [template, self.template]),
+                               ("-disk_space", [self.template, template])):
+            response = self.c.get('/templates/', {'sort': sort})
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(expected,
+                             list(response.context['table'].data.queryset))
+
     def test_detail_view(self):
         """
         Test viewing details of a virtual machine template.
@@ -118,6 +141,34 @@ class TestTemplateViews(TestCase, ViewTestMixin, UserTestMixin):
                                self.create_vm],
                         template='ganeti/vm_template/to_vm.html')
 
+    def test_create_instances_from_template_view(self):
+        """
+        Tests creating several instances from a template
+        """
+        url = '/cluster/%s/template/%s/vms/'
+        args = (self.cluster.slug, self.template)
+        template = 'ganeti/vm_template/to_vms.html'
+
+        self.assert_standard_fails(url, args, authorized=False)
+        self.assert_200(url, args,
+                        users=[self.superuser, self.cluster_admin,
+                               self.create_vm],
+                        template=template)
+
+        self.template.memory = 256
+        self.template.vcpus = 1
+        self.template.save()
+        self.assertTrue(self.c.login(username=self.create_vm.username,
+                                     password='secret'))
+        data = dict(owner=self.create_vm.get_profile().pk,
+                    pattern='worker{n}.example.org', count=2)
+        response = self.c.post(url % args, data)
+        self.assertEqual(200, response.status_code)
+        self.assertTemplateUsed(response, template)
+        self.assertTrue(response.context['batch'])
+        self.assertEqual(2, VirtualMachine.objects
+                         .filter(hostname__startswith='worker').count())
+
     def test_delete_view(self):
         """
         Test deleting a template using the view
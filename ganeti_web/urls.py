@@ -32,6 +32,7 @@ from ganeti_web.views.node import (NodeDetailView, NodePrimaryListView,
 from ganeti_web.views.virtual_machine import VMDeleteView, VMListView
 from ganeti_web.views.vm_template import (TemplateFromVMInstanceView,
                                           VMInstanceFromTemplateView,
+                                          VMInstancesFromTemplateView,
                                           TemplateListView)
 
 cluster_slug = '(?P<cluster_slug>[-_A-Za-z0-9]+)'
@@ -61,6 +62,12 @@ urlpatterns = patterns(
     url(r'clusters/errors', 'get_errors', name="cluster-errors"),
 
     url(r'^about/?$', AboutView.as_view(), name="about"),
+
+    url(r'^metrics/?$', 'metrics', name="metrics"),
+    url(r'^metrics/(?P<api_key>\w+)/?$', 'metrics', name="metrics"),
+
+    url(r'^export/(?P<kind>virtual_machines|nodes|clusters)'
+        r'\.(?P<format>csv|ndjson)$', 'export', name="export"),
 )
 
 
@@ -135,6 +142,8 @@ urlpatterns += patterns(
 
     url(r'^(?P<id>\d+)/jobs/status/?$', "job_status",
         name="cluster-job-status"),
+    url(r'^(?P<id>\d+)/jobs/updates/?$', "job_updates",
+        name="cluster-job-updates"),
 
     url(r'^%s/keys/(?P<api_key>\w+)/?$' % cluster, "ssh_keys",
         name="cluster-keys"),
@@ -157,6 +166,8 @@ urlpatterns += patterns(
 
     url(r'^node/(?P<id>\d+)/jobs/status/?$', "job_status",
         name="node-job-status"),
+    url(r'^node/(?P<id>\d+)/jobs/updates/?$', "job_updates",
+        name="node-job-updates"),
 
     url(r'^%s/primary/?$' % node_prefix, NodePrimaryListView.as_view(),
         name="node-primary-vms"),
@@ -188,10 +199,15 @@ urlpatterns += patterns(
 
     url(r'^vms/$', VMListView.as_view(), name="virtualmachine-list"),
 
+    url(r'^vms/(?P<op>startup|shutdown|reboot)/?$', 'batch_power',
+        name="virtualmachine-batch-power"),
+
     url(r'^%s/?$' % vm_prefix, 'detail', name="instance-detail"),
 
     url(r'^vm/(?P<id>\d+)/jobs/status/?$', 'job_status',
         name="instance-job-status"),
+    url(r'^vm/(?P<id>\d+)/jobs/updates/?$', 'job_updates',
+        name="instance-job-updates"),
 
     url(r'^%s/users/?$' % vm_prefix, 'users', name="vm-users"),
 
@@ -270,6 +286,10 @@ urlpatterns += patterns(
     url(r'^%s/vm/?$' % template_prefix, VMInstanceFromTemplateView.as_view(),
         name='instance-create-from-template'),
 
+    url(r'^%s/vms/?$' % template_prefix,
+        VMInstancesFromTemplateView.as_view(),
+        name='instances-create-from-template'),
+
     url(r'^%s/template/?$' % vm_prefix, TemplateFromVMInstanceView.as_view(),
         name='template-create-from-instance'),
 )
@@ -307,6 +327,9 @@ urlpatterns += patterns(
     url(r'^%s/clear/?' % job, 'clear', name='job-clear'),
 
     url(r'^%s/?' % job, JobDetailView.as_view(), name='job-detail'),
+
+    url(r'^jobs/batch/(?P<id>\d+)/?$', 'batch_status',
+        name='job-batch-status'),
 )
 
 # Search
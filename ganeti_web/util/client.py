@@ -27,9 +27,12 @@ Ganeti RAPI client.
 import logging
 import simplejson as json
 import socket
+import time
 
 import requests
 
+from ganeti_web.util.limiter import LimitTimeout
+
 
 GANETI_RAPI_PORT = 5080
 GANETI_RAPI_VERSION = 2
@@ -159,7 +162,8 @@ class GanetiRapiClient(object):  # pylint: disable-msg=R0904
     _json_encoder = json.JSONEncoder(sort_keys=True)
 
     def __init__(self, host, port=GANETI_RAPI_PORT, username=None,
-                 password=None, timeout=60, logger=logging):
+                 password=None, timeout=60, logger=logging, breaker=None,
+                 limiter=None, metrics=None):
         """
         Initializes this class.
 
@@ -172,6 +176,14 @@ class GanetiRapiClient(object):  # pylint: disable-msg=R0904
         :type password: string
         :param password: the password to connect with
         :param logger: Logging object
+        :type breaker: L{health.CircuitBreaker}
+        :param breaker: optional circuit breaker; requests fail fast while
+                        it is open
+        :type limiter: L{limiter.RateLimiter}
+        :param limiter: optional limiter; requests queue until it lets them
+                        through
+        :type metrics: L{metrics.RapiMetrics}
+        :param metrics: optional collector recording every request
         """
 
         if username is not None and password is None:
@@ -183,6 +195,10 @@ class GanetiRapiClient(object):  # pylint: disable-msg=R0904
         self.password = password
         self.timeout = timeout
         self._logger = logger
+        self.breaker = breaker
+        self.limiter = limiter
+        self.metrics = metrics
+        self.host = host
 
         try:
             socket.inet_pton(socket.AF_INET6, host)
@@ -194,7 +210,8 @@ class GanetiRapiClient(object):  # pylint: disable-msg=R0904
 
         self._base_url = "https://%s" % address
 
-    def _SendRequest(self, method, path, query=None, content=None):
+    def _SendRequest(self, method, path, query=None, content=None,
+                     probe=False):
         """
         Sends an HTTP request.
 
@@ -209,6 +226,8 @@ class GanetiRapiClient(object):  # pylint: disable-msg=R0904
         :param query: query arguments to pass to urllib.urlencode
         :type content: str or None
         :param content: HTTP body content
+        :type probe: bool
+        :param probe: send the request even if the circuit breaker is open
 
         :rtype: object
         :return: JSON-Decoded response
@@ -241,14 +260,33 @@ class GanetiRapiClient(object):  # pylint: disable-msg=R0904
         self._logger.debug("Sending request to %s %s", url, kwargs)
         # print "Sending request to %s %s" % (url, kwargs)
 
+        breaker = self.breaker
+        if breaker is not None and not probe and not breaker.allow():
+            raise GanetiApiError("%s is unavailable, not retrying yet" %
+                                 self._base_url)
+
         try:
-            r = requests.request(method, url, **kwargs)
-        except requests.ConnectionError:
+            if self.limiter is None:
+                r = self._Request(method, path, url, kwargs)
+            else:
+                with self.limiter.slot():
+                    r = self._Request(method, path, url, kwargs)
+        except LimitTimeout, e:
+            raise GanetiApiError("%s: %s" % (self._base_url, e))
+        except requests.ConnectionError, e:
+            if breaker is not None:
+                breaker.record_failure(e)
             raise GanetiApiError("Couldn't connect to %s" % self._base_url)
-        except requests.Timeout:
+        except requests.Timeout, e:
+            if breaker is not None:
+                breaker.record_failure(e)
             raise GanetiApiError("Timed out connecting to %s" %
                                  self._base_url)
 
+        # Any response, even an error, means the server is reachable.
+        if breaker is not None:
+            breaker.record_success()
+
         if r.status_code != requests.codes.ok:
             raise GanetiApiError(str(r.status_code), code=r.status_code)
 
@@ -267,6 +305,35 @@ class GanetiRapiClient(object):  # pylint: disable-msg=R0904
 
         return self._SendRequest("get", "/version")
 
+    def _Request(self, method, path, url, kwargs):
+        """
+        Send a request, recording it if metrics are enabled.
+        """
+
+        if self.metrics is None:
+            return requests.request(method, url, **kwargs)
+
+        start = time.time()
+        try:
+            r = requests.request(method, url, **kwargs)
+        except requests.RequestException:
+            self.metrics.record(self.host, method, path, None,
+                                time.time() - start)
+            raise
+        self.metrics.record(self.host, method, path, r.status_code,
+                            time.time() - start, len(r.content))
+        return r
+
+    def CheckHealth(self):
+        """
+        Checks whether the RAPI server responds, bypassing the circuit
+        breaker.
+
+        :raises GanetiApiError: If the server can't be reached
+        """
+
+        self._SendRequest("get", "/version", probe=True)
+
     def GetFeatures(self):
         """
         Gets the list of optional features supported by RAPI server.
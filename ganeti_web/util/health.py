@@ -0,0 +1,121 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Health tracking for RAPI servers.
+
+Like the RAPI client, this module is standalone and has no Django or Ganeti
+dependencies.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+PROBING = "probing"
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker for a single RAPI server.
+
+    The breaker starts closed and lets every request through. After
+    ``threshold`` consecutive connection failures it opens, and requests
+    fail fast for ``backoff`` seconds. Once the backoff has passed, the next
+    request starts a probe in a background thread instead of waiting on the
+    server itself; the breaker closes again as soon as the probe, or any
+    other request, succeeds. A failed probe opens the breaker for another
+    backoff window.
+
+    All methods are safe to call from several threads.
+    """
+
+    def __init__(self, threshold=3, backoff=30, probe=None, clock=time.time):
+        """
+        :param threshold: consecutive failures before the breaker opens
+        :param backoff: seconds to fail fast before probing the server
+        :param probe: callable checking the server; it should raise on
+                      failure. Without a probe, a single request is let
+                      through instead once the backoff has passed.
+        :param clock: function returning the current time in seconds
+        """
+        self.threshold = threshold
+        self.backoff = backoff
+        self.probe = probe
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.retry_at = None
+        self.last_failure = None
+        self.probe_thread = None
+
+    @property
+    def healthy(self):
+        return self.state == CLOSED
+
+    def allow(self):
+        """
+        Decide whether a request may be sent.
+
+        :rtype: bool
+        :return: False if the request should fail fast
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == PROBING or self._clock() < self.retry_at:
+                return False
+
+            self.state = PROBING
+            if self.probe is None:
+                # this request is the probe
+                return True
+
+        thread = threading.Thread(target=self._run_probe,
+                                  name="rapi-health-probe")
+        thread.daemon = True
+        thread.start()
+        self.probe_thread = thread
+        return False
+
+    def _run_probe(self):
+        try:
+            self.probe()
+        except Exception, e:
+            logger.info("Health probe failed: %s" % e)
+            self.record_failure(e)
+        else:
+            self.record_success()
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.retry_at = None
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.failures += 1
+            self.last_failure = error
+            if self.state == PROBING or self.failures >= self.threshold:
+                self.state = OPEN
+                self.retry_at = self._clock() + self.backoff
@@ -0,0 +1,229 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Concurrency and rate limiting for RAPI servers.
+
+Like the RAPI client, this module is standalone and has no Django or Ganeti
+dependencies.
+"""
+
+from contextlib import contextmanager
+import errno
+import fcntl
+import os
+import threading
+import time
+
+# how long to sleep between attempts to grab a cross-process slot
+POLL_INTERVAL = 0.01
+
+
+class LimitTimeout(Exception):
+    """
+    Raised when a request waited longer than the limiter's timeout.
+    """
+
+
+class RateLimiter(object):
+    """
+    Limits the requests sent to a single RAPI server.
+
+    Two limits are applied, each optional:
+
+     * ``concurrency`` caps the number of requests in flight at once.
+     * ``rate`` is a token bucket: requests are allowed at ``rate`` per second
+       on average, with bursts of up to ``burst`` requests.
+
+    Requests over a limit queue until they may proceed, or until ``timeout``
+    seconds have passed, in which case ``LimitTimeout`` is raised. The time
+    spent queueing is recorded; see ``stats()``.
+
+    A limiter is shared by all threads using it. When ``lock_path`` is given,
+    the limits are also shared with other processes using the same path:
+    concurrency slots are held as ``flock()`` locks on ``<lock_path>.<n>``,
+    and the token bucket is kept in ``<lock_path>.bucket``.
+    """
+
+    def __init__(self, concurrency=None, rate=None, burst=None, timeout=None,
+                 lock_path=None, clock=time.time, sleep=time.sleep):
+        """
+        :param concurrency: maximum requests in flight, or None
+        :param rate: average requests per second, or None
+        :param burst: size of the token bucket; defaults to ``rate``, but at
+                      least 1
+        :param timeout: seconds a request may queue, or None to wait forever
+        :param lock_path: path prefix for cross-process lock files
+        """
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst or max(rate or 0, 1)
+        self.timeout = timeout
+        self.lock_path = lock_path
+        self._clock = clock
+        self._sleep = sleep
+
+        self._cond = threading.Condition(threading.Lock())
+        self.active = 0
+        self._tokens = self.burst
+        self._stamp = clock()
+
+        self.requests = 0
+        self.queued = 0
+        self.queue_time = 0.0
+        self.max_queue_time = 0.0
+
+    @contextmanager
+    def slot(self):
+        """
+        Context manager wrapping a single request.
+        """
+        start = self._clock()
+        deadline = None if self.timeout is None else start + self.timeout
+
+        queued = self._acquire_local(deadline)
+        try:
+            handle, waited = self._acquire_shared(deadline)
+            try:
+                queued = self._take_token(deadline) or waited or queued
+                self._record_wait(self._clock() - start if queued else 0)
+                yield
+            finally:
+                if handle is not None:
+                    handle.close()
+        finally:
+            self._release_local()
+
+    def _remaining(self, deadline):
+        if deadline is None:
+            return None
+        remaining = deadline - self._clock()
+        if remaining <= 0:
+            raise LimitTimeout("Timed out waiting for a free request slot")
+        return remaining
+
+    def _acquire_local(self, deadline):
+        if self.concurrency is None:
+            return False
+        with self._cond:
+            queued = False
+            while self.active >= self.concurrency:
+                queued = True
+                self._cond.wait(self._remaining(deadline))
+            self.active += 1
+            return queued
+
+    def _release_local(self):
+        if self.concurrency is None:
+            return
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def _acquire_shared(self, deadline):
+        """
+        Hold one of ``concurrency`` lock files, shared by every process using
+        ``lock_path``. Returns the open file, which releases the slot when
+        closed, and whether the request had to wait for it.
+        """
+        if self.lock_path is None or self.concurrency is None:
+            return None, False
+        queued = False
+        while True:
+            for n in xrange(self.concurrency):
+                f = open("%s.%d" % (self.lock_path, n), "a")
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except IOError, e:
+                    f.close()
+                    if e.errno not in (errno.EAGAIN, errno.EACCES):
+                        raise
+                else:
+                    return f, queued
+            queued = True
+            self._remaining(deadline)
+            self._sleep(POLL_INTERVAL)
+
+    def _take_token(self, deadline):
+        """
+        Take a token from the bucket, sleeping until one is available.
+
+        A request which must wait reserves its token up front, so requests
+        are served in the order they arrive. Returns whether the request had
+        to wait.
+        """
+        if self.rate is None:
+            return False
+        if self.lock_path is None:
+            with self._cond:
+                wait = self._reserve(deadline)
+        else:
+            wait = self._reserve_shared(deadline)
+        if wait > 0:
+            self._sleep(wait)
+        return wait > 0
+
+    def _reserve(self, deadline, tokens=None, stamp=None):
+        if tokens is None:
+            tokens, stamp = self._tokens, self._stamp
+        now = self._clock()
+        tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+        wait = 0 if tokens >= 1 else (1 - tokens) / self.rate
+        if deadline is not None and now + wait > deadline:
+            raise LimitTimeout("Timed out waiting for the request rate limit")
+        self._tokens, self._stamp = tokens - 1, now
+        return wait
+
+    def _reserve_shared(self, deadline):
+        fd = os.open("%s.bucket" % self.lock_path, os.O_RDWR | os.O_CREAT)
+        f = os.fdopen(fd, "r+")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                tokens, stamp = [float(x) for x in f.read().split()]
+            except ValueError:
+                tokens, stamp = self.burst, self._clock()
+            wait = self._reserve(deadline, tokens, stamp)
+            f.seek(0)
+            f.truncate()
+            f.write("%r %r" % (self._tokens, self._stamp))
+            return wait
+        finally:
+            f.close()
+
+    def _record_wait(self, waited):
+        with self._cond:
+            self.requests += 1
+            if waited > 0:
+                self.queued += 1
+                self.queue_time += waited
+                self.max_queue_time = max(self.max_queue_time, waited)
+
+    def stats(self):
+        """
+        Counters for this limiter, in this process.
+
+        :rtype: dict
+        """
+        with self._cond:
+            return {
+                "active": self.active,
+                "requests": self.requests,
+                "queued": self.queued,
+                "queue_time": self.queue_time,
+                "max_queue_time": self.max_queue_time,
+            }
@@ -0,0 +1,181 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+In-process metrics for RAPI calls.
+
+Like the RAPI client, this module has no Django or Ganeti dependencies.
+Metrics are kept per process; nothing is shared between processes.
+"""
+
+from collections import defaultdict
+import re
+import threading
+
+from ganeti_web.util import perf
+
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# object names in paths are replaced so that all calls to the same endpoint
+# are counted together
+PATH_OBJECT = re.compile(r"^(/2/(?:instances|nodes|groups|jobs|networks))"
+                         r"/[^/]+")
+
+# the view currently being served by this thread, set by
+# ``ganeti_web.middleware.RapiMetricsMiddleware``
+context = threading.local()
+
+
+def normalize_path(path):
+    """
+    Strip object names from a RAPI path.
+
+    >>> normalize_path("/2/instances/vm1.example.com/startup")
+    '/2/instances/<name>/startup'
+    """
+    return PATH_OBJECT.sub(r"\1/<name>", path)
+
+
+def set_view(name):
+    context.view = name
+
+
+def current_view():
+    return getattr(context, "view", None)
+
+
+class Stats(object):
+    """
+    Counters for one endpoint of one cluster.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.time = 0.0
+        self.bytes = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.status = defaultdict(int)
+        self.views = defaultdict(lambda: [0, 0.0])
+
+    def add(self, elapsed, size, status, view):
+        self.count += 1
+        self.time += elapsed
+        self.bytes += size
+        self.status[status] += 1
+        if status != 200:
+            self.errors += 1
+        if view is not None:
+            self.views[view][0] += 1
+            self.views[view][1] += elapsed
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "time": self.time,
+            "bytes": self.bytes,
+            "latency": self.buckets[:],
+            "status": dict(self.status),
+            "views": dict((view, {"count": count, "time": time})
+                          for view, (count, time) in self.views.items()),
+        }
+
+
+class RapiMetrics(object):
+    """
+    Collects RAPI call statistics, keyed by cluster host, method and path.
+
+    A single instance is shared by all clients in a process; it is safe to
+    use from several threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, host, method, path, status, elapsed, size=0):
+        """
+        Record one call.
+
+        :param status: HTTP status code, or None if no response was received
+        :param elapsed: seconds taken by the call
+        :param size: bytes in the response body
+        """
+        perf.add("rapi", elapsed)
+        key = host, method.upper(), normalize_path(path)
+        view = current_view()
+        with self._lock:
+            try:
+                stats = self._stats[key]
+            except KeyError:
+                stats = self._stats[key] = Stats()
+            stats.add(elapsed, size, status, view)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def snapshot(self):
+        """
+        A copy of the current statistics.
+
+        :rtype: list
+        :return: one dict per (host, method, path), sorted by total time
+        """
+        with self._lock:
+            rows = []
+            for (host, method, path), stats in self._stats.items():
+                row = stats.as_dict()
+                row.update(host=host, method=method, path=path)
+                rows.append(row)
+        rows.sort(key=lambda row: row["time"], reverse=True)
+        return rows
+
+    def totals(self, key):
+        """
+        Aggregate the statistics by ``key``, one of "host", "path" or
+        "view".
+
+        :rtype: dict
+        :return: {value: {"count": ..., "errors": ..., "time": ...,
+                 "bytes": ...}}
+        """
+        totals = defaultdict(lambda: dict(count=0, errors=0, time=0.0,
+                                          bytes=0))
+        for row in self.snapshot():
+            if key == "view":
+                # errors and bytes aren't tracked per view
+                for view, stats in row["views"].items():
+                    totals[view]["count"] += stats["count"]
+                    totals[view]["time"] += stats["time"]
+                continue
+            total = totals[row[key]]
+            for field in ("count", "errors", "time", "bytes"):
+                total[field] += row[field]
+        return dict(totals)
+
+
+# the metrics for this process
+rapi_metrics = RapiMetrics()
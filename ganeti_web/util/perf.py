@@ -0,0 +1,85 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Per-thread time accounting.
+
+Code which may be slow reports how long it took under a category, such as
+"rapi" or "pickle". Nothing is recorded unless the current thread has called
+``start()``; ``ganeti_web.middleware.PerformanceMiddleware`` does so for
+sampled requests.
+"""
+
+from contextlib import contextmanager
+import threading
+import time
+
+context = threading.local()
+
+
+def start():
+    context.totals = {}
+    context.running = set()
+
+
+def stop():
+    """
+    Stop recording for this thread.
+
+    :rtype: dict
+    :return: {category: (count, seconds)}
+    """
+    totals = getattr(context, "totals", None) or {}
+    context.totals = None
+    return dict((kind, tuple(total)) for kind, total in totals.items())
+
+
+def active():
+    return getattr(context, "totals", None) is not None
+
+
+def add(kind, elapsed, count=1):
+    totals = getattr(context, "totals", None)
+    if totals is None:
+        return
+    try:
+        total = totals[kind]
+    except KeyError:
+        total = totals[kind] = [0, 0.0]
+    total[0] += count
+    total[1] += elapsed
+
+
+@contextmanager
+def timed(kind):
+    """
+    Time the wrapped block under ``kind``.
+
+    Nested blocks of the same kind, such as included templates, are only
+    counted once.
+    """
+    if not active() or kind in context.running:
+        yield
+        return
+
+    context.running.add(kind)
+    start = time.time()
+    try:
+        yield
+    finally:
+        context.running.discard(kind)
+        add(kind, time.time() - start)
@@ -20,7 +20,7 @@ __all__ = ['INSTANCE', 'INSTANCES', 'XEN_PVM_INSTANCE', 'XEN_HVM_INSTANCE',
            'XEN_INSTANCES', 'NODE', 'NODES', 'NODES_BULK', 'INFO', 'XEN_INFO',
            'OPERATING_SYSTEMS', 'XEN_OPERATING_SYSTEMS', 'JOB', 'JOB_RUNNING',
            'JOB_ERROR', 'JOB_DELETE_SUCCESS', 'JOB_LOG', 'INSTANCES_BULK',
-           'NODES_MAP']
+           'INSTANCES_MAP', 'NODES_MAP']
 
 from response_map import ResponseMap
 
@@ -673,6 +673,15 @@ INSTANCES_BULK = [{'admin_state': False,
                    'uuid': '27bac3d3-f634-4dee-aa60-ed2eeb5f2287'}
                   ]
 
+# map instances response for bulk argument
+INSTANCES_MAP = ResponseMap([
+    (((), {}), INSTANCES),
+    (((False,), {}), INSTANCES),
+    (((), {'bulk': False}), INSTANCES),
+    (((True,), {}), [dict(INSTANCE, name=name) for name in INSTANCES]),
+    (((), {'bulk': True}), [dict(INSTANCE, name=name) for name in INSTANCES]),
+])
+
 # map nodes response for bulk argument
 NODES_MAP = ResponseMap([
     (((), {}), NODES),
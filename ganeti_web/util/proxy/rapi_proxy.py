@@ -18,6 +18,7 @@
 
 from ganeti_web.util import client
 from ganeti_web.util.proxy import CallProxy
+from ganeti_web.util.proxy.response_map import ResponseMap
 from ganeti_web.util.proxy.constants import *
 
 
@@ -35,7 +36,7 @@ class RapiProxy(client.GanetiRapiClient):
         """
         instance = object.__new__(cls)
         instance.__init__(*args, **kwargs)
-        CallProxy.patch(instance, 'GetInstances', False, INSTANCES)
+        CallProxy.patch(instance, 'GetInstances', False, INSTANCES_MAP)
         CallProxy.patch(instance, 'GetInstance', False, INSTANCE)
         CallProxy.patch(instance, 'GetNodes', False, NODES_MAP)
         CallProxy.patch(instance, 'GetNode', False, NODE)
@@ -43,6 +44,7 @@ class RapiProxy(client.GanetiRapiClient):
         CallProxy.patch(instance, 'GetOperatingSystems', False,
                         OPERATING_SYSTEMS)
         CallProxy.patch(instance, 'GetJobStatus', False, JOB_RUNNING)
+        CallProxy.patch(instance, 'Query', True)
         CallProxy.patch(instance, 'StartupInstance', False, 1)
         CallProxy.patch(instance, 'ShutdownInstance', False, 1)
         CallProxy.patch(instance, 'RebootInstance', False, 1)
@@ -62,6 +64,24 @@ class RapiProxy(client.GanetiRapiClient):
 
         return instance
 
+    def Query(self, what, fields, qfilter=None):
+        """
+        Answer job queries from the response set for GetJobStatus, so that
+        tests only need to set up one response.
+        """
+        if what != 'job':
+            raise NotImplementedError(what)
+        response = self.GetJobStatus.response
+        data = []
+        for op, field, job_id in qfilter[1:]:
+            if isinstance(response, ResponseMap):
+                info = response[((job_id,), {})]
+            else:
+                info = response
+            info = dict(info, id=job_id)
+            data.append([(0, info.get(f)) for f in fields])
+        return {'fields': [{'name': f} for f in fields], 'data': data}
+
     def fail(self, *args, **kwargs):
         """
         Raise the error set on this object.
@@ -76,7 +96,7 @@ class RapiProxy(client.GanetiRapiClient):
                    'GetInfo', 'StartupInstance', 'ShutdownInstance',
                    'RebootInstance', 'AddInstanceTags', 'DeleteInstanceTags',
                    'GetOperatingSystems', 'GetJobStatus', 'CreateInstance',
-                   'ReinstallInstance'] \
+                   'ReinstallInstance', 'Query'] \
                 and self.error:
             return self.fail
         return super(RapiProxy, self).__getattribute__(key)
@@ -94,7 +114,7 @@ class XenRapiProxy(RapiProxy):
         instance.GetInstance = None
         instance.GetInfo = None
         instance.GetOperatingSystems = None
-        CallProxy.patch(instance, 'GetInstances', False, INSTANCES)
+        CallProxy.patch(instance, 'GetInstances', False, INSTANCES_MAP)
         CallProxy.patch(instance, 'GetInstance', False, XEN_PVM_INSTANCE)
         CallProxy.patch(instance, 'GetInfo', False, XEN_INFO)
         CallProxy.patch(instance, 'GetOperatingSystems', False,
@@ -0,0 +1,769 @@
+# Copyright (C) 2012 Oregon State University et al.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+
+"""
+Simulated Ganeti RAPI servers for load testing.
+
+Each simulated cluster is an HTTPS server on its own port, serving synthetic
+nodes and instances built from the fixtures in ``constants``. Jobs go
+through the queued, running and finished states over time, and their effects
+(power state, tags, new or removed instances) are applied when they finish.
+
+Run it with::
+
+    python -m ganeti_web.util.proxy.simulator --clusters 2 --instances 10000
+
+then add clusters pointing at localhost and the printed ports. Any username
+and password are accepted.
+
+Like the RAPI client, this module has no Django dependencies.
+"""
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+import copy
+import itertools
+from optparse import OptionParser
+import os
+import random
+import re
+import shutil
+import socket
+import ssl
+from SocketServer import ThreadingMixIn
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urlparse
+import uuid
+
+import simplejson as json
+
+from ganeti_web.util.proxy.constants import (INFO, INSTANCE, JOB, NODE,
+                                             OPERATING_SYSTEMS)
+
+# longest time a wait-for-change request is held, like Ganeti
+WAIT_TIMEOUT = 10
+
+# result status of Query fields
+RS_NORMAL = 0
+RS_UNKNOWN = 1
+
+# instance actions, and the changes they make to the instance once the job
+# has succeeded
+ACTIONS = {
+    "startup": ("OP_INSTANCE_STARTUP",
+                {"status": "running", "admin_state": True,
+                 "oper_state": True}),
+    "shutdown": ("OP_INSTANCE_SHUTDOWN",
+                 {"status": "ADMIN_down", "admin_state": False,
+                  "oper_state": False}),
+    "reboot": ("OP_INSTANCE_REBOOT",
+               {"status": "running", "admin_state": True,
+                "oper_state": True}),
+    "reinstall": ("OP_INSTANCE_REINSTALL", {}),
+    "migrate": ("OP_INSTANCE_MIGRATE", {}),
+    "failover": ("OP_INSTANCE_FAILOVER", {}),
+    "rename": ("OP_INSTANCE_RENAME", {}),
+    "modify": ("OP_INSTANCE_SET_PARAMS", {}),
+    "replace-disks": ("OP_INSTANCE_REPLACE_DISKS", {}),
+    "recreate-disks": ("OP_INSTANCE_RECREATE_DISKS", {}),
+    "activate-disks": ("OP_INSTANCE_ACTIVATE_DISKS", {}),
+    "deactivate-disks": ("OP_INSTANCE_DEACTIVATE_DISKS", {}),
+    "prepare-export": ("OP_BACKUP_PREPARE", {}),
+    "export": ("OP_BACKUP_EXPORT", {}),
+}
+
+
+class NotFound(Exception):
+    pass
+
+
+class Job(object):
+    """
+    A simulated job. Its status depends only on the time since it was
+    submitted.
+    """
+
+    def __init__(self, job_id, op, summary, queued, running, fail,
+                 effect=None):
+        self.id = job_id
+        self.op = op
+        self.summary = summary
+        self.received = time.time()
+        self.started = self.received + queued
+        self.ended = self.started + running
+        self.fail = fail
+        self.effect = effect
+        self.applied = False
+        self.canceled = False
+
+    def status(self, now):
+        if self.canceled:
+            return "canceled"
+        if now < self.started:
+            return "queued"
+        if now < self.ended:
+            return "running"
+        return "error" if self.fail else "success"
+
+    @property
+    def finished(self):
+        return self.canceled or time.time() >= self.ended
+
+    def info(self, now=None):
+        now = now or time.time()
+        status = self.status(now)
+        info = copy.deepcopy(JOB)
+
+        def ts(t):
+            return [int(t), int((t % 1) * 1000000)]
+
+        info.update({
+            "id": self.id,
+            "status": status,
+            "ops": [self.op],
+            "opstatus": [status],
+            "summary": [self.summary],
+            "received_ts": ts(self.received),
+            "start_ts": ts(self.started) if status != "queued" else None,
+            "end_ts": ts(self.ended) if self.finished else None,
+            "oplog": [[]],
+            "opresult": [None],
+        })
+        if status != "queued":
+            info["oplog"] = [[[1, ts(self.started), "message",
+                               "Running %s" % self.summary]]]
+        if status == "error":
+            info["opresult"] = [["OpExecError",
+                                 ["Simulated failure of %s" % self.summary]]]
+        return info
+
+
+class SimulatedCluster(object):
+    """
+    State of one simulated cluster. Methods are safe to call from several
+    threads.
+    """
+
+    def __init__(self, name, nodes=3, instances=10, queued=1, running=5,
+                 failure_rate=0.0, seed=None):
+        """
+        :param name: cluster name; node and instance names are derived from
+                     it
+        :param queued: seconds jobs stay queued
+        :param running: seconds jobs stay running
+        :param failure_rate: fraction of jobs which end in error
+        """
+        self.name = name
+        self.queued = queued
+        self.running = running
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Condition()
+        self.job_ids = itertools.count(1)
+        self.jobs = {}
+        self.tags = []
+
+        self.info = copy.deepcopy(INFO)
+        self.info["name"] = name
+
+        self.nodes = {}
+        node_names = ["node%03d.%s" % (i, name) for i in xrange(nodes)]
+        for i, node_name in enumerate(node_names):
+            node = copy.deepcopy(NODE)
+            node.update(name=node_name, role="M" if i == 0 else "R",
+                        master_candidate=i < 10, pinst_list=[],
+                        sinst_list=[], pinst_cnt=0, sinst_cnt=0,
+                        mtotal=65536, mfree=65536, dtotal=2097152,
+                        dfree=2097152, uuid=self.uuid())
+            self.nodes[node_name] = node
+        self.info["master"] = node_names[0]
+
+        self.instances = {}
+        for i in xrange(instances):
+            pnode = node_names[i % nodes]
+            self.add_instance("vm%05d.%s" % (i, name), pnode)
+
+    def uuid(self):
+        return str(uuid.UUID(int=self.random.getrandbits(128)))
+
+    def add_instance(self, name, pnode, **params):
+        running = self.random.random() < 0.8
+        instance = copy.deepcopy(INSTANCE)
+        instance.update({
+            "name": name,
+            "pnode": pnode,
+            "status": "running" if running else "ADMIN_down",
+            "admin_state": running,
+            "oper_state": running,
+            "uuid": self.uuid(),
+            "network_port": 11000 + len(self.instances),
+            "nic.macs": ["aa:00:00:%02x:%02x:%02x" % tuple(
+                self.random.randint(0, 255) for i in range(3))],
+            "ctime": time.time(),
+            "mtime": time.time(),
+            "tags": [],
+        })
+        instance.update(params)
+        self.instances[name] = instance
+
+        node = self.nodes[pnode]
+        node["pinst_list"].append(name)
+        node["pinst_cnt"] += 1
+        node["mfree"] -= instance["beparams"]["memory"]
+        node["dfree"] -= instance["disk_usage"]
+        return instance
+
+    def remove_instance(self, name):
+        instance = self.instances.pop(name, None)
+        if instance is None:
+            return
+        node = self.nodes[instance["pnode"]]
+        node["pinst_list"].remove(name)
+        node["pinst_cnt"] -= 1
+        node["mfree"] += instance["beparams"]["memory"]
+        node["dfree"] += instance["disk_usage"]
+
+    def instance(self, name):
+        try:
+            return self.instances[name]
+        except KeyError:
+            raise NotFound("Instance %s not found" % name)
+
+    def node(self, name):
+        try:
+            return self.nodes[name]
+        except KeyError:
+            raise NotFound("Node %s not found" % name)
+
+    def job(self, job_id):
+        try:
+            return self.jobs[int(job_id)]
+        except (KeyError, ValueError):
+            raise NotFound("Job %s not found" % job_id)
+
+    # Jobs
+
+    def submit(self, op_id, summary, effect=None, **params):
+        """
+        Queue a job. ``effect`` is called, with the lock held, if the job
+        succeeds.
+
+        :return: job id
+        """
+        with self.lock:
+            job_id = self.job_ids.next()
+            op = dict(params, OP_ID=op_id, debug_level=0, dry_run=False)
+            fail = self.random.random() < self.failure_rate
+            self.jobs[job_id] = Job(job_id, op, summary, self.queued,
+                                    self.running, fail, effect)
+            return job_id
+
+    def advance(self):
+        """
+        Apply the effects of jobs which finished since the last call.
+        """
+        now = time.time()
+        with self.lock:
+            for job in self.jobs.itervalues():
+                if job.applied or not job.finished:
+                    continue
+                job.applied = True
+                if job.effect is not None and job.status(now) == "success":
+                    job.effect()
+            self.lock.notify_all()
+
+    def instance_action(self, name, action, **params):
+        instance = self.instance(name)
+        op_id, changes = ACTIONS[action]
+
+        def effect():
+            if name in self.instances:
+                instance.update(changes)
+                instance["mtime"] = time.time()
+                instance["serial_no"] += 1
+
+        return self.submit(op_id, "%s(%s)" % (op_id[3:], name), effect,
+                           instance_name=name, **params)
+
+    def create_instance(self, params):
+        name = params["instance_name"]
+        pnode = params.get("pnode") or self.random.choice(self.nodes.keys())
+
+        def effect():
+            beparams = dict(INSTANCE["beparams"], **params.get("beparams", {}))
+            disks = [d["size"] for d in params.get("disks", [])] or [5120]
+            self.add_instance(name, pnode, os=params.get("os", ""),
+                              beparams=beparams, disk_usage=sum(disks),
+                              **{"disk.sizes": disks})
+
+        return self.submit("OP_INSTANCE_CREATE", "INSTANCE_CREATE(%s)" % name,
+                           effect, instance_name=name)
+
+    def delete_instance(self, name):
+        self.instance(name)
+        return self.submit("OP_INSTANCE_REMOVE", "INSTANCE_REMOVE(%s)" % name,
+                           lambda: self.remove_instance(name),
+                           instance_name=name)
+
+    def set_tags(self, tags, new, remove=False):
+        """
+        Change the tag list ``tags`` in a job.
+        """
+        def effect():
+            for tag in new:
+                if remove and tag in tags:
+                    tags.remove(tag)
+                elif not remove and tag not in tags:
+                    tags.append(tag)
+
+        op_id = "OP_TAGS_DEL" if remove else "OP_TAGS_SET"
+        return self.submit(op_id, "%s(%s)" % (op_id[3:], ",".join(new)),
+                           effect, tags=new)
+
+    def wait_for_change(self, job_id, fields, prev_info, prev_serial,
+                        timeout=WAIT_TIMEOUT):
+        """
+        Block until the given fields of a job differ from ``prev_info``, or
+        until the timeout passes.
+
+        :return: {"job_info": ..., "log_entries": ...} or None if nothing
+                 changed
+        """
+        deadline = time.time() + timeout
+        job = self.job(job_id)
+        with self.lock:
+            while True:
+                info = job.info()
+                current = [info[field] for field in fields]
+                log = [entry for entry in info["oplog"][0]
+                       if prev_serial is None or entry[0] > prev_serial]
+                if current != prev_info or log:
+                    return {"job_info": current, "log_entries": log}
+                if job.finished:
+                    return {"job_info": current, "log_entries": []}
+
+                now = time.time()
+                if now >= deadline:
+                    return None
+                if info["status"] == "queued":
+                    next_change = job.started
+                else:
+                    next_change = job.ended
+                self.lock.wait(max(min(deadline, next_change) - now, 0.01))
+
+    # Queries
+
+    def query(self, what, fields, qfilter=None):
+        """
+        Answer a query, as ``PUT /2/query/<what>``.
+        """
+        if what == "job":
+            items = [job.info() for job in self.jobs.itervalues()]
+        elif what == "instance":
+            items = self.instances.values()
+        elif what == "node":
+            items = self.nodes.values()
+        else:
+            raise NotFound("Unknown resource %s" % what)
+
+        data = []
+        for item in items:
+            if qfilter and not self.matches(item, qfilter):
+                continue
+            row = []
+            for field in fields:
+                if field in item:
+                    row.append([RS_NORMAL, item[field]])
+                else:
+                    row.append([RS_UNKNOWN, None])
+            data.append(row)
+
+        return {
+            "fields": [{"name": f, "title": f, "kind": "other", "doc": f}
+                       for f in fields],
+            "data": data,
+        }
+
+    def matches(self, item, qfilter):
+        op = qfilter[0]
+        args = qfilter[1:]
+        if op == "|":
+            return any(self.matches(item, f) for f in args)
+        if op == "&":
+            return all(self.matches(item, f) for f in args)
+        if op == "!":
+            return not self.matches(item, args[0])
+        if op == "?":
+            return bool(item.get(args[0]))
+
+        field, value = args
+        actual = item.get(field)
+        if field == "id":
+            actual, value = str(actual), str(value)
+        if op == "==" or op == "=":
+            return actual == value
+        if op == "!=":
+            return actual != value
+        if op == "=~":
+            return re.search(value, actual or "") is not None
+        if op == "=[]":
+            return value in (actual or [])
+        raise ValueError("Unsupported filter operator %s" % op)
+
+
+class RapiHandler(BaseHTTPRequestHandler):
+    """
+    Serves the RAPI of ``self.server.cluster``.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    # (method, path regex, handler method name)
+    routes = [
+        ("GET", r"/version$", "version"),
+        ("GET", r"/2/info$", "info"),
+        ("GET", r"/2/os$", "os"),
+        ("GET", r"/2/features$", "features"),
+        ("GET", r"/2/tags$", "cluster_tags"),
+        ("PUT", r"/2/tags$", "add_cluster_tags"),
+        ("DELETE", r"/2/tags$", "remove_cluster_tags"),
+        ("PUT", r"/2/redistribute-config$", "redistribute_config"),
+        ("GET", r"/2/instances$", "instances"),
+        ("POST", r"/2/instances$", "create_instance"),
+        ("GET", r"/2/instances/([^/]+)$", "instance"),
+        ("DELETE", r"/2/instances/([^/]+)$", "delete_instance"),
+        ("GET", r"/2/instances/([^/]+)/tags$", "instance_tags"),
+        ("PUT", r"/2/instances/([^/]+)/tags$", "add_instance_tags"),
+        ("DELETE", r"/2/instances/([^/]+)/tags$", "remove_instance_tags"),
+        ("GET", r"/2/instances/([^/]+)/info$", "instance_info"),
+        ("GET", r"/2/instances/([^/]+)/console$", "instance_console"),
+        ("PUT|POST", r"/2/instances/([^/]+)/([-a-z]+)$", "instance_action"),
+        ("GET", r"/2/nodes$", "nodes"),
+        ("GET", r"/2/nodes/([^/]+)$", "node"),
+        ("GET", r"/2/nodes/([^/]+)/role$", "node_role"),
+        ("PUT", r"/2/nodes/([^/]+)/role$", "set_node_role"),
+        ("GET", r"/2/nodes/([^/]+)/tags$", "node_tags"),
+        ("PUT|POST", r"/2/nodes/([^/]+)/([-a-z]+)$", "node_action"),
+        ("GET", r"/2/groups$", "groups"),
+        ("GET", r"/2/jobs$", "jobs"),
+        ("GET", r"/2/jobs/(\d+)$", "job"),
+        ("DELETE", r"/2/jobs/(\d+)$", "cancel_job"),
+        ("GET", r"/2/jobs/(\d+)/wait$", "wait_job"),
+        ("GET|PUT", r"/2/query/([a-z]+)$", "query"),
+    ]
+    routes = [(re.compile(methods + "$"), re.compile(path), name)
+              for methods, path, name in routes]
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        self.dispatch()
+
+    do_PUT = do_POST = do_DELETE = do_GET
+
+    def dispatch(self):
+        url = urlparse.urlparse(self.path)
+        self.params = urlparse.parse_qs(url.query)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else ""
+        self.body = json.loads(body) if body else {}
+
+        cluster = self.server.cluster
+        cluster.advance()
+        self.server.delay()
+
+        for methods, path, name in self.routes:
+            match = path.match(url.path)
+            if match and methods.match(self.command):
+                break
+        else:
+            return self.respond(404, {"code": 404, "message": "Not found"})
+
+        try:
+            with cluster.lock:
+                result = getattr(self, name)(cluster, *match.groups())
+        except NotFound, e:
+            return self.respond(404, {"code": 404, "message": str(e)})
+        except (KeyError, ValueError), e:
+            return self.respond(400, {"code": 400, "message": str(e)})
+        self.respond(200, result)
+
+    def respond(self, code, result):
+        content = json.dumps(result)
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def bulk(self):
+        return self.params.get("bulk", [""])[0] in ("1", "True", "true")
+
+    def version(self, cluster):
+        return 2
+
+    def info(self, cluster):
+        return cluster.info
+
+    def os(self, cluster):
+        return OPERATING_SYSTEMS
+
+    def features(self, cluster):
+        return ["instance-create-reqv1", "instance-reinstall-reqv1",
+                "node-migrate-reqv1", "node-evac-res1"]
+
+    def cluster_tags(self, cluster):
+        return cluster.tags
+
+    def add_cluster_tags(self, cluster):
+        return cluster.set_tags(cluster.tags, self.tag_list())
+
+    def remove_cluster_tags(self, cluster):
+        return cluster.set_tags(cluster.tags, self.tag_list(), remove=True)
+
+    def redistribute_config(self, cluster):
+        return cluster.submit("OP_CLUSTER_REDIST_CONF", "CLUSTER_REDIST_CONF")
+
+    def tag_list(self):
+        return self.params.get("tag", [])
+
+    def instances(self, cluster):
+        if self.bulk():
+            return cluster.instances.values()
+        return [{"id": name, "uri": "/2/instances/%s" % name}
+                for name in cluster.instances]
+
+    def create_instance(self, cluster):
+        return cluster.create_instance(self.body)
+
+    def instance(self, cluster, name):
+        return cluster.instance(name)
+
+    def delete_instance(self, cluster, name):
+        return cluster.delete_instance(name)
+
+    def instance_tags(self, cluster, name):
+        return cluster.instance(name)["tags"]
+
+    def add_instance_tags(self, cluster, name):
+        return cluster.set_tags(cluster.instance(name)["tags"],
+                                self.tag_list())
+
+    def remove_instance_tags(self, cluster, name):
+        return cluster.set_tags(cluster.instance(name)["tags"],
+                                self.tag_list(), remove=True)
+
+    def instance_info(self, cluster, name):
+        cluster.instance(name)
+        return cluster.submit("OP_INSTANCE_QUERY_DATA",
+                              "INSTANCE_QUERY_DATA(%s)" % name,
+                              instance_name=name)
+
+    def instance_console(self, cluster, name):
+        instance = cluster.instance(name)
+        return {"instance": name, "kind": "vnc", "host": instance["pnode"],
+                "port": instance["network_port"], "display": 0}
+
+    def instance_action(self, cluster, name, action):
+        if action not in ACTIONS:
+            raise NotFound("Unknown action %s" % action)
+        return cluster.instance_action(name, action)
+
+    def nodes(self, cluster):
+        if self.bulk():
+            return cluster.nodes.values()
+        return [{"id": name, "uri": "/2/nodes/%s" % name}
+                for name in cluster.nodes]
+
+    def node(self, cluster, name):
+        return cluster.node(name)
+
+    def node_role(self, cluster, name):
+        return {"M": "master", "C": "master-candidate", "R": "regular",
+                "D": "drained", "O": "offline"}[cluster.node(name)["role"]]
+
+    def set_node_role(self, cluster, name):
+        node = cluster.node(name)
+        role = self.body
+
+        def effect():
+            node["role"] = {"master-candidate": "C", "regular": "R",
+                            "drained": "D", "offline": "O"}.get(role, "R")
+            node["offline"] = role == "offline"
+            node["drained"] = role == "drained"
+
+        return cluster.submit("OP_NODE_SET_PARAMS",
+                              "NODE_SET_PARAMS(%s)" % name, effect,
+                              node_name=name)
+
+    def node_tags(self, cluster, name):
+        return cluster.node(name)["tags"]
+
+    def node_action(self, cluster, name, action):
+        cluster.node(name)
+        op_id = "OP_NODE_%s" % action.upper().replace("-", "_")
+        return cluster.submit(op_id, "%s(%s)" % (op_id[3:], name),
+                              node_name=name)
+
+    def groups(self, cluster):
+        return [{"name": "default", "uri": "/2/groups/default"}]
+
+    def jobs(self, cluster):
+        return [{"id": job_id, "uri": "/2/jobs/%s" % job_id}
+                for job_id in cluster.jobs]
+
+    def job(self, cluster, job_id):
+        return cluster.job(job_id).info()
+
+    def cancel_job(self, cluster, job_id):
+        job = cluster.job(job_id)
+        if job.status(time.time()) == "queued":
+            job.canceled = True
+            return [True, "Job %s canceled" % job_id]
+        return [False, "Job %s is no longer waiting in the queue" % job_id]
+
+    def wait_job(self, cluster, job_id):
+        return cluster.wait_for_change(
+            job_id, self.body["fields"], self.body.get("previous_job_info"),
+            self.body.get("previous_log_serial"))
+
+    def query(self, cluster, what):
+        fields = self.body.get("fields")
+        if fields is None:
+            fields = self.params.get("fields", [""])[0].split(",")
+        return cluster.query(what, fields, self.body.get("qfilter"))
+
+
+class SimulatorServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTPS server for one simulated cluster.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, cluster, certfile, latency=0.0, jitter=0.0,
+                 verbose=False):
+        HTTPServer.__init__(self, address, RapiHandler)
+        self.socket = ssl.wrap_socket(self.socket, certfile=certfile,
+                                      server_side=True)
+        self.cluster = cluster
+        self.latency = latency
+        self.jitter = jitter
+        self.verbose = verbose
+
+    def handle_error(self, request, client_address):
+        # clients routinely drop kept-alive connections without a TLS
+        # shutdown
+        if not isinstance(sys.exc_info()[1], (ssl.SSLError, socket.error)):
+            HTTPServer.handle_error(self, request, client_address)
+
+    def delay(self):
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def start(self):
+        """
+        Serve in a background thread.
+        """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+def make_certificate(directory):
+    """
+    Create a self-signed certificate with the ``openssl`` tool.
+
+    :return: path of a PEM file holding both key and certificate
+    """
+    path = os.path.join(directory, "simulator.pem")
+    subprocess.check_call(
+        ["openssl", "req", "-x509", "-nodes", "-newkey", "rsa:2048",
+         "-days", "30", "-subj", "/CN=localhost", "-keyout", path,
+         "-out", path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return path
+
+
+def main(argv=None):
+    parser = OptionParser(usage="%prog [options]",
+                          description="Serve simulated Ganeti clusters.")
+    parser.add_option("--clusters", type="int", default=1,
+                      help="number of clusters, on consecutive ports")
+    parser.add_option("--nodes", type="int", default=3,
+                      help="nodes per cluster")
+    parser.add_option("--instances", type="int", default=10,
+                      help="instances per cluster")
+    parser.add_option("--host", default="localhost")
+    parser.add_option("--port", type="int", default=5080,
+                      help="port of the first cluster")
+    parser.add_option("--latency", type="float", default=0.0,
+                      help="seconds added to every response")
+    parser.add_option("--jitter", type="float", default=0.0,
+                      help="random variation of the latency, in seconds")
+    parser.add_option("--queued", type="float", default=1.0,
+                      help="seconds jobs stay queued")
+    parser.add_option("--running", type="float", default=5.0,
+                      help="seconds jobs stay running")
+    parser.add_option("--failure-rate", type="float", default=0.0,
+                      help="fraction of jobs which fail")
+    parser.add_option("--seed", type="int", help="random seed")
+    parser.add_option("--cert", help="PEM file with key and certificate; "
+                      "a self-signed one is made if not given")
+    parser.add_option("-v", "--verbose", action="store_true", default=False,
+                      help="log every request")
+    options, args = parser.parse_args(argv)
+
+    tmp = None
+    certfile = options.cert
+    if certfile is None:
+        tmp = tempfile.mkdtemp()
+        certfile = make_certificate(tmp)
+
+    try:
+        for i in xrange(options.clusters):
+            name = "cluster%d.example.test" % i
+            seed = None if options.seed is None else options.seed + i
+            cluster = SimulatedCluster(name, options.nodes, options.instances,
+                                       options.queued, options.running,
+                                       options.failure_rate, seed)
+            port = options.port + i
+            server = SimulatorServer((options.host, port), cluster, certfile,
+                                     options.latency, options.jitter,
+                                     options.verbose)
+            server.start()
+            print "%s: https://%s:%d/ (%d nodes, %d instances)" % (
+                name, options.host, port, options.nodes, options.instances)
+
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -23,14 +23,14 @@ from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import PermissionDenied
 from django.core.urlresolvers import reverse
-from django.db.models import Q, Sum
+from django.db.models import Q
 from django.http import (HttpResponse, HttpResponseRedirect,
                          HttpResponseForbidden)
 from django.shortcuts import get_object_or_404, render_to_response, redirect
 from django.template import RequestContext
 from django.utils import simplejson as json
 from django.utils.translation import ugettext as _
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import condition, require_POST
 from django.views.generic.detail import DetailView
 
 from django_tables2 import SingleTableView
@@ -50,7 +50,10 @@ from ganeti_web.models import (Cluster, ClusterUser, Profile, SSHKey,
                                VirtualMachine, Job)
 from ganeti_web.views import render_404
 from ganeti_web.views.generic import (NO_PRIVS, LoginRequiredMixin,
-                                      PaginationMixin, GWMBaseView)
+                                      KeysetPaginationMixin, PaginationMixin,
+                                      GWMBaseView)
+from ganeti_web.views.jobs import (job_status_etag, job_updates_etag,
+                                   wait_for_updates)
 from ganeti_web.views.tables import (ClusterTable, ClusterVMTable,
                                      ClusterJobTable)
 from ganeti_web.views.virtual_machine import BaseVMListView
@@ -137,12 +140,13 @@ class ClusterVMListView(BaseVMListView):
         return context
 
 
-class ClusterJobListView(LoginRequiredMixin, PaginationMixin, GWMBaseView,
-                         SingleTableView):
+class ClusterJobListView(LoginRequiredMixin, KeysetPaginationMixin,
+                         GWMBaseView, SingleTableView):
 
     template_name = "ganeti/cluster/jobs.html"
     model = Job
     table_class = ClusterJobTable
+    keyset = ("job_id", "id")
 
     def get_template_names(self):
         if self.request.is_ajax():
@@ -180,29 +184,9 @@ def nodes(request, cluster_slug):
     if not (user.is_superuser or user.has_perm('admin', cluster)):
         raise PermissionDenied(NO_PRIVS)
 
-    # query allocated CPUS for all nodes in this list.  Must be done here to
-    # avoid querying Node.allocated_cpus for each node in the list.  Repackage
-    # list so it is easier to retrieve the values in the template
-    values = VirtualMachine.objects \
-        .filter(cluster=cluster, status='running') \
-        .exclude(virtual_cpus=-1) \
-        .order_by() \
-        .values('primary_node') \
-        .annotate(cpus=Sum('virtual_cpus'))
-    cpus = {}
-    nodes = cluster.nodes.all()
-    for d in values:
-        cpus[d['primary_node']] = d['cpus']
-
-    # Include nodes that do not have any virtual machines on them.
-    for node in nodes:
-        if node.pk not in cpus:
-            cpus[node.pk] = 0
-
     return render_to_response("ganeti/node/table.html",
                               {'cluster': cluster,
-                               'nodes': nodes,
-                               'cpus': cpus,
+                               'nodes': cluster.nodes.all(),
                                },
                               context_instance=RequestContext(request),
                               )
@@ -413,6 +397,7 @@ def quota(request, cluster_slug, user_id):
 
 
 @login_required
+@condition(etag_func=job_status_etag(Cluster))
 def job_status(request, id, rest=False):
     """
     Return a list of basic info for running jobs.
@@ -430,6 +415,15 @@ def job_status(request, id, rest=False):
         return HttpResponse(json.dumps(jobs), mimetype='application/json')
 
 
+@login_required
+@condition(etag_func=job_updates_etag(Cluster))
+def job_updates(request, id):
+    """
+    Wait for changes to the running jobs.
+    """
+    return wait_for_updates(request, Cluster, id, watch_object=False)
+
+
 @login_required
 def object_log(request, cluster_slug):
     """ displays object log for this cluster """
@@ -15,24 +15,28 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
 # USA.
 
+from hashlib import md5
 from itertools import chain, izip, repeat
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import PermissionDenied
-from django.db.models import Q, Count
+from django.db.models import Q, Count, Max, Sum
 from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import render_to_response, get_object_or_404
 from django.template import RequestContext
 from django.utils import simplejson as json
+from django.views.decorators.http import condition
 from django.views.generic.base import TemplateView
 
 from object_permissions import get_users_any
 
-from ganeti_web.backend.queries import vm_qs_for_admins
+from ganeti_web.backend.export import csv_lines, inventory_chunks, json_lines
+from ganeti_web.backend.metrics import process_stats
+from ganeti_web.backend.queries import prefetch_objects, vm_qs_for_admins
 from ganeti_web.models import Cluster, VirtualMachine, Job, GanetiError, \
-    ClusterUser, Profile, Organization, SSHKey
+    ClusterUser, Profile, Organization, Quota, SSHKey
 from ganeti_web.views import render_404
 from ganeti_web.views.generic import NO_PRIVS
 from django.utils.translation import ugettext as _
@@ -110,7 +114,8 @@ def get_errors(request):
         ganeti_errors |= qs.get_errors(obj=clusters)
 
     # merge error lists
-    errors = merge_errors(ganeti_errors, job_errors)
+    errors = merge_errors(prefetch_objects(ganeti_errors),
+                          prefetch_objects(job_errors))
 
     return render_to_response("ganeti/errors.html",
                               {
@@ -290,7 +295,50 @@ def overview(request, rest=False):
                                   context_instance=RequestContext(request))
 
 
+def can_view_resources(user, cluster_user):
+    """
+    Must be a super user, the user in question, or a member of the group.
+    """
+    if user.is_superuser:
+        return True
+    user_type = ContentType.objects.get_for_model(Profile)
+    if cluster_user.real_type_id == user_type.pk:
+        return Profile.objects.filter(clusteruser_ptr=cluster_user.pk,
+                                      user=user).exists()
+    return Organization.objects.filter(clusteruser_ptr=cluster_user.pk,
+                                       group__user=user).exists()
+
+
+def used_resources_etag(request, rest=False):
+    """
+    Version of the resources used by a cluster user, computed with a few
+    small queries instead of the quotas and usage of every cluster.
+
+    VMs are covered by their ids and the time they were last refreshed from
+    Ganeti, which is when their resources change.
+    """
+    if rest:
+        return None
+    try:
+        cu = ClusterUser.objects.get(pk=request.GET['id'])
+    except (KeyError, ValueError, ClusterUser.DoesNotExist):
+        return None
+    if not can_view_resources(request.user, cu):
+        return None
+
+    cu = cu.cast()
+    vms = cu.virtual_machines.order_by() \
+        .aggregate(Count('pk'), Sum('pk'), Max('cached'))
+    clusters = cu.permissable.get_objects_any_perms(Cluster) \
+        .order_by('pk').values_list('pk', 'ram', 'disk', 'virtual_cpus')
+    quotas = Quota.objects.filter(user=cu).order_by('cluster') \
+        .values_list('cluster', 'ram', 'disk', 'virtual_cpus')
+    return md5(repr((sorted(vms.items()), list(clusters), list(quotas)))) \
+        .hexdigest()
+
+
 @login_required
+@condition(etag_func=used_resources_etag)
 def used_resources(request, rest=False):
     """ view for returning used resources for a given cluster user """
     try:
@@ -299,18 +347,8 @@ def used_resources(request, rest=False):
         return render_404(request, 'requested user was not found')
     cu = get_object_or_404(ClusterUser, pk=cluster_user_id)
 
-    # must be a super user, the user in question, or a member of the group
-    user = request.user
-    if not user.is_superuser:
-        user_type = ContentType.objects.get_for_model(Profile)
-        if cu.real_type_id == user_type.pk:
-            if not Profile.objects.filter(clusteruser_ptr=cu.pk, user=user) \
-                    .exists():
-                raise PermissionDenied(_('You are not authorized to view this page'))
-        else:
-            if not Organization.objects.filter(clusteruser_ptr=cu.pk,
-                                               group__user=user).exists():
-                raise PermissionDenied(_('You are not authorized to view this page'))
+    if not can_view_resources(request.user, cu):
+        raise PermissionDenied(_('You are not authorized to view this page'))
 
     resources = get_used_resources(cu.cast())
     if rest:
@@ -369,3 +407,37 @@ def ssh_keys(request, api_key):
 
     keys_list = list(keys)
     return HttpResponse(json.dumps(keys_list), mimetype="application/json")
+
+
+def metrics(request, api_key=None):
+    """
+    RAPI statistics of the process serving this request, as JSON.
+
+    Available to superusers, and to monitoring scripts using the API key.
+    """
+    if api_key is None:
+        if not request.user.is_superuser:
+            raise PermissionDenied(NO_PRIVS)
+    elif settings.WEB_MGR_API_KEY != api_key:
+        return HttpResponseForbidden(_("You're not allowed to view metrics."))
+
+    return HttpResponse(json.dumps(process_stats()),
+                        mimetype="application/json")
+
+
+@login_required
+def export(request, kind, format):
+    """
+    Stream the virtual machines, nodes or clusters the user can see, as CSV
+    or as JSON with one object per line.
+    """
+    names, chunks = inventory_chunks(request.user, kind,
+                                     settings.EXPORT_CHUNK_SIZE)
+    if format == "csv":
+        response = HttpResponse(csv_lines(names, chunks), mimetype="text/csv")
+    else:
+        response = HttpResponse(json_lines(names, chunks),
+                                mimetype="application/x-ndjson")
+    response["Content-Disposition"] = "attachment; filename=%s.%s" % (
+        kind, format)
+    return response
@@ -5,11 +5,15 @@
 from collections import Iterable
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.exceptions import ImproperlyConfigured, PermissionDenied
+from django.core.exceptions import (ImproperlyConfigured, PermissionDenied,
+                                    ValidationError)
+from django.db.models import Q
 from django.utils.decorators import method_decorator
 from django.utils.http import urlencode
 from django.utils.translation import ugettext as _
 
+from django_tables2 import RequestConfig
+
 # Standard translation messages. We use these everywhere.
 
 NO_PRIVS = _('You do not have sufficient privileges')
@@ -103,6 +107,193 @@ class PaginationMixin(object):
         return self.request.GET.get("count", self.paginate_by)
 
 
+class KeysetPage(object):
+    """
+    A page of a KeysetPaginator. Pages have no numbers; the cursors of the
+    neighbouring pages are used in links instead.
+    """
+
+    keyset = True
+
+    def __init__(self, object_list, paginator, has_previous, has_next):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    @property
+    def previous_cursor(self):
+        return self.paginator.cursor(self.object_list.data[0])
+
+    @property
+    def next_cursor(self):
+        return self.paginator.cursor(self.object_list.data[-1])
+
+
+class KeysetPaginator(object):
+    """
+    Paginates the rows of a table by keyset: a page is selected with a
+    filter on the fields of the keyset, starting after (or ending before)
+    the row given by a cursor, instead of with an OFFSET. Every page costs
+    the same as the first one, however deep it is.
+
+    The keyset must end with a unique field, such as "id". Fields may be
+    prefixed with "-" for descending order.
+
+    Counting the rows is left until ``count`` is used. With ``count_limit``,
+    at most that many rows are counted, and ``approximate`` is set when
+    there are more.
+    """
+
+    def __init__(self, rows, per_page, keyset, after=None, before=None,
+                 count_limit=None):
+        self.rows = rows
+        self.per_page = int(per_page)
+        self.keyset = keyset
+        self.after = after
+        self.before = before
+        self.count_limit = count_limit
+        self.approximate = False
+        self.queryset = rows.data.data.order_by(*keyset)
+        self.fields = [f.lstrip("-") for f in keyset]
+
+    def cursor(self, record):
+        return ",".join(unicode(getattr(record, f)) for f in self.fields)
+
+    def parse_cursor(self, cursor):
+        """
+        @return list of the keyset values of a cursor, or None if it isn't
+                valid
+        """
+        values = cursor.rsplit(",", len(self.fields) - 1)
+        if len(values) != len(self.fields):
+            return None
+        opts = self.queryset.model._meta
+        try:
+            return [opts.get_field(f).to_python(v)
+                    for f, v in zip(self.fields, values)]
+        except ValidationError:
+            return None
+
+    def filter(self, values, reverse=False):
+        """
+        Q selecting the rows after the row with keyset ``values``, or before
+        it if ``reverse`` is set.
+        """
+        q = Q()
+        for i, field in enumerate(self.keyset):
+            descending = field.startswith("-")
+            lookup = "lt" if descending != reverse else "gt"
+            term = dict(zip(self.fields[:i], values[:i]))
+            term["%s__%s" % (self.fields[i], lookup)] = values[i]
+            q |= Q(**term)
+        return q
+
+    def page(self, number=1):
+        """
+        Get the page for the current cursor. ``number`` is only accepted for
+        compatibility with Paginator and is ignored.
+        """
+        after = self.after and self.parse_cursor(self.after)
+        before = not after and self.before and self.parse_cursor(self.before)
+        qs = self.queryset
+
+        if before:
+            qs = qs.filter(self.filter(before, reverse=True)).reverse()
+            records = list(qs[:self.per_page + 1])
+            has_previous = len(records) > self.per_page
+            records = records[:self.per_page][::-1]
+            has_next = True
+        else:
+            if after:
+                qs = qs.filter(self.filter(after))
+            records = list(qs[:self.per_page + 1])
+            has_next = len(records) > self.per_page
+            records = records[:self.per_page]
+            has_previous = bool(after)
+
+        if not records and (after or before):
+            # the rows around the cursor are gone; start over
+            self.after = self.before = None
+            return self.page()
+
+        rows = self.rows.__class__(records, table=self.rows.table)
+        return KeysetPage(rows, self, has_previous, has_next)
+
+    @property
+    def count(self):
+        if not hasattr(self, "_count"):
+            qs = self.rows.data.data.order_by()
+            if self.count_limit:
+                pks = qs.values_list("pk", flat=True)[:self.count_limit + 1]
+                self._count = len(pks)
+                if self._count > self.count_limit:
+                    self._count = self.count_limit
+                    self.approximate = True
+            else:
+                self._count = qs.count()
+        return self._count
+
+
+class KeysetPaginationMixin(PaginationMixin):
+    """
+    Helper which paginates the table of a SingleTableView by keyset while
+    the table is sorted by the first field of ``keyset``. Sorted by any
+    other column, the table is paginated by page number as usual.
+
+    The table does all the pagination; the list view itself isn't paginated.
+    """
+
+    keyset = None
+
+    def get_paginate_by(self, queryset):
+        return None
+
+    def get_keyset(self, table):
+        """
+        Return the keyset for the table's current sorting, or None if it
+        can't be paginated by keyset.
+        """
+        order_by = table.order_by
+        if len(order_by) != 1 or order_by[0].bare != self.keyset[0]:
+            return None
+        if order_by[0].is_descending:
+            return tuple("-%s" % f for f in self.keyset)
+        return tuple(self.keyset)
+
+    def get_table(self):
+        table = self.get_table_class()(self.get_table_data())
+        RequestConfig(self.request, paginate=False).configure(table)
+        keyset = self.get_keyset(table)
+        if keyset is None:
+            RequestConfig(self.request,
+                          paginate=self.get_table_pagination()
+                          ).configure(table)
+            return table
+
+        GET = self.request.GET
+        try:
+            per_page = max(int(GET[table.prefixed_per_page_field]), 1)
+        except (KeyError, ValueError):
+            per_page = self.get_table_pagination()["per_page"]
+        table.paginate(KeysetPaginator, per_page, keyset=keyset,
+                       after=GET.get("after"), before=GET.get("before"),
+                       count_limit=settings.TABLE_COUNT_LIMIT)
+        return table
+
+
 class SortingMixin(object):
     """
     A mixin which provides sorting for a ListView
@@ -20,10 +20,14 @@ from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
 from django.shortcuts import render_to_response
 from django.template import RequestContext
+from django.utils.translation import ugettext as _
 
+from ganeti_web.backend.importing import import_virtual_machines
+from ganeti_web.backend.tags import schedule_reconcile, set_owner
 from ganeti_web.forms.importing \
     import ImportForm, OrphanForm, VirtualMachineForm
 from ganeti_web.models import VirtualMachine, Cluster
+from ganeti_web.util.client import GanetiApiError
 from ganeti_web.views.generic import NO_PRIVS
 
 
@@ -57,15 +61,9 @@ def orphans(request):
             owner = data['owner']
             vm_ids = data['virtual_machines']
 
-            # update the owner and save the vm.  This isn't the most efficient
-            # way of updating the VMs but we would otherwise need to group them
-            # by cluster
-            orphaned = defaultdict(lambda: 0)
-            for id in vm_ids:
-                vm = VirtualMachine.objects.get(id=id)
-                vm.owner = owner
-                vm.save()
-                orphaned[vm.cluster_id] -= 1
+            # update the owner of all VMs at once; owner tags are pushed to
+            # ganeti in the background
+            set_owner(VirtualMachine.objects.filter(id__in=vm_ids), owner)
 
             # remove updated vms from the list
             vms_with_cluster = [i for i in vms_with_cluster
@@ -176,15 +174,30 @@ def missing_db(request):
             import_ready = defaultdict(lambda: 0)
             orphaned = defaultdict(lambda: 0)
 
-            # create missing VMs
+            # group the selected VMs by cluster so that each cluster is
+            # imported with a single bulk query
+            selected = defaultdict(list)
             for vm in vm_ids:
                 cluster_id, host = vm.split(':')
-                cluster = Cluster.objects.get(id=cluster_id)
-                VirtualMachine(hostname=host, cluster=cluster,
-                               owner=owner).save()
-                import_ready[cluster.pk] -= 1
+                selected[int(cluster_id)].append(host)
+
+            # create missing VMs
+            imported = Cluster.objects.filter(pk__in=selected.keys())
+            for cluster in imported:
+                try:
+                    created = import_virtual_machines(
+                        cluster, hostnames=selected[cluster.pk], owner=owner)
+                except GanetiApiError, e:
+                    msg = _('Error importing from %(cluster)s: %(error)s') \
+                        % {'cluster': cluster.hostname, 'error': e}
+                    form._errors.setdefault('__all__', form.error_class()) \
+                        .append(msg)
+                    continue
+                import_ready[cluster.pk] -= created
                 if owner is None:
-                    orphaned[cluster.pk] += 1
+                    orphaned[cluster.pk] += created
+            if owner is not None:
+                schedule_reconcile(imported)
 
             # remove created vms from the list
             vms = filter(lambda x: unicode(x[0])
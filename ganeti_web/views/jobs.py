@@ -15,16 +15,34 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
 # USA.
 
+import cPickle
+from hashlib import md5
+import time
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import PermissionDenied
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import simplejson as json
 from django.views.generic.detail import DetailView
 
-from ganeti_web.models import Job, Cluster, VirtualMachine, Node
+from ganeti_web.backend.versions import JOBS, get_version
+from ganeti_web.models import Job, JobBatch, Cluster, VirtualMachine, Node
 from ganeti_web.views.generic import NO_PRIVS, LoginRequiredMixin
 
+ACTIVE_JOBS = ("error", "running", "waiting")
+
+# Seconds between checks for new versions while waiting for updates
+UPDATES_CHECK_INTERVAL = 0.5
+
+# Seconds between polls of Ganeti for the status of running jobs, and
+# polling intervals suggested to clients when they can't wait for updates.
+# These match the intervals of JobPoller in job_status.js.
+JOB_REFRESH_INTERVAL = 3
+IDLE_INTERVAL = 60
+
 
 class JobDetailView(LoginRequiredMixin, DetailView):
 
@@ -57,6 +75,21 @@ def status(request, cluster_slug, job_id, rest=False):
         return HttpResponse(json.dumps(job.info), mimetype='application/json')
 
 
+@login_required
+def batch_status(request, id):
+    """
+    Poll the unfinished jobs of a batch and return its progress.
+    """
+    batch = get_object_or_404(JobBatch, pk=id)
+    user = request.user
+    if not (user.is_superuser or batch.user_id == user.pk):
+        raise PermissionDenied(NO_PRIVS)
+
+    batch.poll()
+    return HttpResponse(json.dumps(batch.progress()),
+                        mimetype='application/json')
+
+
 @login_required
 def clear(request, cluster_slug, job_id):
     """
@@ -93,3 +126,126 @@ def clear(request, cluster_slug, job_id):
     job.delete()
 
     return HttpResponse('1', mimetype='application/json')
+
+
+def job_status_etag(model):
+    """
+    ETag function for the job_status view of ``model``, for ``condition()``.
+
+    The tag covers the status and cache time of the active jobs of the
+    object. Running jobs are refreshed from Ganeti by the view itself, so
+    there is no tag while the object has any.
+    """
+    def etag(request, id, rest=False):
+        if rest:
+            return None
+        ct = ContentType.objects.get_for_model(model)
+        jobs = list(Job.objects.filter(status__in=ACTIVE_JOBS,
+                                       content_type=ct, object_id=id)
+                    .order_by('job_id')
+                    .values_list('pk', 'status', 'ignore_cache', 'cached'))
+        if any(ignore_cache for pk, status, ignore_cache, cached in jobs):
+            return None
+        return md5(repr(jobs)).hexdigest()
+    return etag
+
+
+def job_updates_etag(model):
+    """
+    ETag function for the job_updates view of ``model``, for
+    ``condition()``.
+
+    Only requests answered right away, i.e. without ``JOB_UPDATES_TIMEOUT``,
+    are tagged; they get the tag of the job_status view.
+    """
+    job_status = job_status_etag(model)
+
+    def etag(request, id):
+        if settings.JOB_UPDATES_TIMEOUT:
+            return None
+        return job_status(request, id)
+    return etag
+
+
+def active_jobs(model, id, refresh=True):
+    """
+    Info of the jobs of an object which are still running or failed.
+
+    @param refresh  poll Ganeti for the status of running jobs. Otherwise
+                    the cached info is used, and jobs which were never
+                    polled are left out.
+    """
+    ct = ContentType.objects.get_for_model(model)
+    jobs = Job.objects.filter(status__in=ACTIVE_JOBS, content_type=ct,
+                              object_id=id).order_by('job_id')
+    if refresh:
+        return [j.info for j in jobs]
+    return [cPickle.loads(str(info)) for info
+            in jobs.values_list('serialized_info', flat=True) if info]
+
+
+def wait_for_updates(request, model, id, watch_object=True):
+    """
+    Long poll for the jobs of an object.
+
+    The client passes the ``version`` and ``digest`` of the last response it
+    got. The response is held until the object's version or its jobs change,
+    or for at most ``JOB_UPDATES_TIMEOUT`` seconds. Meanwhile running jobs
+    are polled every ``JOB_REFRESH_INTERVAL`` seconds; an object without
+    running jobs costs only a cache lookup per check.
+
+    The response is a dict with the ``jobs``, as returned by the job_status
+    views, the ``version`` and ``digest`` to pass in the next request, and
+    ``retry``, the milliseconds the client should wait before it.
+
+    Changes to the object are only watched when requests are held, i.e.
+    when ``JOB_UPDATES_TIMEOUT`` is set; otherwise the version is empty, as
+    with ``watch_object=False``.
+
+    @param watch_object  also return when the object itself changes, not only
+                         its jobs
+    """
+    timeout = settings.JOB_UPDATES_TIMEOUT
+    watch_object = watch_object and timeout
+    since_version = request.GET.get('version')
+    since_digest = request.GET.get('digest')
+    # a counter missing from the cache starts at the version the client has
+    # seen, so that it doesn't look like a change
+    if since_version and since_version.isdigit():
+        default = int(since_version)
+    else:
+        default = None
+
+    deadline = time.time() + timeout
+    jobs = jobs_version = digest = None
+    refresh_at = 0
+    while True:
+        now = time.time()
+        # without a working cache versions are always None, so the jobs
+        # must be fetched on the first pass regardless
+        if jobs is None or get_version(model, id, JOBS) != jobs_version \
+                or (jobs and now >= refresh_at):
+            refresh = jobs is None or now >= refresh_at
+            jobs = active_jobs(model, id, refresh)
+            if refresh:
+                refresh_at = now + JOB_REFRESH_INTERVAL
+            # read after polling, so that our own updates don't wake us
+            jobs_version = get_version(model, id, JOBS)
+            digest = md5(json.dumps(jobs)).hexdigest()
+
+        version = str(get_version(model, id, default=default)) \
+            if watch_object else ''
+        if version != since_version or digest != since_digest \
+                or now >= deadline:
+            break
+        time.sleep(UPDATES_CHECK_INTERVAL)
+
+    if timeout:
+        retry = 0
+    else:
+        interval = JOB_REFRESH_INTERVAL if jobs else IDLE_INTERVAL
+        retry = interval * 1000
+
+    data = {'jobs': jobs, 'version': version, 'digest': digest,
+            'retry': retry}
+    return HttpResponse(json.dumps(data), mimetype='application/json')
@@ -24,6 +24,7 @@ from django.http import HttpResponse, Http404
 from django.shortcuts import render_to_response
 from django.template import RequestContext
 from django.utils import simplejson as json
+from django.views.decorators.http import condition
 from django.views.generic.detail import DetailView
 
 from object_log.models import LogItem
@@ -36,6 +37,8 @@ from ganeti_web import constants
 from ganeti_web.forms.node import RoleForm, MigrateForm, EvacuateForm
 from ganeti_web.models import Node, Job
 from ganeti_web.views.generic import NO_PRIVS, LoginRequiredMixin
+from ganeti_web.views.jobs import (job_status_etag, job_updates_etag,
+                                   wait_for_updates)
 from ganeti_web.views.virtual_machine import BaseVMListView
 from ganeti_web.views.tables import NodeVMTable
 
@@ -284,6 +287,7 @@ def evacuate(request, cluster_slug, host):
 
 
 @login_required
+@condition(etag_func=job_status_etag(Node))
 def job_status(request, id, rest=False):
     """
     Return a list of basic info for running jobs.
@@ -298,3 +302,12 @@ def job_status(request, id, rest=False):
         return jobs
     else:
         return HttpResponse(json.dumps(jobs), mimetype='application/json')
+
+
+@login_required
+@condition(etag_func=job_updates_etag(Node))
+def job_updates(request, id):
+    """
+    Wait for changes to the running jobs or the state of this node.
+    """
+    return wait_for_updates(request, Node, id)
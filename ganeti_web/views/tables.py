@@ -1,9 +1,10 @@
 from django.utils.safestring import mark_safe
 
-from django_tables2 import (Table, Column, LinkColumn, TemplateColumn,
-                            DateTimeColumn)
+from django_tables2 import (Table, CheckBoxColumn, Column, LinkColumn,
+                            TemplateColumn, DateTimeColumn)
 from django_tables2.utils import A
 
+from ganeti_web.backend.queries import prefetch_objects
 from ganeti_web.templatetags.webmgr_tags import (render_storage, render_os,
                                                  abbreviate_fqdn,
                                                  format_job_op)
@@ -65,8 +66,12 @@ class BaseVMTable(BaseTable):
 
 
 class VMTable(BaseVMTable):
+    # selects machines for batch power operations
+    select = CheckBoxColumn(accessor="pk",
+                            attrs={"td__input": {"name": "virtual_machines"}})
+
     class Meta:
-        sequence = ("status", "hostname", "cluster", "...")
+        sequence = ("select", "status", "hostname", "cluster", "...")
         order_by = ("hostname")
         empty_text = "No Virtual Machines"
 
@@ -190,6 +195,12 @@ class JobTable(BaseTable):
     def render_operation(self, value):
         return format_job_op(value)
 
+    def paginate(self, *args, **kwargs):
+        super(JobTable, self).paginate(*args, **kwargs)
+        # resolve the objects of the page's jobs together
+        rows = self.page.object_list
+        rows.data = prefetch_objects(rows.data)
+
 
 class ClusterJobTable(JobTable):
 
@@ -31,7 +31,8 @@ from django.shortcuts import get_object_or_404, render_to_response
 from django.template import RequestContext
 from django.utils import simplejson as json
 from django.utils.translation import ugettext as _
-from django.views.decorators.http import require_http_methods, require_POST
+from django.views.decorators.http import (condition, require_http_methods,
+                                          require_POST)
 from django.views.generic.edit import DeleteView
 
 from django_tables2 import SingleTableView
@@ -46,7 +47,10 @@ from object_permissions.signals import (view_add_user, view_edit_user,
 from object_permissions.views.permissions import view_users, view_permissions
 
 
-from ganeti_web.backend.queries import vm_qs_for_users
+from ganeti_web.backend import quotas
+from ganeti_web.backend.batches import power_vms
+from ganeti_web.backend.queries import vm_qs_for_power, vm_qs_for_users
+from ganeti_web.backend.tags import schedule_reconcile
 from ganeti_web.caps import has_shutdown_timeout, has_balloonmem
 from ganeti_web.forms.virtual_machine import (KvmModifyVirtualMachineForm,
                                               PvmModifyVirtualMachineForm,
@@ -54,15 +58,18 @@ from ganeti_web.forms.virtual_machine import (KvmModifyVirtualMachineForm,
                                               ModifyConfirmForm, MigrateForm,
                                               RenameForm, ChangeOwnerForm,
                                               ReplaceDisksForm)
-from ganeti_web.models import Cluster, Job, SSHKey, VirtualMachine
+from ganeti_web.models import (Cluster, Job, QuotaUsage, SSHKey,
+                               VirtualMachine, no_refresh)
 from ganeti_web.templatetags.webmgr_tags import render_storage
 from ganeti_web.util.client import GanetiApiError
 from ganeti_web.utilities import (cluster_os_list, compare, os_prettify,
                                   get_hypervisor)
 from ganeti_web.views.generic import (NO_PRIVS, LoginRequiredMixin,
-                                      PaginationMixin, GWMBaseView)
+                                      KeysetPaginationMixin, GWMBaseView)
+from ganeti_web.views.jobs import (job_status_etag, job_updates_etag,
+                                   wait_for_updates)
 
-from ganeti_web.views.tables import BaseVMTable
+from ganeti_web.views.tables import BaseVMTable, VMTable
 
 
 #XXX No more need for tastypie dependency for 0.8
@@ -89,7 +96,7 @@ def get_vm_and_cluster_or_404(cluster_slug, instance):
     raise Http404('Virtual Machine does not exist')
 
 
-class BaseVMListView(LoginRequiredMixin, PaginationMixin, GWMBaseView,
+class BaseVMListView(LoginRequiredMixin, KeysetPaginationMixin, GWMBaseView,
                      SingleTableView):
     """
     A view for listing VirtualMachines. It does so using a custom table object
@@ -98,6 +105,7 @@ class BaseVMListView(LoginRequiredMixin, PaginationMixin, GWMBaseView,
     model = VirtualMachine
     table_class = BaseVMTable
     template_name = "ganeti/virtual_machine/list.html"
+    keyset = ("hostname", "id")
 
     def get_template_names(self):
         if self.request.is_ajax():
@@ -108,6 +116,8 @@ class BaseVMListView(LoginRequiredMixin, PaginationMixin, GWMBaseView,
 
 
 class VMListView(BaseVMListView):
+    table_class = VMTable
+
     def get_queryset(self):
         # queryset takes precedence over model
         self.queryset = vm_qs_for_users(self.request.user)
@@ -121,6 +131,7 @@ class VMListView(BaseVMListView):
         # pass in the Cluster Class to check all clusters
         can_create = self.can_create(Cluster)
         context["table"].can_create = context["create_vm"] = can_create
+        context["batch_actions"] = True
         return context
 
 
@@ -288,6 +299,35 @@ def vnc_proxy(request, cluster_slug, instance):
     return HttpResponse(result, mimetype="application/json")
 
 
+@require_POST
+@login_required
+def batch_power(request, op):
+    """
+    Start up, shut down or reboot the selected virtual machines as one batch.
+    Selected machines which the user may not power are left out.
+    """
+    user = request.user
+    ids = set(int(pk) for pk in request.POST.getlist('virtual_machines')
+              if pk.isdigit())
+    if not ids:
+        return HttpResponseBadRequest(_('No virtual machines selected'))
+
+    with no_refresh():
+        vms = list(vm_qs_for_power(user).filter(pk__in=ids)
+                   .select_related('cluster', 'owner'))
+    if not vms:
+        raise PermissionDenied(NO_PRIVS)
+
+    batch, errors = power_vms(user, op, vms)
+    data = {
+        'batch': batch.pk,
+        'status_url': reverse('job-batch-status', args=[batch.pk]),
+        'progress': batch.progress(),
+        'errors': dict((vm.hostname, msg) for vm, msg in errors.items()),
+    }
+    return HttpResponse(json.dumps(data), mimetype='application/json')
+
+
 @require_POST
 @login_required
 def shutdown(request, cluster_slug, instance):
@@ -357,7 +397,7 @@ def startup(request, cluster_slug, instance, rest=False):
         # check quota
         quota = vm.cluster.get_quota(vm.owner)
         if any(quota.values()):
-            used = vm.owner.used_resources(vm.cluster, only_running=True)
+            used = quotas.used_resources(vm.owner, vm.cluster)
 
             if quota['ram'] is not None \
                     and (used['ram'] + vm.ram) > quota['ram']:
@@ -382,6 +422,9 @@ def startup(request, cluster_slug, instance, rest=False):
 
     try:
         job = vm.startup()
+        if not vm.is_running:
+            quotas.reserve([quotas.reservation(
+                vm, ram=vm.ram, virtual_cpus=vm.virtual_cpus)])
         job.refresh()
         msg = job.info
 
@@ -772,6 +815,12 @@ def modify_confirm(request, cluster_slug, instance):
                                          cluster=cluster)
                 VirtualMachine.objects \
                     .filter(id=vm.id).update(last_job=job, ignore_cache=True)
+                # count added memory and CPUs until the job has finished
+                if data['start']:
+                    memory = beparams.get('maxmem', beparams.get('memory'))
+                    quotas.reserve([quotas.reservation(
+                        vm, ram=memory - vm.ram,
+                        virtual_cpus=beparams['vcpus'] - vm.virtual_cpus)])
                 # log information about modifying this instance
                 log_action('EDIT', user, vm)
                 if 'reboot' in request.POST and vm.info['status'] == 'running':
@@ -984,8 +1033,12 @@ def reparent(request, cluster_slug, instance):
         form = ChangeOwnerForm(request.POST)
         if form.is_valid():
             data = form.cleaned_data
+            previous = vm.owner_id
             vm.owner = data['owner']
             vm.save(force_update=True)
+            QuotaUsage.reconcile([(previous, cluster.pk),
+                                  (vm.owner_id, cluster.pk)])
+            schedule_reconcile([cluster])
 
             # log information about creating the machine
             log_action('VM_MODIFY', user, vm)
@@ -1007,6 +1060,7 @@ def reparent(request, cluster_slug, instance):
 
 
 @login_required
+@condition(etag_func=job_status_etag(VirtualMachine))
 def job_status(request, id, rest=False):
     """
     Return a list of basic info for running jobs.
@@ -1023,6 +1077,15 @@ def job_status(request, id, rest=False):
         return HttpResponse(json.dumps(jobs), mimetype='application/json')
 
 
+@login_required
+@condition(etag_func=job_updates_etag(VirtualMachine))
+def job_updates(request, id):
+    """
+    Wait for changes to the running jobs or the state of this virtual machine.
+    """
+    return wait_for_updates(request, VirtualMachine, id)
+
+
 def recv_user_add(sender, editor, user, obj, **kwargs):
     """
     receiver for object_permissions.signals.view_add_user, Logs action
@@ -21,15 +21,18 @@ from django.core.exceptions import PermissionDenied
 from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render_to_response
 from django.template import RequestContext
+from django.utils import simplejson as json
 from django.views.decorators.http import require_http_methods
 from django.views.generic.edit import FormView
 
 from django_tables2 import SingleTableView
 
+from ganeti_web.backend.batches import provision_vms
 from ganeti_web.backend.templates import (instance_to_template,
                                           template_to_instance)
 from ganeti_web.forms.vm_template import (VirtualMachineTemplateCopyForm,
                                           VMInstanceFromTemplate,
+                                          VMInstancesFromTemplate,
                                           TemplateFromVMInstance)
 from ganeti_web.models import Cluster, VirtualMachineTemplate, VirtualMachine
 from ganeti_web.views.generic import (LoginRequiredMixin, PaginationMixin,
@@ -42,24 +45,6 @@ class TemplateListView(LoginRequiredMixin, PaginationMixin, SingleTableView):
     table_class = VMTemplateTable
     template_name = "ganeti/vm_template/list.html"
 
-    def get_queryset(self):
-        qs = super(TemplateListView, self).get_queryset()
-        templates = list(qs)
-        return self.sum_disks(templates)
-
-    def sum_disks(self, templates):
-        """
-        Helper function to sum disk templates since they're stored in the
-        database using a serialized field.
-
-        Note - This expects a list of templates, and does not return a queryset
-
-        """
-        for template in templates:
-            total_disk_size = sum([disk['size'] for disk in template.disks])
-            template.disk_space = total_disk_size
-        return templates
-
 
 class TemplateFromVMInstanceView(LoginRequiredMixin, FormView):
     """
@@ -159,6 +144,40 @@ class VMInstanceFromTemplateView(LoginRequiredMixin, FormView):
         return context
 
 
+class VMInstancesFromTemplateView(VMInstanceFromTemplateView):
+    """
+    Create several virtual machine instances from a template, as one batch.
+    """
+
+    form_class = VMInstancesFromTemplate
+    template_name = "ganeti/vm_template/to_vms.html"
+
+    def get_form_kwargs(self):
+        self._get_stuff()
+        kwargs = super(VMInstancesFromTemplateView, self).get_form_kwargs()
+        kwargs.update(template=self.template, user=self.request.user)
+        return kwargs
+
+    def form_valid(self, form):
+        """
+        Submit the new VMs, then show the progress of the batch.
+        """
+
+        batch, errors = provision_vms(self.request.user, self.template,
+                                      form.cleaned_data["names"],
+                                      form.cleaned_data["owner"])
+        batch_data = {
+            "batch": batch.pk,
+            "status_url": reverse("job-batch-status", args=[batch.pk]),
+            "progress": batch.progress(),
+            "errors": errors,
+        }
+        # the data is put in a script; keep tags in hostnames from ending it
+        batch_json = json.dumps(batch_data).replace("<", "\\u003c")
+        context = self.get_context_data(form=form, batch=batch_json)
+        return self.render_to_response(context)
+
+
 @login_required
 def detail(request, cluster_slug, template):
     user = request.user